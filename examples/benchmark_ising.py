@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+#
+# This script times the Python evaluation of the Ising models (the same calls made by every step of a fit), reporting the
+# cost of assigning the configuration energies, and of a full simulation of a set of titrations.
+#
+# To compare against another revision of itcsimlib, run the script with that checkout first on the Python path, e.g.:
+#
+#  PYTHONPATH=/path/to/other/itcsimlib python benchmark_ising.py
+#
+
+import timeit
+
+from itcsimlib import ITCSim
+from itcsimlib.model_ising import FullAdditive,HalfAdditive,NonAdditive
+from itcsimlib.model_drakon import DRAKONIsingModel
+
+N_EXPERIMENTS = 4
+REPEATS = 5
+
+class DRAKONNonAdditive(DRAKONIsingModel):
+	def setup(self):
+		self.initialize(nsites=9,circular=True)
+		for name in ("X","Y","Z"):
+			self.add_parameter("dG%s"%(name),type="dG")
+			self.add_parameter("dH%s"%(name),type="dH")
+			self.add_parameter("dCp%s"%(name),type="dCp")
+		self.trace = False # run the flow on every evaluation
+
+	def site(self, i, j):
+		if self.occupied(i,j):
+			neighbors = int(self.occupied(i,j-1) == True) +int(self.occupied(i,j+1) == True)
+			term = ("X","Y","Z")[neighbors]
+			self.add_dG(i, "dG%s"%(term), dH="dH%s"%(term), dCp="dCp%s"%(term) )
+			self.add_dH(i, "dH%s"%(term), dCp="dCp%s"%(term) )
+
+def python_model(cls, **kwargs):
+	# evaluate in Python even if the compiled Ising kernel has been built (earlier revisions have no such option)
+	try:
+		return cls(native=False, **kwargs)
+	except TypeError:
+		return cls(**kwargs)
+
+sim = ITCSim(T0=298.15, units='kcal', threads=1)
+for i in range(N_EXPERIMENTS):
+	sim.add_experiment_synthetic(
+		T=288.15 +(20.0*i/N_EXPERIMENTS),
+		V0=1416.6,
+		injections=[5.0]*30,
+		Cell={"Lattice":1E-6},
+		Syringe={"Ligand":30E-6},
+		title="Titration_%i"%(i))
+
+models = (
+	(python_model(FullAdditive,nsites=9),	dict(dG0=-10,dGa=1,dGb=-1,dH0=-12,dHa=2,dHb=-2,dCp0=-1,dCpa=0.5,dCpb=-0.5)),
+	(python_model(HalfAdditive,nsites=9),	dict(dG0=-10,dGb=-1,dH0=-12,dHb=-2,dCp0=-1,dCpb=-0.5)),
+	(python_model(NonAdditive,nsites=9),	dict(dGX=-9,dGY=-10,dGZ=-11,dHX=-10,dHY=-12,dHZ=-14,dCpX=-1,dCpY=-2,dCpZ=-3)),
+	(DRAKONNonAdditive(),					dict(dGX=-9,dGY=-10,dGZ=-11,dHX=-10,dHY=-12,dHZ=-14,dCpX=-1,dCpY=-2,dCpZ=-3)),
+)
+
+print("%i-site lattices, %i experiments of %i injections, best of %i repeats"%(models[0][0].nsites,N_EXPERIMENTS,sim.experiments[0].npoints,REPEATS))
+for model,params in models:
+	sim.set_model(model)
+	sim.set_model_params(**params)
+	sim.run() # the first run populates the synthetic experiments
+
+	energies = min(timeit.repeat(lambda: model.set_energies(sim.T0,sim.experiments[0].T), number=1, repeat=REPEATS))
+	run = min(timeit.repeat(lambda: sim.run(writeback=False), number=1, repeat=REPEATS))
+	print("%-17s set_energies() %8.3f ms, run() %8.3f ms"%(model.__class__.__name__,1E3*energies,1E3*run))
+
+sim.done()
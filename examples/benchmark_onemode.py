@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+#
+# This script times the OneMode model for a screen of many experiments, reporting the cost per experiment when:
+#  1) each injection is evaluated one at a time (the original implementation)
+#  2) each experiment is evaluated with OneMode.Q()
+#  3) all experiments are stacked and evaluated at once with OneMode.Q_stack()
+#
+
+import math
+import timeit
+
+from itcsimlib import ITCSim
+from itcsimlib.model_independent import OneMode
+from itcsimlib.thermo	import *
+
+N_EXPERIMENTS = 500
+REPEATS = 5
+
+def loop_Q(self,T0,T,concentrations):
+	"""The single-site quadratic, evaluated one injection at a time"""
+	n1,Ka,dH = (
+		self.params['n'],
+		1.0/Kd_from_dG( dG_vant_Hoff( self.params['dG'], self.params['dH'], self.params['dCp'], T, T0 ), T),
+		dH_vant_Hoff( self.params['dH'], self.params['dCp'], T, T0 )
+	)
+	Q = [0.0]*len(concentrations)
+	for i,c in enumerate(concentrations):
+		Q[i] = ((n1*dH)/2.0)*(1.0 +(c['Ligand']/(n1*c['Macromolecule'])) +(1.0/(n1*Ka*c['Macromolecule'])) -math.sqrt( math.pow(1 +(c['Ligand']/(n1*c['Macromolecule'])) +(1.0/(n1*Ka*c['Macromolecule'])), 2.0) -((4.0*c['Ligand'])/(n1*c['Macromolecule']))))
+	return Q
+
+sim = ITCSim(T0=298.15, units='kcal', threads=1)
+for i in range(N_EXPERIMENTS):
+	sim.add_experiment_synthetic(
+		T=288.15 +(20.0*i/N_EXPERIMENTS),
+		V0=1416.6,
+		injections=[5.0]*50,
+		Cell={"Macromolecule":1E-6 *(1.0 +(i%10))},
+		Syringe={"Ligand":30E-6 *(1.0 +(i%10))},
+		title="Screen_%i"%(i))
+
+model = OneMode()
+sim.set_model(model)
+sim.set_model_params(n=1.805, dG=-10.94, dH=-11.75, dCp=-0.3)
+
+temperatures = [E.T for E in sim.experiments]
+concentrations = [E.Concentrations for E in sim.experiments]
+
+timings = (
+	("Per-injection loop",	lambda: [loop_Q(model,sim.T0,E.T,E.Concentrations) for E in sim.experiments]),
+	("OneMode.Q",			lambda: [model.Q(sim.T0,E.T,E.Concentrations) for E in sim.experiments]),
+	("OneMode.Q_stack",		lambda: model.Q_stack(sim.T0,temperatures,concentrations)),
+)
+
+print("%i experiments of %i injections, best of %i repeats"%(N_EXPERIMENTS,sim.experiments[0].npoints,REPEATS))
+for name,func in timings:
+	elapsed = min(timeit.repeat(func, number=1, repeat=REPEATS))
+	print("%-20s %10.2f us/experiment"%(name,1E6*elapsed/N_EXPERIMENTS))
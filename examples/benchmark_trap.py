@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+#
+# This script times the compiled TRAP models (SK, IK, IKi and SKa) over a set of titrations, reporting the cost per experiment.
+#
+# To compare against another build of the shared libraries (for example, one compiled from an earlier revision), pass the
+# directory containing those libraries as the first argument, e.g.:
+#
+#  python benchmark_trap.py /path/to/old/libraries
+#
+
+import os
+import sys
+import timeit
+
+from itcsimlib import ITCSim
+from itcsimlib.model_trap import SK,IK,IKi,SKa
+
+N_EXPERIMENTS = 20
+REPEATS = 5
+
+sim = ITCSim(T0=298.15, units='kcal', threads=1)
+for i in range(N_EXPERIMENTS):
+	sim.add_experiment_synthetic(
+		T=288.15 +(20.0*i/N_EXPERIMENTS),
+		V0=1416.6,
+		injections=[5.0]*50,
+		Cell={"TRAP":1E-6 *(1.0 +(i%5))},
+		Syringe={"Trp":40E-6 *(1.0 +(i%5))},
+		title="Titration_%i"%(i))
+
+models = (
+	(SK,	dict(dG0=-10,dGa=1,dGb=-1,dH0=-12,dHa=2,dHb=-2,dCp0=-1,dCpa=0.5,dCpb=-0.5)),
+	(IK,	dict(dGX=-8,dGY=-9,dGZ=-10,dHX=-8,dHY=-10,dHZ=-12,dCpX=0,dCpY=-1,dCpZ=-2)),
+	(IKi,	dict(dG0=-8,dGoe=-1,dGoo=-2,dH0=-8,dHoe=-2,dHoo=-4,dCp0=0,dCpoe=-1,dCpoo=-2)),
+	(SKa,	dict(dG0=-9,dGb=-0.8,dH0=-10,dHb=-1.5,dCp0=-0.2,dCpb=-0.1)),
+)
+
+def time_model(model):
+	sim.set_model(model)
+	model.start()
+	elapsed = min(timeit.repeat(lambda: [model.Q(sim.T0,E.T,E.Concentrations) for E in sim.experiments], number=1, repeat=REPEATS))
+	model.stop()
+	return 1E3*elapsed/N_EXPERIMENTS
+
+print("%i experiments of %i injections, best of %i repeats"%(N_EXPERIMENTS,sim.experiments[0].npoints,REPEATS))
+for cls,params in models:
+	model = cls()
+	sim.set_model(model)
+	sim.set_model_params(**params)
+	current = time_model(model)
+
+	if len(sys.argv) > 1:
+		# the same parameters, evaluated with the library of the same name in the given directory
+		model._path,model._lib = os.path.join(os.path.abspath(sys.argv[1]),os.path.basename(model._path)),None
+		other = time_model(model)
+		print("%-5s %10.3f ms/experiment (%10.3f ms/experiment with %s, %.1fx)"%(cls.__name__,current,other,sys.argv[1],other/current))
+	else:
+		print("%-5s %10.3f ms/experiment"%(cls.__name__,current))
@@ -18,9 +18,9 @@ class ITCCalc(multiprocessing.Process):
 	model : ITCModel
 		The model used to generate per-injection enthalpies.
 	iQ : Queue
-		The queue to read incoming model parameters and ITCExperiments from.
+		The queue to read incoming (tag, parameter vectors, ITCExperiment) jobs from.
 	oQ : Queue
-		The queue to submit calculated enthalpies (or errors) to.
+		The queue to submit (tag, experiment title, calculated enthalpies) results (or errors) to.
 	"""
 	
 	def __init__(self,T0,model,in_queue,out_queue):
@@ -62,19 +62,17 @@ class ITCCalc(multiprocessing.Process):
 			self.model.start()
 		except Exception as exc:
 			_type, _value, _traceback = sys.exc_info()
-			self.oQ.put( (None,traceback.format_exc()) )
-
-		# pull parameter,experiment tuple from the input queue, without blocking on an empty queue
-		for params,E in iter(self.iQ.get, None):
-			self.model.set_params(**params)
+			self.oQ.put( (None,None,traceback.format_exc()) )
 
+		# pull tag,parameter vectors,experiment tuple from the input queue, without blocking on an empty queue
+		for tag,param_sets,E in iter(self.iQ.get, None):
 			try: # in the case of an exception, set the title field to warn the calling thread and stuff the whole exception in the queue
-				Q = self.model.Q( self.T0, E.T, E.Concentrations )
+				Q = self.model.Q_batch( self.T0, E.T, E.Concentrations, param_sets )
 			except Exception as exc:
 				_type, _value, _traceback = sys.exc_info()
-				self.oQ.put( (None,traceback.format_exc()) )
+				self.oQ.put( (tag,None,traceback.format_exc()) )
 			else:
-				self.oQ.put( (E.title,Q) )
+				self.oQ.put( (tag,E.title,Q) )
 
 		# done with the model now
 		self.model.stop()
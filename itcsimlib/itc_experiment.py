@@ -13,6 +13,28 @@ from .thermo	import _UNITS
 from .utilities	import savitzky_golay
 
 
+class ConcentrationList(list):
+	"""The concentrations of the components (a dict for each titration point) of an experiment.
+
+	Attributes
+	----------
+	key : string
+		A unique identifier of the concentrations, which is shared by copies (e.g. as unpickled by simulator workers), and replaced when they are changed. Models use it to keep data derived from the concentrations between calls.
+
+	Notes
+	-----
+		If the concentrations are modified in place, update_key() must be called afterwards.
+	"""
+
+	def __init__(self, *args):
+		list.__init__(self, *args)
+		self.update_key()
+
+	def update_key(self):
+		"""Assign a new identifier to the concentrations, after they are changed."""
+		self.key = uuid.uuid4().hex
+
+
 class ITCExperimentBase:
 	"""Provides the essential required elements of an ITC experiment.
 
@@ -22,7 +44,7 @@ class ITCExperimentBase:
 		If a fit has been generated, the reduced chi-squared goodness-of-fit value.
 	T : float
 		The experimental temperature (in Kelvin).
-	Concentrations : list of dicts
+	Concentrations : ConcentrationList
 		The concentrations of the components (in the cell) at each titration point
 			
 	Notes
@@ -93,7 +115,7 @@ class ITCExperimentBase:
 			self.syringeRef	= syringeRef
 
 		# initialize the list of dicts used to track the concentrations of the components (in the cell) at each titration point
-		self.Concentrations = []
+		self.Concentrations = ConcentrationList()
 		for i in range(self.npoints):
 			self.Concentrations.append({})
 			for s in Cell:
@@ -116,19 +138,7 @@ class ITCExperimentBase:
 				self.Concentrations[i][s] += self.Cell[s] * ( (1-(dV/(2.0*self.V0))) / (1.0+(dV/(2.0*self.V0))) )
 
 		
-		self.dQ_dil = [0.0]*self.npoints
-		for i in range(self.npoints):
-			
-			if self._USE_OLD_DILUTION_Q: # old heat of dilution calculation, based on syringe content
-				if i==0:
-					self.dQ_dil[i] = (self.V0/1E6)*(self.Concentrations[i][self.syringeRef])*self.Q_dil
-				else:
-					self.dQ_dil[i] = (self.V0/1E6)*(self.Concentrations[i][self.syringeRef]-self.Concentrations[i-1][self.syringeRef])*self.Q_dil
-			else: # heat of dilution will be proportional to the difference in concentration between syringe solution and cell solutions
-				if i == 0:
-					self.dQ_dil[i] = (1.0 -self.dDQ_conc[i]) * self.Q_dil
-				else:
-					self.dQ_dil[i] = (1.0 -self.dDQ_conc[i] -self.dDQ_conc[i-1]) * self.Q_dil
+		self.set_Q_dil(Q_dil)
 
 		assert len(dQ) == self.npoints
 
@@ -209,6 +219,7 @@ class ITCExperimentBase:
 		for i in range(self.npoints):
 			self.Concentrations[i][new_name] = self.Concentrations[i][old_name]
 			del self.Concentrations[i][old_name]
+		self.Concentrations.update_key()
 		
 		if old_name in self.Cell:
 			self.Cell[new_name] = self.Cell[old_name]
@@ -381,6 +392,33 @@ class ITCExperimentBase:
 
 		h.close()
 		
+	def set_Q_dil(self, Q_dil):
+		"""Set the heat of dilution for the syringe solution, and update the dilution heat added to each titration point.
+
+		Arguments
+		---------
+		Q_dil : float
+			Heat of dilution for syringe solution.
+
+		Returns
+		-------
+		None
+		"""
+		self.Q_dil = Q_dil
+		self.dQ_dil = [0.0]*self.npoints
+		for i in range(self.npoints):
+			
+			if self._USE_OLD_DILUTION_Q: # old heat of dilution calculation, based on syringe content
+				if i==0:
+					self.dQ_dil[i] = (self.V0/1E6)*(self.Concentrations[i][self.syringeRef])*self.Q_dil
+				else:
+					self.dQ_dil[i] = (self.V0/1E6)*(self.Concentrations[i][self.syringeRef]-self.Concentrations[i-1][self.syringeRef])*self.Q_dil
+			else: # heat of dilution will be proportional to the difference in concentration between syringe solution and cell solutions
+				if i == 0:
+					self.dQ_dil[i] = (1.0 -self.dDQ_conc[i]) * self.Q_dil
+				else:
+					self.dQ_dil[i] = (1.0 -self.dDQ_conc[i] -self.dDQ_conc[i-1]) * self.Q_dil
+
 	def get_chisq(self, Q, writeback=False):
 		"""Calculate the goodness-of-fit between the provided data and the experimental data.
 
@@ -397,20 +435,7 @@ class ITCExperimentBase:
 			The goodness of the fit, as a reduced chi-square or as a sum-of-squares if a experimental error in dQ was not provided.
 		"""
 		
-		dV = 0.0
-		for i in range(self.npoints):
-			dV += self.injections[i]
-			Q[i] *= self.V0 * self.Concentrations[i][self.cellRef] # normalize total heat content to macromolecule concentration in the cell volume
-
-		# obtain the change in cell heat between each titration point
-		dQ = [0.0]*self.npoints
-		for i in range(self.npoints):
-			if i==0:
-				dQ[i] = Q[i] + ( (self.injections[i]/self.V0)*(Q[i]/2.0) )
-			else:
-				dQ[i] = Q[i] + ( (self.injections[i]/self.V0)*((Q[i]+Q[i-1])/2.0) ) - Q[i-1]
-			
-			dQ[i] += self.dQ_dil[i] # add heat of dilution
+		dQ = self._get_dQ(Q)
 
 		if self.dQ_err is None:
 			dQ_err = [1.0]*self.npoints
@@ -427,6 +452,48 @@ class ITCExperimentBase:
 
 		return chisq
 		
+	def get_residuals(self, Q):
+		"""Calculate the error-weighted residuals between the provided data and the experimental data.
+
+		Arguments
+		---------
+		Q : list of floats
+			The predicted total heat at each injection point.
+
+		Returns
+		-------
+		ndarray
+			The difference between the experimental and predicted heats divided by the experimental error, for each injection that isn't skipped.
+		"""
+
+		dQ = self._get_dQ(list(Q))
+
+		if self.dQ_err is None:
+			dQ_err = [1.0]*self.npoints
+		else:
+			dQ_err = self.dQ_err
+
+		return numpy.array([(self.dQ_exp[i] - dQ[i]) / dQ_err[i] for i in range(self.npoints) if i not in self.skip])
+
+	def _get_dQ(self, Q):
+		# returns the change in cell heat between each titration point, note that Q is normalized in place
+		dV = 0.0
+		for i in range(self.npoints):
+			dV += self.injections[i]
+			Q[i] *= self.V0 * self.Concentrations[i][self.cellRef] # normalize total heat content to macromolecule concentration in the cell volume
+
+		# obtain the change in cell heat between each titration point
+		dQ = [0.0]*self.npoints
+		for i in range(self.npoints):
+			if i==0:
+				dQ[i] = Q[i] + ( (self.injections[i]/self.V0)*(Q[i]/2.0) )
+			else:
+				dQ[i] = Q[i] + ( (self.injections[i]/self.V0)*((Q[i]+Q[i-1])/2.0) ) - Q[i-1]
+			
+			dQ[i] += self.dQ_dil[i] # add heat of dilution
+
+		return dQ
+		
 class ITCExperiment(ITCExperimentBase):
 	"""Provides splining for empirical ITC data.
 	
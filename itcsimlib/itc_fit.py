@@ -3,9 +3,13 @@
 
 """
 
+import queue
 import random
+import threading
 import numpy
 import scipy.optimize
+import scipy.special
+import scipy.stats.qmc
 
 from collections import OrderedDict
 
@@ -24,9 +28,19 @@ class ITCFit:
 		A parameter-name keyed dict of low and high bounds to enforce during fitting (retrieved from the model itself, or explicitly provided by the user).
 	chisq : float
 		The most recently evaluated goodness-of-fit chisquare.
+	evaluations : integer
+		The number of objective function evaluations performed by the most recent optimization.
+	telemetry : list of tuples
+		For population-based methods, the (generation, evaluations, best chisquare, convergence) progress of the most recent optimization.
+	diagnostics : OrderedDict
+		Convergence diagnostics of the most recent posterior sampling (see estimate_mcmc).
+	covariance : ndarray
+		The parameter covariance matrix from the most recent estimate_covariance.
+	correlation : ndarray
+		The parameter correlation matrix from the most recent estimate_covariance.
 	"""
 
-	def __init__(self, sim, method='simplex', method_args={}, verbose=False):
+	def __init__(self, sim, method='simplex', method_args={}, transform=False, verbose=False):
 		"""Constructor function for the ITCFit object.
 
 		Arguments
@@ -36,9 +50,11 @@ class ITCFit:
 		bounds : dict of tuples
 			A parameter-name keyed dict of low and high bounds to enforce during fitting.
 		method : string
-			The optimization algorithm to use.
+			The optimization algorithm to use ("simplex", "powell", "tnc", "bfgs", or "differential_evolution").
 		method_args : dict
-			Arguments to pass to the optimization algorithm (method specific).
+			Arguments to pass to the optimization algorithm (method specific), e.g. "popsize" and "maxiter" to set the population and generation budgets for differential evolution.
+		transform : boolean
+			Present the parameters to local optimization algorithms in a rescaled space where the bounds are enforced by smooth transforms (see ParameterTransform), instead of penalizing boundary violations?
 		verbose : boolean
 			Print additional information to the console?
 		"""
@@ -47,8 +63,14 @@ class ITCFit:
 		self.model	= self.sim.model
 		self.method	= method
 		self.method_args = method_args
+		self.transform = transform
 		self.verbose = verbose
 		self.chisq = 0.0
+		self.evaluations = 0
+		self.telemetry = []
+		self.diagnostics = OrderedDict()
+		self.covariance = None
+		self.correlation = None
 
 		# obtain model-defined boundaries to enforce during fitting
 		self.bounds = dict( (name,self.model.get_param_bounds(name)) for name in self.model.get_param_names() )
@@ -132,21 +154,44 @@ class ITCFit:
 		
 		# initial param guesses as list
 		x0 = [start_params[p] for p in params]
+
+		# map the parameters to the optimizer's space and back
+		if self.transform and self.method != 'differential_evolution':
+			transform = ParameterTransform( x0, [self.bounds[p] if use_bounds else (None,None) for p in params], [self.model.get_param_type(p) for p in params] )
+			x0 = transform.to_internal(x0)
+			if callback != None:
+				_callback = callback
+				callback = lambda x: _callback(transform.to_external(x))
+		else:
+			transform = None
 		
+		self.evaluations = 0
+		indices = self.model.params.indices(params)
+
 		# the target objective function to minimize
 		def _target(x,sim):
-			for i,p in enumerate(params):
-				sim.set_model_param(p, x[i])
+			self.evaluations += 1
+			if transform != None:
+				x = transform.to_external(x)
 
-			if use_bounds:
+			sim.model.set_vector(x, indices)
+
+			if use_bounds and transform == None:
 				m = self._apply_bounds()
 				if m > 0:
 					return sim.run(writeback=False)**(1.0+m)
 
 			return sim.run(writeback=False)
+
+		# the batched objective function used by population-based methods, x is an array of shape (len(params), population size)
+		def _target_batch(x,sim):
+			self.evaluations += x.shape[1]
+			return sim.run_batch( self._get_vectors(params,x.T) )
 	
 		# optimize parameters
-		opt = self._fitter( _target, x0, callback )
+		opt = self._fitter( _target, x0, callback, func_batch=_target_batch, bounds=[self.bounds[p] for p in params] )
+		if transform != None:
+			opt = (transform.to_external(opt[0]),)+tuple(opt[1:])
 
 		ret = OrderedDict( (p,opt[0][i]) for i,p in enumerate(params) )
 		self.sim.set_model_params(**ret)
@@ -159,6 +204,148 @@ class ITCFit:
 		# return the optimized parameters and the chisquare value
 		return ret,opt[1]
 		
+	def multistart(self, params, n_starts=10, bounds=None, sampling='latin', tolerance=0.01, seed=None ):
+		"""Optimize the specified parameters from a set of starting points spread across the parameter boundaries.
+
+		Arguments
+		---------
+		params : list of strings
+			The names of the model parameters to optimize.
+		n_starts : int
+			The number of starting points to optimize from.
+		bounds : dict of tuples
+			A parameter-name keyed dict of low and high bounds to draw the starting points from. If None, the fitter's bounds are used.
+		sampling : string
+			The method used to draw the starting points ("latin" for a Latin hypercube, or "sobol").
+		tolerance : float
+			The distance (as a fraction of each parameter's boundary width) within which two points are considered to lie in the same minimum.
+		seed : int
+			A seed for the random number generator used to draw starting points.
+
+		Returns
+		-------
+		list of tuples
+			A list of (parameter-name keyed dict of optimized values, goodness-of-fit, number of starts) tuples for each unique minimum, ranked by goodness-of-fit.
+
+		Notes
+		-----
+			The local optimizations (using the fitter's method) are run concurrently, and at each step their pending evaluations are submitted to the simulator as a single batch.
+			A start is abandoned as soon as one of its evaluations comes within the tolerance of an already-converged minimum.
+		"""
+
+		assert sampling in ('latin','sobol')
+		assert self.method != 'differential_evolution'
+
+		if bounds == None:
+			bounds = self.bounds
+		low = numpy.array([bounds[p][0] for p in params],dtype=float)
+		high = numpy.array([bounds[p][1] for p in params],dtype=float)
+		if numpy.any(numpy.isnan(low)) or numpy.any(numpy.isnan(high)):
+			raise Exception('Multistart optimization requires both low and high bounds for all optimized parameters')
+		width = high -low
+
+		if sampling == 'sobol':
+			sampler = scipy.stats.qmc.Sobol(len(params),seed=seed)
+		else:
+			sampler = scipy.stats.qmc.LatinHypercube(len(params),seed=seed)
+		starts = scipy.stats.qmc.scale(sampler.random(n_starts),low,high)
+
+		if self.verbose:
+			print("\nitc_fit: Optimizing %s parameters from %i starting points using the %s algorithm\n"%(",".join(params),n_starts,self.method))
+
+		class _Cancelled(Exception):
+			pass
+
+		requests,replies = queue.Queue(),[queue.Queue() for i in range(n_starts)]
+
+		def _optimizer(k):
+			if self.transform:
+				transform = ParameterTransform( starts[k], list(zip(low,high)), [self.model.get_param_type(p) for p in params] )
+			else:
+				transform = None
+
+			def _target(x,sim): # hand the evaluation to the coordinating thread and wait for the result
+				if transform != None:
+					x = transform.to_external(x)
+				requests.put( (k,numpy.array(x,dtype=float)) )
+				ret = replies[k].get()
+				if ret == None:
+					raise _Cancelled()
+				return ret
+			try:
+				if transform != None:
+					opt = self._fitter( _target, transform.to_internal(starts[k]) )
+					opt = (transform.to_external(opt[0]),opt[1])
+				else:
+					opt = self._fitter( _target, starts[k] )
+			except _Cancelled:
+				requests.put( (k,'cancelled') )
+			except Exception as e:
+				requests.put( (k,e) )
+			else:
+				requests.put( (k,(numpy.array(opt[0],dtype=float),float(opt[1]))) )
+
+		threads = [threading.Thread(target=_optimizer,args=(k,),daemon=True) for k in range(n_starts)]
+		for thread in threads:
+			thread.start()
+
+		minima = [] # [x, chisq, number of starts]
+		def _find_minimum(x):
+			for m in minima:
+				if numpy.all(numpy.fabs(x -m[0]) <= tolerance*width):
+					return m
+			return None
+
+		live = n_starts
+		while live > 0:
+			# every running optimizer has either requested an evaluation, or finished
+			pending = [requests.get() for i in range(live)]
+
+			evaluate = []
+			for k,message in pending:
+				if isinstance(message,numpy.ndarray):
+					m = _find_minimum(message)
+					if m != None:
+						m[2] += 1
+						replies[k].put( None )
+						if self.verbose:
+							print("itc_fit: Start %i abandoned, approaching minimum at chisq %f"%(k,m[1]))
+					else:
+						evaluate.append( (k,message) )
+					continue
+
+				live -= 1
+				if isinstance(message,tuple):
+					m = _find_minimum(message[0])
+					if m == None:
+						minima.append( [message[0],message[1],1] )
+					else:
+						m[2] += 1
+						if message[1] < m[1]:
+							m[0],m[1] = message
+					if self.verbose:
+						print("itc_fit: Start %i converged (%f)"%(k,message[1]))
+				elif isinstance(message,Exception):
+					print("itc_fit: Error, caught exception at start %i: %s"%(k,str(message)))
+
+			if len(evaluate) > 0:
+				# boundary violations are penalized as in optimize()
+				clipped = [numpy.clip(x,low,high) for k,x in evaluate]
+				penalties = [numpy.sum(numpy.fabs((c -x) / numpy.where(c==0,1.0,c))) for (k,x),c in zip(evaluate,clipped)]
+				chisqs = self.sim.run_batch( self._get_vectors(params,clipped) )
+				if chisqs is None:
+					# cancel the optimizers waiting on an evaluation, and let them exit before bailing
+					for reply in replies:
+						reply.put( None )
+					for thread in threads:
+						thread.join()
+					raise Exception('Simulator failure during multistart optimization')
+				for (k,x),chisq,m in zip(evaluate,chisqs,penalties):
+					replies[k].put( chisq**(1.0+m) )
+
+		minima.sort(key=lambda m: m[1])
+		return [ (OrderedDict(zip(params,m[0])),m[1],m[2]) for m in minima ]
+
 	def estimate(self, params, method='bootstrap', *args, **kwargs ):
 		"""Wrapper for the two methods of estimating uncertainties in the fitted parameter values
 		
@@ -167,11 +354,11 @@ class ITCFit:
 		params : list of strings
 			The names of the model parameters to find intervals for.
 		method : string
-			The method to use for interval estimation (either "sigma" or "bootstrap")
+			The method to use for interval estimation (either "sigma", "bootstrap", "mcmc", or "covariance")
 		*args
-			Positional arguments to pass to either estimate_sigma or estimate_bootstrap
+			Positional arguments to pass to either estimate_sigma, estimate_bootstrap, estimate_mcmc, or estimate_covariance
 		**kwargs
-			Keyword arguments to pass to either estimate_sigma or estimate_bootstrap
+			Keyword arguments to pass to either estimate_sigma, estimate_bootstrap, estimate_mcmc, or estimate_covariance
 		
 		Returns
 		-------
@@ -179,13 +366,67 @@ class ITCFit:
 			A parameter-name keyed dict of tuples consisting of the mean and standard deviation, or high and low values of the provided parameters.
 		"""
 					
-		assert method in ['sigma','bootstrap']
+		assert method in ['sigma','bootstrap','mcmc','covariance']
 	
 		if method == 'sigma':
 			return self.estimate_sigma( params, *args, **kwargs )
+		elif method == 'covariance':
+			return self.estimate_covariance( params, *args, **kwargs )
+		elif method == 'mcmc':
+			return self.estimate_mcmc( params, *args, **kwargs )
 		else:
 			return self.estimate_bootstrap( params, *args, **kwargs )
 	
+	def estimate_covariance(self, params=[], step=1E-4, scale=True ):
+		"""Estimate the uncertainties of optimized parameters from the Jacobian of the weighted residuals, without refitting
+
+		Arguments
+		---------
+		params : list of strings
+			The names of the model parameters to find intervals for.
+		step : float
+			The relative step size used to obtain the Jacobian by central differences.
+		scale : boolean
+			Scale the covariance matrix by the reduced chi-square of the fit (appropriate if the experimental errors are only relative)?
+
+		Returns
+		-------
+		(dict of tuples)
+			A parameter-name keyed dict of tuples consisting of the current value and standard error of the provided parameters.
+
+		Notes
+		-----
+			The current model parameters should be at the optimum. All of the displaced parameter sets are evaluated as a single simulator batch.
+			The covariance and correlation matrices (ordered as the params argument) are stored in the covariance and correlation attributes.
+		"""
+
+		if self.verbose:
+			print("\nitc_fit: Estimating uncertainty intervals for %s from the covariance matrix\n"%(",".join(params)))
+
+		x0 = numpy.array([self.sim.get_model_param(p) for p in params],dtype=float)
+		h = step * numpy.where(x0 == 0, 1.0, numpy.fabs(x0))
+
+		param_sets = [dict(zip(params,x0))]
+		for j in range(len(params)):
+			for sign in (1.0,-1.0):
+				x = x0.copy()
+				x[j] += sign*h[j]
+				param_sets.append( dict(zip(params,x)) )
+
+		residuals = self.sim.run_batch( param_sets, residuals=True )
+		if residuals is None:
+			raise Exception('Simulator failure during covariance estimation')
+
+		jacobian = numpy.array([ (residuals[2*j+1] - residuals[2*j+2]) / (2.0*h[j]) for j in range(len(params)) ]).T
+		self.covariance = numpy.linalg.pinv( numpy.dot(jacobian.T,jacobian) )
+		if scale:
+			self.covariance *= numpy.sum(residuals[0]**2) / (len(residuals[0]) - len(params))
+
+		stderr = numpy.sqrt(numpy.diag(self.covariance))
+		self.correlation = self.covariance / numpy.outer(stderr,stderr)
+
+		return OrderedDict( (p,(x0[j],stderr[j])) for j,p in enumerate(params) )
+
 	def estimate_sigma(self, params=[], params_opt=None, sigma=None, stdevs=1, estimate=0.1, rootfinder='bisect', tolerance=0.001 ):
 		"""Generate high and low parameter value estimates for optimized parameters according to the provided criterion
 				
@@ -364,6 +605,137 @@ class ITCFit:
 		# return the mean and standard deviation of the model parameters
 		return OrderedDict( (p,(numpy.mean(param_values[p]),numpy.std(param_values[p]))) for p in params )
 
+	def estimate_mcmc(self, params=[], walkers=None, steps=1000, burn=None, scale=2.0, spread=0.01, chainfile=None, seed=None ):
+		"""Sample the posterior distribution of the parameters using an affine-invariant ensemble sampler (Goodman and Weare, 2010)
+
+		Arguments
+		---------
+		params : list of strings
+			The names of the model parameters to sample.
+		walkers : int
+			The number of walkers in the ensemble (must be even, defaults to four times the number of parameters).
+		steps : int
+			The number of ensemble steps to take.
+		burn : int
+			The number of initial steps to discard before computing the estimates (defaults to half of the steps).
+		scale : float
+			The scale parameter of the stretch move.
+		spread : float
+			The fractional scatter of the walkers around the current parameter values at the start.
+		chainfile : string
+			A file path to stream the chain to, as a NumPy (.npy) array of shape (steps, walkers, len(params)+1). The last column is the log-probability, unsampled steps are NaN.
+		seed : int
+			A seed for the random number generator.
+
+		Returns
+		-------
+		(dict of tuples)
+			A parameter-name keyed dict of tuples consisting of the mean and standard deviation of the sampled values.
+
+		Notes
+		-----
+			The log-likelihood is taken as -chisq/2, where chisq is the (unreduced) sum of the squared error-weighted residuals of all fitted points across the experiments, and the prior is uniform within the fitter's bounds.
+			Each half of the ensemble is proposed and evaluated as a single simulator batch.
+			The acceptance fraction, and for each parameter the integrated autocorrelation time (in steps) and Gelman-Rubin statistic across walkers, are stored in the diagnostics attribute.
+		"""
+
+		ndim = len(params)
+		if walkers == None:
+			walkers = 4*ndim
+		assert walkers % 2 == 0 and walkers > ndim
+		if burn == None:
+			burn = int(steps/2)
+		assert burn < steps
+
+		if self.verbose:
+			print("\nitc_fit: Sampling %s using %i walkers over %i steps\n"%(",".join(params),walkers,steps))
+
+		rng = numpy.random.default_rng(seed)
+		low = numpy.array([-numpy.inf if self.bounds[p][0] == None else self.bounds[p][0] for p in params],dtype=float)
+		high = numpy.array([numpy.inf if self.bounds[p][1] == None else self.bounds[p][1] for p in params],dtype=float)
+
+		def _lnprob(x):
+			ret = numpy.full(len(x),-numpy.inf)
+			inside = numpy.all((x >= low) & (x <= high),axis=1)
+			if numpy.any(inside):
+				residuals = self.sim.run_batch( self._get_vectors(params,x[inside]), residuals=True )
+				if residuals is None:
+					raise Exception('Simulator failure during posterior sampling')
+				ret[inside] = -0.5 * numpy.sum(residuals**2,axis=1)
+			return ret
+
+		# initialize the walkers in a small ball around the current parameter values
+		x0 = numpy.array([self.sim.get_model_param(p) for p in params],dtype=float)
+		position = numpy.clip(x0 * (1.0 + spread*rng.standard_normal((walkers,ndim))),low,high)
+		lnprob = _lnprob(position)
+
+		if chainfile != None:
+			chain = numpy.lib.format.open_memmap(chainfile,mode='w+',dtype='d',shape=(steps,walkers,ndim+1))
+			chain[:] = numpy.nan
+			chain.flush()
+		else:
+			chain = numpy.zeros((steps,walkers,ndim+1))
+
+		half = int(walkers/2)
+		accepted = numpy.zeros(walkers)
+		for i in range(steps):
+			for active,passive in ((slice(0,half),slice(half,walkers)),(slice(half,walkers),slice(0,half))):
+				# stretch move, using walkers from the complementary half
+				z = ((scale -1.0) * rng.random(half) + 1.0)**2 / scale
+				partners = position[passive][rng.integers(half,size=half)]
+				proposal = partners + z[:,None] * (position[active] - partners)
+				lnprob_new = _lnprob(proposal)
+
+				accept = numpy.log(rng.random(half)) < ((ndim -1.0) * numpy.log(z)) + lnprob_new - lnprob[active]
+				position[active] = numpy.where(accept[:,None],proposal,position[active])
+				lnprob[active] = numpy.where(accept,lnprob_new,lnprob[active])
+				accepted[active] += accept
+
+			chain[i,:,:ndim] = position
+			chain[i,:,ndim] = lnprob
+			if chainfile != None:
+				chain.flush()
+
+			if self.verbose:
+				print("itc_fit: Step %i, acceptance %.3f, max log-probability %f"%(i,numpy.mean(accepted)/(i+1),numpy.max(lnprob)))
+
+		samples = numpy.array(chain[burn:,:,:ndim])
+		self.diagnostics = OrderedDict( (('acceptance',numpy.mean(accepted)/steps),) )
+		for j,p in enumerate(params):
+			self.diagnostics[p] = (self._autocorrelation_time(samples[:,:,j]),self._gelman_rubin(samples[:,:,j]))
+			if self.verbose:
+				print("itc_fit: %s autocorrelation time %.1f steps, R-hat %.3f"%((p,)+self.diagnostics[p]))
+
+		if chainfile != None:
+			del chain
+
+		return OrderedDict( (p,(numpy.mean(samples[:,:,j]),numpy.std(samples[:,:,j]))) for j,p in enumerate(params) )
+
+	def _autocorrelation_time(self, x, window=5.0):
+		# integrated autocorrelation time averaged over the walkers (columns), using Sokal's adaptive window
+		n = len(x)
+		f = numpy.fft.rfft(x - numpy.mean(x,axis=0), n=2*n, axis=0)
+		acf = numpy.fft.irfft(f * numpy.conjugate(f), axis=0)[:n]
+		acf = numpy.mean(acf / numpy.where(acf[0]==0,1.0,acf[0]), axis=1)
+		tau = 2.0*numpy.cumsum(acf) -1.0
+		m = numpy.arange(n) < window*tau
+		return tau[numpy.argmin(m)] if not numpy.all(m) else tau[-1]
+
+	def _gelman_rubin(self, x):
+		# potential scale reduction factor, treating each walker (column) as a chain
+		n = len(x)
+		W = numpy.mean(numpy.var(x,axis=0,ddof=1))
+		B = n * numpy.var(numpy.mean(x,axis=0),ddof=1)
+		if W == 0:
+			return numpy.nan
+		return numpy.sqrt((((n -1.0)/n)*W + B/n) / W)
+
+	def _get_vectors(self, params, x):
+		# complete model parameter vectors, with the named parameters set from each row of x
+		ret = numpy.tile( self.model.get_vector(), (len(x),1) )
+		ret[:,self.model.params.indices(params)] = x
+		return ret
+
 	def _apply_bounds(self):
 		ret = 0
 		for k,v in self.sim.get_model_params().items():
@@ -375,16 +747,18 @@ class ITCFit:
 
 			elif self.bounds[k][1] != None and v > self.bounds[k][1]:
 				self.sim.set_model_param(k, self.bounds[k][1])
-				ret += fabs((v - self.bounds[k][1]) / self.bounds[k][1])			
+				ret += numpy.fabs((v - self.bounds[k][1]) / self.bounds[k][1])			
 				if self.verbose:
 					print("itc_fit: Boundary violation for \"%s\" (%f>%f)"%(k,v,self.bounds[k][1]))
 
 		return ret
 
-	def _fitter(self, func, x0, callback=None):
+	def _fitter(self, func, x0, callback=None, func_batch=None, bounds=None):
 		# wrapper function for a variety of optimization algorithms
 		# note that some of these aren't fully integrated yet
-		if self.method == 'simplex':
+		if self.method == 'differential_evolution':
+			ret = self._differential_evolution(func_batch, x0, bounds, callback)
+		elif self.method == 'simplex':
 			ret = scipy.optimize.fmin(
 				func=func,
 				x0=x0,
@@ -422,4 +796,134 @@ class ITCFit:
 		else:
 			raise Exception('Unrecognized fitting algorithm')
 
-		return ret
\ No newline at end of file
+		return ret
+
+	def _differential_evolution(self, func, x0, bounds, callback=None):
+		# each generation is evaluated as a single batch, which the simulator distributes across its workers
+		if bounds == None or None in [b for pair in bounds for b in pair]:
+			raise Exception('Differential evolution requires both low and high bounds for all optimized parameters')
+
+		self.telemetry = []
+		progress = {'evaluations':0,'chisq':numpy.inf}
+
+		def _batch(x,sim):
+			ret = func(x,sim)
+			if ret is None:
+				raise Exception('Simulator failure during differential evolution')
+			progress['evaluations'] += len(ret)
+			progress['chisq'] = min(progress['chisq'],numpy.min(ret))
+			return ret
+
+		def _generation(x,convergence=None):
+			self.telemetry.append( (len(self.telemetry)+1,progress['evaluations'],progress['chisq'],convergence) )
+			if self.verbose:
+				print("itc_fit: Generation %i, %i evaluations, best chisq %f (convergence %f)"%self.telemetry[-1])
+			if callback != None:
+				callback(x)
+
+		method_args = {'updating':'deferred'}
+		method_args.update(self.method_args)
+
+		opt = scipy.optimize.differential_evolution(
+			func=_batch,
+			bounds=bounds,
+			args=(self.sim,),
+			x0=numpy.clip(x0,[b[0] for b in bounds],[b[1] for b in bounds]),
+			vectorized=True,
+			disp=self.verbose,
+			callback=_generation,
+			**method_args)
+
+		return opt.x,opt.fun
+
+
+class ParameterTransform:
+	"""Maps model parameter values to and from a space better suited for local optimization algorithms.
+
+	Each parameter is first mapped by a smooth function chosen from its type and boundaries: a logit if both boundaries are set, a softplus if only one is, a logarithm for stoichiometries and rate constants that are positive and otherwise unbounded, or the identity.
+	The result is then shifted and scaled so that the starting value maps to 1.0, and that a small change near the start corresponds to the same fractional change of the parameter.
+
+	Attributes
+	----------
+	kinds : list of strings
+		The mapping used for each parameter ("logit", "low", "high", "log", or "linear").
+	"""
+
+	_EDGE = 1E-6 # how close to a boundary the starting value may be
+
+	def __init__(self, x0, bounds, types):
+		"""Constructor function for the ParameterTransform object.
+
+		Arguments
+		---------
+		x0 : list of floats
+			The starting parameter values.
+		bounds : list of tuples
+			The low and high boundaries of each parameter (None for no boundary).
+		types : list of strings
+			The type of each parameter (see ITCModel).
+		"""
+
+		self.kinds,self._low,self._high,self._width = [],[],[],[]
+		for x,(low,high),type in zip(x0,bounds,types):
+			if low != None and high != None:
+				kind,width = 'logit',high-low
+			elif low != None:
+				kind,width = 'low',numpy.fabs(x-low) or 1.0
+			elif high != None:
+				kind,width = 'high',numpy.fabs(high-x) or 1.0
+			elif type in ('n','k') and x > 0:
+				kind,width = 'log',1.0
+			else:
+				kind,width = 'linear',1.0
+			self.kinds.append(kind)
+			self._low.append(low if low != None else 0.0)
+			self._high.append(high if high != None else 0.0)
+			self._width.append(width)
+
+		self._low,self._high,self._width = numpy.array(self._low,dtype=float),numpy.array(self._high,dtype=float),numpy.array(self._width,dtype=float)
+		self._masks = dict( (kind,numpy.array([k == kind for k in self.kinds])) for kind in ('logit','low','high','log','linear') )
+
+		x0 = self._clip(numpy.array(x0,dtype=float))
+		self._g0 = self._forward(x0)
+		self._scale = self._slope(x0) * numpy.where(x0 == 0, 1.0, numpy.fabs(x0))
+
+	def _clip(self, x):
+		# keep parameter values strictly inside the boundaries, where the mappings are finite
+		x = numpy.where(self._masks['logit'], numpy.clip(x, self._low+self._EDGE*self._width, self._high-self._EDGE*self._width), x)
+		x = numpy.where(self._masks['low'], numpy.maximum(x, self._low+self._EDGE*self._width), x)
+		return numpy.where(self._masks['high'], numpy.minimum(x, self._high-self._EDGE*self._width), x)
+
+	def _forward(self, x):
+		# map parameter values to the unbounded space
+		m = self._masks
+		with numpy.errstate(divide='ignore',invalid='ignore',over='ignore'):
+			p = (x-self._low)/numpy.where(m['logit'],self._high-self._low,1.0)
+			return numpy.select(
+				[m['logit'],m['low'],m['high'],m['log']],
+				[numpy.log(p/(1.0-p)), numpy.log(numpy.expm1((x-self._low)/self._width)), numpy.log(numpy.expm1((self._high-x)/self._width)), numpy.log(x)],
+				x)
+
+	def _slope(self, x):
+		# derivative of _forward()
+		m = self._masks
+		with numpy.errstate(divide='ignore',invalid='ignore',over='ignore'):
+			p = (x-self._low)/numpy.where(m['logit'],self._high-self._low,1.0)
+			return numpy.select(
+				[m['logit'],m['low'],m['high'],m['log']],
+				[1.0/((self._high-self._low)*p*(1.0-p)), 1.0/(self._width*(-numpy.expm1(-(x-self._low)/self._width))), -1.0/(self._width*(-numpy.expm1(-(self._high-x)/self._width))), 1.0/x],
+				1.0)
+
+	def to_internal(self, x):
+		"""Return the optimizer-space vector corresponding to the provided parameter values."""
+		return 1.0 + (self._forward(self._clip(numpy.array(x,dtype=float))) - self._g0) / self._scale
+
+	def to_external(self, u):
+		"""Return the parameter values corresponding to the provided optimizer-space vector."""
+		g = self._g0 + (numpy.array(u,dtype=float) - 1.0) * self._scale
+		m = self._masks
+		with numpy.errstate(over='ignore'):
+			return numpy.select(
+				[m['logit'],m['low'],m['high'],m['log']],
+				[self._low + (self._high-self._low)*scipy.special.expit(g), self._low + self._width*numpy.logaddexp(0.0,g), self._high - self._width*numpy.logaddexp(0.0,g), numpy.exp(g)],
+				g)
@@ -3,7 +3,13 @@
 
 """
 
+import os
+import pickle
+import itertools
 import numpy
+import multiprocessing
+
+from collections import OrderedDict
 
 
 class ITCGrid:
@@ -17,11 +23,23 @@ class ITCGrid:
 		The simulator (and associated model) used for fitting.
 	callback : function
 		A function to be called with the current parameter vector after optimization at each grid point.
+	processes : integer
+		The number of processes used to optimize grid points concurrently.
+	checkpoint : string
+		The path of the file completed grid points are recorded to, and resumed from.
+	traversal : string
+		The order grid points are optimized in ("index" or "serpentine").
+	resultfile : string
+		The path of the NumPy (.npy) file grid point results are written to as they are completed.
+	results : numpy structured array or memmap
+		The index, point, optimized parameters, chisq, completion status, objective evaluations, and seeding neighbour of each grid point, indexed by grid point. If a result file is used, the memory-mapped array of parameters and chisq instead (see optimize()).
+	savings : integer
+		The estimated number of objective evaluations saved by warm starts in the most recent serpentine optimization.
 	verbose : boolean
 		Whether or not to print additional information to the console.
 	"""
 
-	def __init__(self, fit, start=0, end=None, callback=None, verbose=False ):
+	def __init__(self, fit, start=0, end=None, callback=None, processes=0, checkpoint=None, traversal='index', resultfile=None, verbose=False ):
 		"""The constructor function for the ITCGrid object.
 
 		Arguments
@@ -29,11 +47,19 @@ class ITCGrid:
 		fit : ITCFit
 			The fitter used for optimization.
 		start : integer
-			The point index on the grid to start at.
+			The position in the traversal order of the grid to start at.
 		end : integer
-			The point index on the grid to end at.
+			The position in the traversal order of the grid to end at.
 		callback : function
 			A function to be called with the current parameter vector after optimization at each grid point.
+		processes : integer
+			The number of processes to optimize grid points with. Default (0) optimizes serially, None uses all available cores.
+		checkpoint : string
+			The path of a file to record completed grid points to. If the file already exists, the points it contains are not optimized again.
+		traversal : string
+			The order to optimize grid points in. "index" visits points in order of their index, "serpentine" walks the grid so that each point neighbours the previous one, and starts optimization at each point from the optimized parameters of its nearest completed neighbour.
+		resultfile : string
+			The path of a NumPy (.npy) file to write the results of optimize() to as each grid point is completed, instead of keeping them in memory. If the file already exists, the points it contains are not optimized again.
 		verbose : boolean
 			Whether or not to print additional information to the console.
 		"""
@@ -42,14 +68,29 @@ class ITCGrid:
 		self.sim	= self.fit.sim
 		self.verbose	= verbose
 		self.callback	= callback
+		self.checkpoint	= checkpoint
+		self.resultfile	= resultfile
+		self.results	= None
+		self.savings	= 0
+
+		assert traversal in ('index','serpentine')
+		self.traversal	= traversal
+
+		if processes == 1:
+			processes = 0
+		elif processes == None:
+			processes = multiprocessing.cpu_count()
+		self.processes	= processes
 
 		self._start_index	= start
 		self._end_index	= end
+		self._mapped	= False
+		self._tally	= [0,0,0,0]
 
 		self._grid_size	= 1
 		self._grid_pts	= []
 		self._grid_order	= []
-		self._grid_results	= []
+		self._grid_log	= []
 
 	def add_axis(self, param, start, stop, steps, logspace=False):
 		"""Add a parameter discretization axis to the the grid
@@ -80,6 +121,7 @@ class ITCGrid:
 			self._grid_pts.append( numpy.linspace(start,stop,steps) )
 		self._grid_size *= len(self._grid_pts[-1])
 		self._grid_order.append(param)
+		self._grid_log.append(logspace)
 
 	def define_axis(self, param, points):
 		"""Add a parameter discretization axis to the the grid using a set of points.
@@ -101,6 +143,7 @@ class ITCGrid:
 		self._grid_pts.append(points)
 		self._grid_size *= len(self._grid_pts[-1])
 		self._grid_order.append(param)
+		self._grid_log.append(False)
 
 	def get_axis_names(self):
 		"""Returns the names of the parameters the grid is being evaluated over
@@ -121,10 +164,115 @@ class ITCGrid:
 		gridpt = []
 		for i in range(len(self._grid_pts)):
 			gridpt.append( self._grid_pts[i][ int(index % len(self._grid_pts[i])) ] )
-			index /= len(self._grid_pts[i])
+			index //= len(self._grid_pts[i])
 
 		return gridpt
 
+	def _get_coords(self, index):
+		coords = []
+		for i in range(len(self._grid_pts)):
+			coords.append( int(index % len(self._grid_pts[i])) )
+			index //= len(self._grid_pts[i])
+
+		return coords
+
+	def _get_order(self):
+		return list(self._iter_order())
+
+	def _iter_order(self):
+		# grid point indices in the order they are to be visited
+		if self.traversal == 'index':
+			for k in range(self._grid_size):
+				yield k
+			return
+
+		# reflected mixed-radix (boustrophedon) ordering, where each sub-block of the grid is walked in reverse after an odd step of the axis above it
+		lengths = [len(pts) for pts in self._grid_pts]
+		strides = [int(n) for n in numpy.cumprod([1]+lengths[:-1])]
+		for k in range(self._grid_size):
+			index = 0
+			for i in reversed(range(len(lengths))):
+				d = k // strides[i]
+				k = k % strides[i]
+				if d % 2:
+					k = strides[i]-1-k
+				index += d * strides[i]
+			yield index
+
+	def _get_seed(self, index, params):
+		# the index and optimized parameters of the nearest completed grid point, if any
+		if self._mapped: # only look as far as the adjacent points, so as not to read the whole file
+			coords = self._get_coords(index)
+			strides = numpy.cumprod([1]+[len(pts) for pts in self._grid_pts[:-1]])
+			for axis in range(len(coords)):
+				for sign in (-1,1):
+					if 0 <= coords[axis]+sign < len(self._grid_pts[axis]) and self._is_done(index+sign*strides[axis]):
+						j = int(index+sign*strides[axis])
+						return (j,dict( (p,self._get_params(j)[self._names.index(p)]) for p in params if p not in self._grid_order ))
+			return None
+
+		done = numpy.flatnonzero(self.results['done'])
+		if len(done) == 0:
+			return None
+
+		distances = numpy.abs(self._coords[done] - self._coords[index]).sum(axis=1)
+		j = done[numpy.argmin(distances)]
+		return (int(j),dict( (p,self.results[j]['params'][self._names.index(p)]) for p in params if p not in self._grid_order ))
+
+	def _read_checkpoint(self, names):
+		# returns the chisq and parameters of the points completed in the checkpoint file, keyed by index
+		if not os.path.isfile(self.checkpoint):
+			with open(self.checkpoint,'w') as f:
+				f.write("# index\tchisq\t%s\n"%("\t".join(names)))
+			return {}
+
+		ret = {}
+		with open(self.checkpoint) as f:
+			header = f.readline().split()
+			if header[3:] != list(names):
+				raise Exception("Checkpoint file \"%s\" parameters (%s) do not match the model (%s)."%(self.checkpoint,",".join(header[3:]),",".join(names)))
+			for line in f:
+				fields = line.split()
+				if len(fields) != len(names)+2: # partially written line from an interruption
+					continue
+				ret[int(fields[0])] = (float(fields[1]),[float(v) for v in fields[2:]])
+		return ret
+
+	def _apply_checkpoint(self, completed, indices):
+		for i in indices:
+			if i in completed:
+				self._record(i,completed[i][1],completed[i][0])
+
+	def _write_checkpoint(self, handle, i, values, chisq):
+		handle.write("%i\t%r\t%s\n"%(i,float(chisq),"\t".join(["%r"%float(v) for v in values])))
+		handle.flush()
+
+	# accessors for results kept either in memory or in a memory-mapped file
+	def _is_done(self, i):
+		if self._mapped:
+			return not numpy.isnan(self.results[tuple(self._get_coords(i))][-1])
+		return self.results[i]['done']
+
+	def _get_params(self, i):
+		if self._mapped:
+			return self.results[tuple(self._get_coords(i))][:-1]
+		return self.results[i]['params']
+
+	def _get_result_point(self, i):
+		if self._mapped:
+			return self._get_point(i)
+		return list(self.results[i]['point'])
+
+	def _record(self, i, values, chisq, evaluations=0, seed=-1):
+		if self._mapped:
+			self.results[tuple(self._get_coords(i))] = list(values)+[chisq]
+			return
+		self.results[i]['params'] = values
+		self.results[i]['chisq'] = chisq
+		self.results[i]['done'] = True
+		self.results[i]['evaluations'] = evaluations
+		self.results[i]['seed'] = seed
+
 	def optimize(self, params=[], **kwargs ):
 		"""Optimize the model at each point on the grid defined by the parameter axes
 
@@ -137,8 +285,18 @@ class ITCGrid:
 
 		Returns
 		-------
-		(list of tuples)
-			A list of tuples, where each tuple consists of the grid point and the resulting optimized model parameters
+		numpy structured array or memmap
+			The "index", "point" (axis parameter values), "params" (all model parameters, in the order of the model), "chisq", "done" (whether optimization succeeded), "evaluations" (the number of objective evaluations), and "seed" (the index of the point optimization started from, or -1) fields of each grid point.
+			If a result file is used, a memory-mapped float64 array with one dimension per grid axis (in the order they were added) and a last dimension of all the model parameters (in the order of the model) followed by chisq. Points not yet optimized are NaN.
+
+		Notes
+		-----
+			The result file is written as each point is completed, so may be read during optimization by another process on the same machine (e.g. using numpy.load() with mmap_mode='r').
+			With a result file and serpentine traversal, points are seeded from adjacent completed points only.
+			If processes were requested, each process optimizes using its own copy of the fitter and simulator, which will not use additional worker threads.
+			Points that fail to optimize are not marked as done, and so will be attempted again when resuming from a checkpoint.
+			With serpentine traversal and processes, each process walks a contiguous stretch of the traversal, so only the first point of each stretch is seeded from points completed before optimization started.
+			The evaluations saved by warm starts are estimated from the mean evaluations of the points that were not seeded.
 		"""
 
 		assert self._grid_size > 1
@@ -149,33 +307,364 @@ class ITCGrid:
 		# archive original model params
 		start_params = self.sim.get_model_params().copy()
 
-		# initialize storage
-		self._grid_results = [[]]*self._grid_size
+		pending,count = self._init_grid(start_params)
+
+		self._tally = [0,0,0,0]
+		try:
+			self._optimize_points(pending, count, start_params, params, kwargs)
+		finally: # restore original model params
+			self.sim.set_model_params( **start_params )
+			if self._mapped:
+				self.results.flush()
+
+		self._report_savings()
+
+		return self.results
+
+	def evaluate(self, slab=1000):
+		"""Evaluate the goodness-of-fit of the model at each point on the grid defined by the parameter axes, without optimizing any parameters.
+
+		Arguments
+		---------
+		slab : integer
+			The number of grid points to evaluate in each batch by the simulator.
+
+		Returns
+		-------
+		numpy structured array or memmap
+			The results at each grid point, in the same format as optimize().
+
+		Notes
+		-----
+			Each slab of points is evaluated by the simulator's batch evaluation path (see ITCSim.run_batch()), and so is distributed across the simulator's workers rather than the grid's processes.
+			Models may share work between the points of a slab, e.g. Ising models only determine configuration probabilities once for points that differ only in their enthalpies.
+		"""
+
+		assert self._grid_size > 1
+
+		if self.verbose:
+			print("\nitc_grid: Evaluating %i grid points of %s parameters\n"%(self._grid_size,",".join(self._grid_order)))
+
+		# archive original model params
+		start_params = self.sim.get_model_params().copy()
+
+		pending,count = self._init_grid(start_params)
+
+		handle = None
+		if self.checkpoint != None:
+			handle = open(self.checkpoint,'a')
+
+		current = self.sim.model.get_vector(units=self.sim.units)
+		indices = self.sim.model.params.indices(self._grid_order)
+
+		try:
+			for k in itertools.count():
+				batch = list(itertools.islice(pending,slab))
+				if len(batch) == 0:
+					break
+
+				vectors = numpy.tile( current, (len(batch),1) )
+				vectors[:,indices] = [point for i,point in batch]
+				chisq = self.sim.run_batch( vectors )
+				if chisq is None:
+					raise Exception("itc_grid: Simulator failed to evaluate grid points.")
+
+				for (i,point),values,x in zip(batch,vectors,chisq):
+					self._record(i, values, x)
+
+					if handle != None:
+						self._write_checkpoint(handle,i,values,x)
+
+					if self.callback != None:
+						self.callback( point, OrderedDict(zip(self._names,values)), x )
+
+				if self.verbose:
+					print("itc_grid: Evaluated %i of %i grid points"%(min((k+1)*slab,count),count))
+		finally:
+			if handle != None:
+				handle.close()
+			if self._mapped:
+				self.results.flush()
+
+		return self.results
+
+	def _init_grid(self, start_params):
+		# set up storage for the results of the whole grid, and return a generator of the points still to be completed (and their count)
+		if self.resultfile != None:
+			self._open_resultfile(start_params)
+		else:
+			self._new_results(self._grid_size, start_params)
+			self.results['point'] = [self._get_point(i) for i in range(self._grid_size)]
+			self._coords = numpy.array([self._get_coords(i) for i in range(self._grid_size)])
 
 		# determine endpoints
-		if self._end_index == None:
-			self._end_index = self._grid_size
+		end = self._grid_size if self._end_index == None else self._end_index
+
+		# resume from the points already completed
+		if self.checkpoint != None:
+			self._apply_checkpoint(self._read_checkpoint(self._names), range(self._grid_size))
+
+		count = end-self._start_index
+		if self.checkpoint != None or self.resultfile != None:
+			count = sum( 1 for i in itertools.islice(self._iter_order(),self._start_index,end) if not self._is_done(i) )
+			if self.verbose:
+				print("itc_grid: Resuming with %i of %i grid points remaining"%(count,end-self._start_index))
+
+		# generated as needed, so that memory use does not depend on the size of the grid
+		pending = ( (i,self._get_result_point(i)) for i in itertools.islice(self._iter_order(),self._start_index,end) if not self._is_done(i) )
+
+		return pending,count
+
+	def _open_resultfile(self, start_params):
+		self._names = list(start_params.keys())
+		shape = tuple(len(pts) for pts in self._grid_pts)+(len(self._names)+1,)
+
+		if os.path.isfile(self.resultfile):
+			self.results = numpy.lib.format.open_memmap(self.resultfile,mode='r+')
+			if self.results.shape != shape or self.results.dtype != numpy.float64:
+				raise Exception("Result file \"%s\" does not match the grid (shape %s, expected %s)."%(self.resultfile,str(self.results.shape),str(shape)))
+		else:
+			self.results = numpy.lib.format.open_memmap(self.resultfile,mode='w+',dtype='d',shape=shape)
+			self.results[:] = numpy.nan
+			self.results.flush()
+
+		self._mapped = True
 
-		for i in range(self._start_index, self._end_index):
-			point = self._get_point(i)
+	def refine(self, params=[], threshold=1.0, gradient=None, budget=1000, depth=4, **kwargs ):
+		"""Optimize the model on the grid defined by the parameter axes, then recursively subdivide the grid around the points with the lowest goodness-of-fit (or steepest change).
 
-			# reset starting model params
+		Arguments
+		---------
+		params : list of strings
+			The names of the parameters to optimize.
+		threshold : float
+			Subdivide around points whose chisq is within this amount of the lowest chisq found so far.
+		gradient : float
+			Also subdivide around points whose chisq differs by more than this amount from that of a neighbouring point at the same spacing.
+		budget : integer
+			The maximum total number of points to optimize, including those of the initial grid.
+		depth : integer
+			The maximum number of times to halve the spacing of the grid.
+		**kwargs
+			Keyword arguments to pass to the ITCFit optimizer at each grid point
+
+		Returns
+		-------
+		numpy structured array
+			The fields of each optimized point (see optimize()), in the order the points were added.
+
+		Notes
+		-----
+			Subdividing a point adds the points halfway to each of its neighbours (including diagonals) on the next finer grid. Points between those of logarithmically spaced axes are placed logarithmically, otherwise they are interpolated linearly between the axis points.
+			If the budget does not allow all new points of a subdivision, those around the points with the lowest chisq are added first.
+			The start and end points of the grid are not used.
+		"""
+
+		assert self._grid_size > 1
+		assert budget >= self._grid_size
+
+		if self.verbose:
+			print("\nitc_grid: Adaptively optimizing %s parameters over up to %i points of %s parameters\n"%(",".join(params),budget,",".join(self._grid_order)))
+
+		# archive original model params
+		start_params = self.sim.get_model_params().copy()
+
+		# points are located by integer coordinates on the finest grid allowed by the depth
+		scale = 2**depth
+		limits = numpy.array([(len(pts)-1)*scale for pts in self._grid_pts])
+		self._new_results(budget, start_params)
+		self._coords = numpy.zeros((budget,len(self._grid_order)),dtype=int)
+		self._tally = [0,0,0,0]
+		located = {}
+
+		completed = {}
+		if self.checkpoint != None:
+			completed = self._read_checkpoint(self._names)
+
+		def _add(coords):
+			i = len(located)
+			located[tuple(coords)] = i
+			self._coords[i] = coords
+			self.results[i]['point'] = self._interpolate(numpy.array(coords)/float(scale))
+			return i
+
+		new = [ _add(numpy.array(self._get_coords(i))*scale) for i in self._get_order() ]
+		offsets = [numpy.array(o) for o in itertools.product((-1,0,1),repeat=len(self._grid_order)) if any(o)]
+
+		try:
+			for level in range(depth+1):
+				self._apply_checkpoint(completed, new)
+				pending = [(i,list(self.results[i]['point'])) for i in new if not self.results[i]['done']]
+				if len(pending) > 0:
+					self._optimize_points(pending, len(pending), start_params, params, kwargs)
+
+				if level == depth:
+					break
+
+				# select the points of this level to subdivide around
+				done = numpy.flatnonzero(self.results['done'])
+				best = numpy.min(self.results['chisq'][done])
+				step = scale // 2**level
+				parents = []
+				for i in new:
+					if not self.results[i]['done']:
+						continue
+					chisq = self.results[i]['chisq']
+					flag = chisq - best <= threshold
+					if not flag and gradient != None:
+						for axis in range(len(self._grid_order)):
+							for sign in (-1,1):
+								coords = self._coords[i].copy()
+								coords[axis] += sign*step
+								j = located.get(tuple(coords))
+								if j != None and self.results[j]['done'] and abs(self.results[j]['chisq'] - chisq) > gradient:
+									flag = True
+					if flag:
+						parents.append( (chisq,i) )
+
+				# add the points halfway to each neighbour, around the best points first
+				new = []
+				for chisq,i in sorted(parents):
+					for offset in offsets:
+						coords = self._coords[i] + offset*(step//2)
+						if (coords < 0).any() or (coords > limits).any() or tuple(coords) in located:
+							continue
+						if len(located) == budget:
+							break
+						new.append( _add(coords) )
+
+				if self.verbose:
+					print("itc_grid: Refinement level %i adds %i points around %i of %i points"%(level+1,len(new),len(parents),len(located)-len(new)))
+
+				if len(new) == 0:
+					break
+		finally: # restore original model params
 			self.sim.set_model_params( **start_params )
 
-			for (j,p) in enumerate(self._grid_order):
-				self.sim.set_model_param(p,point[j])
+		self._report_savings()
+
+		self.results = self.results[:len(located)]
+		self._coords = self._coords[:len(located)]
+		return self.results
+
+	def _interpolate(self, coords):
+		# return the axis parameter values at the provided fractional axis point indices
+		ret = []
+		for i,t in enumerate(coords):
+			pts = self._grid_pts[i]
+			j = min(int(t),len(pts)-2)
+			f = t - j
+			if self._grid_log[i]:
+				ret.append( pts[j]*(pts[j+1]/pts[j])**f )
+			else:
+				ret.append( pts[j]+f*(pts[j+1]-pts[j]) )
+		return ret
+
+	def _new_results(self, size, start_params):
+		self._mapped = False
+		self._names = list(start_params.keys())
+		self.results = numpy.zeros( size, dtype=[('index',int),('point',float,(len(self._grid_order),)),('params',float,(len(self._names),)),('chisq',float),('done',bool),('evaluations',int),('seed',int)] )
+		self.results['index'] = numpy.arange(size)
+		self.results['params'] = numpy.nan
+		self.results['chisq'] = numpy.nan
+		self.results['seed'] = -1
+
+	def _optimize_points(self, pending, count, start_params, params, kwargs):
+		# optimize the provided (result index, point) pairs (of which there are at most count) and record their results
+		pending = iter(pending)
+		warm = self.traversal == 'serpentine'
+
+		# each work item is a run of consecutive points to optimize, and the seed for the first of them
+		if self.processes > 0:
+			if warm:
+				n = max(1,-(-count // (4*self.processes)))
+				runs = iter( lambda: list(itertools.islice(pending,n)), [] )
+				items = ( (run,self._get_seed(run[0][0],params)) for run in runs )
+			else:
+				items = ( ([item],None) for item in pending )
+			pool = multiprocessing.Pool( self.processes, initializer=_grid_init, initargs=(pickle.dumps(self.fit),start_params,self._grid_order,params,kwargs,warm) )
+			results = pool.imap_unordered( _grid_worker, items )
+		else: # lazily generated, so that each point is seeded from every point completed before it
+			items = ( ([item],self._get_seed(item[0],params) if warm else None) for item in pending )
+			_grid_init( None, start_params, self._grid_order, params, kwargs, warm, fit_object=self.fit )
+			results = map( _grid_worker, items )
+
+		handle = None
+		if self.checkpoint != None:
+			handle = open(self.checkpoint,'a')
+
+		try:
+			for i,values,chisq,evaluations,seed in (point for run in results for point in run):
+				if values == None:
+					print("itc_grid: Error, caught exception at grid point index %i: %s"%(i,chisq))
+					continue
+
+				self._record(i, values, chisq, evaluations, seed)
+
+				# warm start accounting: cold starts, their evaluations, warm starts, their evaluations
+				self._tally[0 if seed < 0 else 2] += 1
+				self._tally[1 if seed < 0 else 3] += evaluations
+
+				if handle != None:
+					self._write_checkpoint(handle,i,values,chisq)
+
+				if self.callback != None:
+					self.callback( self._get_result_point(i), OrderedDict(zip(self._names,values)), chisq )
+		finally:
+			if self.processes > 0:
+				pool.terminate()
+				pool.join()
+			if handle != None:
+				handle.close()
+
+	def _report_savings(self):
+		if self.traversal != 'serpentine':
+			return
+
+		cold,cold_evaluations,warm,warm_evaluations = self._tally
+		if cold > 0 and warm > 0:
+			self.savings = int(round( (float(cold_evaluations)/cold)*warm - warm_evaluations ))
+		else:
+			self.savings = 0
+		if self.verbose:
+			print("itc_grid: Warm starts saved an estimated %i objective evaluations (%i used)"%(self.savings,cold_evaluations+warm_evaluations))
+
+
+# the optimization state of each grid process, set by _grid_init()
+_grid_state = {}
+
+def _grid_init(fit, start_params, order, params, kwargs, warm, fit_object=None):
+	# copies of the fitter arrive pickled, so that their simulator never shares worker threads with the parent process
+	_grid_state['fit'] = pickle.loads(fit) if fit_object == None else fit_object
+	_grid_state['args'] = (start_params,order,params,kwargs,warm)
+
+def _grid_worker(item):
+	run,seed = item
+	fit = _grid_state['fit']
+	start_params,order,params,kwargs,warm = _grid_state['args']
+
+	ret = []
+	for i,point in run:
+		# reset starting model params
+		fit.sim.set_model_params( **start_params )
+		if seed != None:
+			fit.sim.set_model_params( **seed[1] )
+
+		for (j,p) in enumerate(order):
+			fit.sim.set_model_param(p,point[j])
 
-			try:
-				self._grid_results[i] = (point,)+self.fit.optimize( params=params, **kwargs )
-			except Exception as e:
-				print("itc_grid: Error, caught exception at grid point index %i: %s"%(i,str(e)))
-				continue
+		try:
+			opt = fit.optimize( params=params, **kwargs )
+		except Exception as e:
+			ret.append( (i,None,str(e),fit.evaluations,-1) )
+			continue
 
-			if self.callback != None:
-				self.callback( *self._grid_results[i] )
+		values = fit.sim.get_model_params()
+		values.update( opt[0] )
+		ret.append( (i,list(values.values()),opt[1],fit.evaluations,-1 if seed == None else seed[0]) )
 
-		# restore original model params
-		self.sim.set_model_params( **start_params )
+		# the next point in the run neighbours this one
+		if warm:
+			seed = (i,dict( (p,v) for p,v in opt[0].items() if p not in order ))
 
-		return self._grid_results
-		
\ No newline at end of file
+	return ret
@@ -3,10 +3,69 @@
 
 """
 
+import numpy
+
 from collections import OrderedDict
+from collections.abc import MutableMapping
 
 from .thermo import *
-from .thermo import _UNITS
+from .thermo import _UNITS, _UNIT_FACTORS
+
+
+class ParamVector(MutableMapping):
+	"""An ordered, name-keyed mapping of model parameter values that are stored in a contiguous float64 array.
+
+	Attributes
+	----------
+	values : ndarray
+		The parameter values, in the order the parameters were added.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		self._index = OrderedDict()
+		self.values = numpy.zeros(0)
+		self.update(*args, **kwargs)
+
+	def __getitem__(self, name):
+		return self.values[self._index[name]]
+
+	def __setitem__(self, name, value):
+		if name in self._index:
+			self.values[self._index[name]] = value
+		else:
+			self._index[name] = len(self.values)
+			self.values = numpy.append(self.values, float(value))
+
+	def __delitem__(self, name):
+		i = self._index.pop(name)
+		self.values = numpy.delete(self.values, i)
+		for k,j in self._index.items():
+			if j > i:
+				self._index[k] = j-1
+
+	def __iter__(self):
+		return iter(self._index)
+
+	def __len__(self):
+		return len(self._index)
+
+	def __repr__(self):
+		return "%s(%s)"%(self.__class__.__name__,repr(list(self.items())))
+
+	def copy(self):
+		"""Return a copy of the parameter vector."""
+		ret = ParamVector()
+		ret._index = self._index.copy()
+		ret.values = self.values.copy()
+		return ret
+
+	def index(self, name):
+		"""Return the position of the named parameter in the values array."""
+		return self._index[name]
+
+	def indices(self, names):
+		"""Return an array of the positions of the named parameters in the values array."""
+		return numpy.array([self._index[name] for name in names], dtype=int)
 
 
 class ITCModel():
@@ -16,8 +75,8 @@ class ITCModel():
 	----------
 	units : string
 		The units to report binding enthalpies in. Note that internally, all calculations should be performed in SI units (e.g. Joules)
-	params : ordered dict of strings
-		The parameters of the model
+	params : ParamVector
+		The parameters of the model (in SI units), keyed by name
 	components : list of strings
 		The names of the components that are involved in the binding model (e.g. the lattice/macromolecule and ligand)
 	lattice_name : string
@@ -52,10 +111,11 @@ class ITCModel():
 		self.ligand_name = ligand_name
 		self.units = units
 		
-		self.params = OrderedDict()
+		self.params = ParamVector()
 		self.components = []
 		self._param_meta = {}
 		self._component_meta = {}
+		self._scales = {}
 		
 	def add_parameter(self, name, type, bounds=[None,None], default=0.0, linked='', description=''):
 		"""Register a model parameter.
@@ -84,6 +144,7 @@ class ITCModel():
 		assert type in ('n','k','dG','dH','dS','dCp')
 		self.params[name] = default
 		self._param_meta[name]	= (default,type,bounds,description,linked,type in ('dG','dH','dS','dCp'))
+		self._scales = {}
 	
 	def add_component(self, name, description=''):
 		"""Register a model component.
@@ -205,6 +266,51 @@ class ITCModel():
 		for k,v in kwargs.items():
 			self.set_param( k, v )
 
+	def set_vector(self, values, indices=None, units=None):
+		"""Set the values of the model parameters from an array.
+		
+		Arguments
+		---------
+		values : array of floats
+			The values of all model parameters in the order returned by get_param_names(), or of those at the provided indices.
+		indices : array of ints
+			The positions of the parameters to set (see ParamVector.indices()). If omitted, set all parameters.
+		units : string
+			The units of the values. If omitted, use the units already specified by the model (if applicable).
+		
+		Returns
+		-------
+		None
+		"""
+		scales = self._get_scales(units)
+		if indices is None:
+			self.params.values[:] = values * scales
+		else:
+			self.params.values[indices] = values * scales[indices]
+
+	def get_vector(self, units=None):
+		"""Return the values of all model parameters as an array.
+		
+		Arguments
+		---------
+		units : string
+			Use the specified units. If omitted, use the units already specified by the model (if applicable).
+		
+		Returns
+		-------
+		ndarray
+			The values of the model parameters, in the order returned by get_param_names().
+		"""
+		return self.params.values / self._get_scales(units)
+
+	def _get_scales(self, units=None):
+		# the factor converting each parameter from the specified units to those used internally
+		if not units:
+			units = self.units
+		if units not in self._scales:
+			self._scales[units] = numpy.array([ _UNIT_FACTORS[units] if self._param_meta[name][5] else 1.0 for name in self.params ])
+		return self._scales[units]
+
 	# getters
 	def get_params(self,units=None):
 		"""Return the value of all model parameters.
@@ -219,7 +325,7 @@ class ITCModel():
 		OrderedDict
 			Parameter name-keyed dict of values.
 		"""
-		return OrderedDict( (name,self.get_param(name,units)) for name in self.params.keys() )
+		return OrderedDict( zip(self.params.keys(),self.get_vector(units)) )
 		
 	def get_param(self,name,units=None):
 		"""Return the value of the specified model parameter.
@@ -368,3 +474,32 @@ class ITCModel():
 			The total heat in the system at each injection point.
 		"""
 		raise NotImplementedError("Valid ITC models should implement this!")
+
+	def Q_batch(self,T0,T,concentrations,param_sets):
+		"""Return the total binding heat at each injection for several sets of model parameter values. Child classes may overwrite this to share work between parameter sets.
+
+		Arguments
+		---------
+		T0 : float
+			The reference temperature to be used for the model (used in temperature-dependent dG, dH, dCp).
+		T : float
+			The temperature the titration was performed at.
+		concentrations : list of dicts
+			The concentration of components at each injection point.
+		param_sets : 2D array of floats
+			The parameter vectors (in the current model units, see get_vector()) to evaluate, one per row.
+
+		Returns
+		-------
+		list of lists of floats
+			The total heat in the system at each injection point, for each of the parameter sets.
+
+		Notes
+		-----
+			The model is left with the values of the last parameter set.
+		"""
+		ret = []
+		for vector in param_sets:
+			self.set_vector(vector)
+			ret.append( self.Q(T0,T,concentrations) )
+		return ret
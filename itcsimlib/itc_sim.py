@@ -5,8 +5,10 @@
 
 import os
 import copy
+import numpy
 import multiprocessing
 
+from collections		import OrderedDict
 from .					import __version__
 from .itc_experiment	import *
 from .itc_calc			import ITCCalc
@@ -23,6 +25,8 @@ class ITCSim:
 		The average reduced chi squared goodness-of-fit across the experiments in the simulator.
 	experiments : list of ITCExperiments
 		The list of experiments in the simulation. Do not directly modify this list, use the add and remove experiment class methods.
+	links : dict of OrderedDicts
+		The names of the local parameters of each experiment (keyed by experiment title), keyed by the global parameter they replace. Use add_local_param() to add local parameters.
 	model : ITCModel
 		The model used by the simulator to generate/fit data.
 	"""
@@ -51,6 +55,9 @@ class ITCSim:
 		self.verbose = verbose
 
 		self.model = None
+		self.links = {}
+		self._dependencies = None
+		self._cache = {}
 		self.in_Queue,self.out_Queue = multiprocessing.Queue(),multiprocessing.Queue()
 
 		# Enable/diable multithreading, avoids __name__ guards on Windows
@@ -60,6 +67,13 @@ class ITCSim:
 			threads = multiprocessing.cpu_count()
 		self.workers = [None] * threads
 
+	def __getstate__(self):
+		"""Return the state of the simulator for pickling. Worker threads and their queues cannot be shared, so the unpickled copy always simulates serially."""
+		state = self.__dict__.copy()
+		state['in_Queue'],state['out_Queue'] = None,None
+		state['workers'] = []
+		return state
+
 	def __str__(self):
 		"""Stringify the simulator to be suitable for display to the user.
 		
@@ -150,6 +164,31 @@ class ITCSim:
 		if units == None:
 			units = self.units
 		return self.model.get_params(units)
+
+	def get_dependencies(self):
+		"""Return the experiments that depend on each of the model parameters.
+		
+		Arguments
+		---------
+		None
+		
+		Returns
+		-------
+		OrderedDict of lists of strings
+			The titles of the experiments affected by each model parameter, keyed by parameter name. Global parameters affect every experiment in which they are not replaced by a local parameter, and local parameters only affect their own experiment.
+		"""
+		if self._dependencies is None:
+			local = dict( (name,title) for title in self.links for name in self.links[title].values() )
+			self._dependencies = OrderedDict( (name,[]) for name in self.model.get_param_names() )
+			for E in self.experiments:
+				replaced = self.links.get(E.title,{})
+				for name,titles in self._dependencies.items():
+					if name in local:
+						if local[name] == E.title:
+							titles.append(E.title)
+					elif name not in replaced:
+						titles.append(E.title)
+		return self._dependencies
 		
 	def get_chisq(self):
 		"""Return the total reduced chisquared goodness-of-fit for the simulator.
@@ -181,6 +220,11 @@ class ITCSim:
 		if not (None in self.workers):
 			self.done()
 
+		if model is not self.model: # local parameters belong to the previous model
+			self.links = {}
+		self._dependencies = None
+		self._cache = {}
+
 		self.model = model
 		self.model.set_units(self.units)
 
@@ -195,6 +239,52 @@ class ITCSim:
 	def set_model_param(self, param, value):
 		"""Passthrough for the simulator's model set_param()"""
 		self.model.set_param( param, value )
+
+	def add_local_param(self, param, experiment, name=None, value=None):
+		"""Add a parameter that replaces a global model parameter, or the heat of dilution, for a single experiment.
+		
+		Arguments
+		---------
+		param : string
+			The name of the global model parameter to replace, or "Q_dil" for the heat of dilution of the experiment.
+		experiment : ITCExperiment or string
+			The experiment (or its title) the local parameter applies to.
+		name : string
+			The name of the local parameter. If omitted, "param@title" is used.
+		value : float
+			The starting value of the local parameter, in the simulator units. If omitted, the current value of the global parameter (or the heat of dilution of the experiment) is used.
+		
+		Returns
+		-------
+		string
+			The name of the local parameter.
+
+		Notes
+		-----
+			The local parameter is registered with the simulator model, with the replaced parameter as its linked parameter, so that it can be read, set and fit like any other model parameter. Local parameters should therefore be added before an ITCFit or ITCGrid is created for the simulator.
+			While local parameters are defined, the heats of each experiment are cached and only recalculated when a parameter the experiment depends on changes (see get_dependencies()).
+		"""
+		if not isinstance(experiment, ITCExperimentBase):
+			experiment = self.get_experiment_by_title(experiment)
+
+		links = self.links.setdefault( experiment.title, OrderedDict() )
+		assert param not in links
+		if name == None:
+			name = "%s@%s"%(param,experiment.title)
+
+		if param == 'Q_dil':
+			self.model.add_parameter( name, 'dH', default=experiment.Q_dil, linked=param, description="Heat of dilution for experiment %s"%(experiment.title) )
+		else:
+			assert param in self.model.get_param_names()
+			self.model.add_parameter( name, self.model.get_param_type(param), bounds=self.model.get_param_bounds(param), default=self.model.params[param], linked=param, description="%s for experiment %s"%(param,experiment.title) )
+		links[param] = name
+
+		if value != None:
+			self.model.set_param( name, value )
+
+		# the workers need a copy of the model with the new parameter
+		self.set_model( self.model )
+		return name
 		
 	def done(self):
 		"""Cleanly shuts down the simulator.
@@ -232,6 +322,7 @@ class ITCSim:
 		"""
 		self.experiments.append( experiment )
 		self.size +=1
+		self._dependencies = None
 		
 	def add_experiment_synthetic( self, *args, **kwargs ):
 		"""Add a set of synthetic experimental conditions to the simulator.
@@ -296,7 +387,9 @@ class ITCSim:
 		self.experiments.remove(experiment)
 		if experiment.title in self.chisq:
 			del self.chisq[experiment.title]
+		self._cache.pop(experiment.title,None)
 		self.size -=1
+		self._dependencies = None
 		
 	def remove_all_experiments( self ):
 		"""Removes all experiments from the simulator.
@@ -370,33 +463,159 @@ class ITCSim:
 			print("itc_sim: No experiments to simulate.")
 			return None
 
-		# without multiprocessing (avoids requirement for __name__ guards in Windows)
+		vector = self.model.get_vector(units=self.units)
+
+		# without local parameters, every experiment is simulated
+		if len(self.links) == 0:
+			results = self._evaluate( vector[None,:], experiments )
+			if results == None:
+				return None
+
+			for i,E in enumerate(experiments):
+				self.chisq[E.title] = E.get_chisq(results[i][0],writeback)
+
+			return self.get_chisq()
+
+		# otherwise, only simulate the experiments whose parameters have changed since they were last simulated
+		keys = [ self._get_cache_key(E,vector) for E in experiments ]
+		pending = [ i for i,E in enumerate(experiments) if self._cache.get(E.title,(None,))[0] != keys[i] ]
+
+		if len(pending) > 0:
+			results = self._evaluate( vector[None,:], [experiments[i] for i in pending] )
+			if results == None:
+				return None
+
+			for j,i in enumerate(pending):
+				self._cache[experiments[i].title] = ( keys[i], numpy.array(results[j][0],dtype='d') )
+
+		for E in experiments:
+			self._set_dilution( E, vector )
+			self.chisq[E.title] = E.get_chisq(list(self._cache[E.title][1]),writeback)
+
+		return self.get_chisq()
+
+	def run_batch( self, param_sets, experiments=None, residuals=False ):
+		"""Return the average reduced chi-squared goodness-of-fit for each of several sets of model parameter values, distributing the evaluations across the simulator's workers.
+		
+		Arguments
+		---------
+		param_sets : list of dicts or 2D array of floats
+			Parameter name-keyed dicts of model parameter values (in the simulator units), where parameters not present in a set keep their current values. Alternatively, complete model parameter vectors (see ITCModel.get_vector()), one per row.
+		experiments : list of ITCExperiments
+			The experiments to run through the simulator. If None, run all experiments in the simulator.
+		residuals : boolean
+			Return the error-weighted residuals of the experiments instead of the goodness-of-fit?
+		
+		Returns
+		-------
+		ndarray
+			The average reduced chi-squared goodness-of-fit across the experiments for each of the parameter sets, or a 2D array of the concatenated residuals of the experiments (one row per parameter set) if residuals is True.
+
+		Notes
+		-----
+			Neither the current model parameters nor the fits and chisq values of the experiments are changed.
+		"""
+		if experiments == None:
+			experiments = self.experiments
+
+		if len(experiments) == 0:
+			print("itc_sim: No experiments to simulate.")
+			return None
+
+		# fill in any parameters that aren't explicitly provided with their current values
+		if isinstance(param_sets, numpy.ndarray):
+			param_sets = numpy.atleast_2d(param_sets)
+		else:
+			vectors = numpy.tile( self.model.get_vector(units=self.units), (len(param_sets),1) )
+			for j,params in enumerate(param_sets):
+				for name,value in params.items():
+					vectors[j,self.model.params.index(name)] = value
+			param_sets = vectors
+
+		results = self._evaluate( param_sets, experiments )
+		if results == None:
+			return None
+
+		if residuals:
+			ret = numpy.zeros( (len(param_sets),0) )
+			for i,E in enumerate(experiments):
+				columns = []
+				for j in range(len(param_sets)):
+					self._set_dilution( E, param_sets[j] )
+					columns.append( E.get_residuals(results[i][j]) )
+				ret = numpy.hstack( (ret,numpy.array(columns)) )
+		else:
+			ret = numpy.zeros(len(param_sets))
+			for i,E in enumerate(experiments):
+				for j in range(len(param_sets)):
+					self._set_dilution( E, param_sets[j] )
+					ret[j] += E.get_chisq(results[i][j],writeback=False)
+			ret /= len(experiments)
+
+		# restore the heats of dilution of the current model parameters
+		vector = self.model.get_vector(units=self.units)
+		for E in experiments:
+			self._set_dilution( E, vector )
+
+		return ret
+
+	def _evaluate( self, param_sets, experiments ):
+		# returns the model heats for each experiment (outer list) at each parameter vector (inner list)
 		if len(self.workers) == 0:
+			start_params = self.model.params.values.copy()
 			self.model.start()
 
-			for E in experiments:
-				data = self.model.Q( self.T0, E.T, E.Concentrations )
-				self.chisq[E.title] = E.get_chisq(data,writeback)
+			ret = [ self.model.Q_batch( self.T0, E.T, E.Concentrations, self._localize(param_sets,E) ) for E in experiments ]
 
 			self.model.stop()
+			self.model.params.values[:] = start_params
+			return ret
+
+		# split the parameter sets into one contiguous chunk per worker for each experiment
+		chunk = -(-len(param_sets) // len(self.workers))
+		jobs = 0
+		for i,E in enumerate(experiments):
+			local_sets = self._localize(param_sets,E)
+			for j in range(0, len(param_sets), chunk):
+				self.in_Queue.put( ((i,j),local_sets[j:j+chunk],E) )
+				jobs += 1
+
+		ret = [ [None]*len(param_sets) for E in experiments ]
+		error = None
+		for k in range(jobs):
+			tag,title,data = self.out_Queue.get(True)
+			if title == None: # in the case of an exception during model execution, title will be None
+				error = data
+			else:
+				ret[tag[0]][tag[1]:tag[1]+len(data)] = data
+
+		if error != None:
+			print("\nitc_sim: Fatal error during model evalution: %s"%(error))
+			self.done()
+			return None
 
-		# with multiprocessing
-		else:
-			for E in experiments:
-				self.in_Queue.put( (self.model.get_params(units=self.units),E) )
-
-			queue_contents = []
-			while len(queue_contents) < self.size:
-				queue_contents.append( self.out_Queue.get(True) )
-
-			for title,data in queue_contents:
-				# in the case of an exception during model execution, title will be None
-				if title == None:
-					print("\nitc_sim: Fatal error during model evalution: %s"%(data))
-					self.done()
-					return None
-				else:
-					self.chisq[title] = self.get_experiment_by_title(title).get_chisq(data,writeback)
-
-		return self.get_chisq()
+		return ret
 
+	def _localize( self, param_sets, experiment ):
+		# returns the parameter vectors with the global parameters replaced by the local parameters of the experiment
+		links = self.links.get(experiment.title)
+		if not links:
+			return param_sets
+
+		param_sets = numpy.array(param_sets,dtype='d')
+		for param,name in links.items():
+			if param != 'Q_dil':
+				param_sets[:,self.model.params.index(param)] = param_sets[:,self.model.params.index(name)]
+		return param_sets
+
+	def _set_dilution( self, experiment, vector ):
+		# applies the local heat of dilution (if any) in the parameter vector to the experiment
+		links = self.links.get(experiment.title)
+		if links and 'Q_dil' in links:
+			experiment.set_Q_dil( convert_to_J(self.units,vector[self.model.params.index(links['Q_dil'])]) )
+
+	def _get_cache_key( self, experiment, vector ):
+		# the values of the parameters that determine the heats of the experiment
+		links = self.links.get(experiment.title,{})
+		indices = [ i for i,(name,titles) in enumerate(self.get_dependencies().items()) if experiment.title in titles and name != links.get('Q_dil') ]
+		return (self.T0, experiment.T, vector[indices].tobytes())
@@ -9,7 +9,10 @@ import uuid
 import numpy
 
 from .itc_experiment import ITCExperimentBase
+from .itc_model import ITCModel
 from .model_ising import Ising
+from .model_trap import get_free_fraction
+from .thermo import _R
 
 
 _MATPLOTLIB_BACKEND = None #None for default
@@ -379,6 +382,24 @@ class MSExperiment(ITCExperimentBase):
 
 		return self.chisq
 
+	def get_residuals(self, pops):
+		"""Calculate the error-weighted residuals between the experimental population abundances and the fitted ones.
+
+		Arguments
+		---------
+		pops : ndarray
+			The normalized abundances of each lattice+ligand stoichiometries at each of the provided component concentrations.
+
+		Returns
+		-------
+		ndarray
+			The flattened differences between the experimental and fitted abundances divided by their uncertainties.
+		"""
+
+		assert self.PopIntens.shape == pops.shape
+
+		return ((self.PopIntens - pops) / numpy.sqrt(self.PopSigmas)).flatten()
+
 class MSExperimentSynthetic(MSExperiment):
 	"""A MSExperiment-derived class that can be used to simulate a mass spec experiment"""
 		
@@ -474,6 +495,13 @@ class MSModel(Ising):
 		self.model.params = self.params
 		self.model.set_energies(T0,T)
 
+	def set_config_expressions(self):
+		"""Use the symbolic configuration expressions of the parent model."""
+		self.config_expressions = self.model.config_expressions
+
+	# populations rather than heats are returned, so evaluate each parameter set separately
+	Q_batch = ITCModel.Q_batch
+
 	def Q(self,T0,T,concentrations):
 		"""Return a 2D numpy array consisting of the base model's relative stoichiometries at each of the provided component concentrations.
 		
@@ -490,19 +518,39 @@ class MSModel(Ising):
 		-------
 		ndarray
 			The normalized abundances of each lattice+ligand stoichiometries at each of the provided component concentrations.
+
+		Notes
+		-----
+			Unless the base model overrides set_probabilities(), the configuration weights are summed into the partition function of each stoichiometry once, and the free ligand is solved for at all points at once (see model_trap.get_free_fraction()). The weights attribute of the base model is then not updated.
 		"""
 
 		# set the energies of this model's configs from the base model
 		self.set_energies(T0,T)
+		bound = numpy.array(self.model.bound)
 		
-		ret = numpy.zeros((len(concentrations),self.model.nsites+1))
-		for i,c in enumerate(concentrations):
-			
-			# set the probabilities (weights) for all configurations
-			self.model.set_probabilities(c[self.lattice_name],c[self.ligand_name],T)
-			
-			# for each stoichiometry, add up the configuration weights
-			for j in range(self.model.nconfigs):
-				ret[i][self.model.bound[j]] += self.model.weights[j]
-
-		return ret
\ No newline at end of file
+		if type(self.model).set_probabilities is not Ising.set_probabilities:
+			ret = numpy.zeros((len(concentrations),self.model.nsites+1))
+			for i,c in enumerate(concentrations):
+				# set the probabilities (weights) for all configurations, and add them up for each stoichiometry
+				self.model.set_probabilities(c[self.lattice_name],c[self.ligand_name],T)
+				ret[i] = numpy.bincount(bound,weights=self.model.weights,minlength=self.model.nsites+1)
+			return ret
+
+		# the partition function of each stoichiometry (as logarithms, to avoid overflow)
+		stoich = numpy.arange(self.model.nsites+1)
+		weights = -numpy.array(self.model.gibbs,dtype=float) / (_R*T)
+		wmax = numpy.full(len(stoich),-numpy.inf)
+		numpy.maximum.at(wmax,bound,weights)
+		logZ = numpy.log(numpy.bincount(bound,weights=numpy.exp(weights -wmax[bound]),minlength=len(stoich))) +wmax
+
+		# the coefficients of the binding polynomial at each point, scaled so that the largest is 1
+		P = numpy.array([c[self.lattice_name] for c in concentrations],dtype=float)
+		L = numpy.array([c[self.ligand_name] for c in concentrations],dtype=float)
+		ligand = L > 0
+		coeffs = logZ +(stoich*numpy.log(numpy.where(ligand,L,1.0))[:,None])
+		coeffs = numpy.where(ligand[:,None] | (stoich == 0),coeffs,-numpy.inf)
+		coeffs = numpy.exp(coeffs -numpy.max(coeffs,axis=-1,keepdims=True))
+
+		x = get_free_fraction(coeffs,numpy.where(ligand,P,0.0)/numpy.where(ligand,L,1.0))
+		ret = coeffs * (x[:,None] ** stoich)
+		return ret / numpy.sum(ret,axis=-1,keepdims=True)
\ No newline at end of file
@@ -3,12 +3,24 @@
 
 """
 
+import numpy
+
+from collections import OrderedDict
+
 from .thermo import *
 from .model_ising import Ising
 
 
 class DRAKONIsingModel(Ising):
-	"""A wrapper/simplification interface for an Ising model for use in DRAKON flow diagram-based models."""
+	"""A wrapper/simplification interface for an Ising model for use in DRAKON flow diagram-based models.
+
+	Attributes
+	----------
+	trace : boolean
+		Whether the energy terms added to each configuration by the DRAKON flow are recorded once and replayed (see set_energies()).
+	"""
+
+	trace = False
 	
 	def setup(self):
 		"""Runs any necessary setup actions prior to execution. Valid child models should overwrite this."""
@@ -27,6 +39,11 @@ class DRAKONIsingModel(Ising):
 		self.neighbor = self.get_site_occupancy
 		self.set_parameter = self.set_param
 
+		self._expressions = {} # compiled code of each parameter expression, see _compile()
+		self._values = {} # values of each parameter expression during set_energies()
+		self._trace = None # the energy terms added to each configuration, see _record()
+		self._recording = None # the terms added so far while recording
+
 		if not (getattr(self, "site", False) or getattr(self, "configuration")):
 			raise NotImplementedError("Valid DRAKON models must include a site() or config() method.")
 		
@@ -40,6 +57,12 @@ class DRAKONIsingModel(Ising):
 		"""
 		
 		Ising.__init__(self, *args, **kwargs)
+
+	def __getstate__(self):
+		"""Return the state of the model for pickling, without the compiled parameter expressions (which are rebuilt as needed)."""
+		state = Ising.__getstate__(self)
+		state['_expressions'],state['_values'] = {},{}
+		return state
 	
 	def add_parameter(self, name, type, **kwargs):
 		"""Alias for the ITCModel add_parameter() method. This method also adds the parameter to the class attributes.
@@ -95,25 +118,139 @@ class DRAKONIsingModel(Ising):
 		Returns
 		-------
 		None
+
+		Notes
+		-----
+			If the trace attribute is set (it is not by default), the DRAKON flow is only run on the first call, recording the terms that add_dG() and add_dH() add to each configuration. Subsequent calls evaluate each term once and sum them with a matrix product.
+			This is only valid if the flow depends on nothing but the occupancy of the configurations. Models whose flow depends on the parameter values (e.g. the ring_sat parameter of examples/drakon/groel.py) or the temperature, or that modify the configuration energies directly, must not set trace.
 		"""	
 		self._T0,self._T = T0,T
+
+		# each parameter or expression is evaluated at most once per call, see _evaluate()
+		self._values = dict( (name,self.get_param(name,units="J")) for name in self.params )
+
+		if not self.trace:
+			self._run_flow()
+			return
+
+		if self._trace is None:
+			self._trace = self._record()
+
+		(dG_terms,dG_counts),(dH_terms,dH_counts) = self._trace
+		self.gibbs = numpy.dot( dG_counts, numpy.array([self._get_dG(*term) for term in dG_terms],dtype=float) ).tolist()
+		self.enthalpies = numpy.dot( dH_counts, numpy.array([self._get_dH(*term) for term in dH_terms],dtype=float) ).tolist()
+
+	def _run_flow(self):
+		"""Set the energies of each configuration by running the DRAKON site() or configuration() method."""
 		
 		config_energy_function = getattr(self, "configuration", False)
 		
 		for i in range(self.nconfigs):
-			self.gibbs[i],self.enthalpies[i] = 0.0,0.0
-			self.config_expressions[i] = 0
+			if self._recording is None:
+				self.gibbs[i],self.enthalpies[i] = 0.0,0.0
 			
 			if config_energy_function:
 				self.configuration(i)
 			else:
 				for j in range(self.nsites):
 					self.site(i, j)		
+
+	def _record(self):
+		"""Run the DRAKON flow once, recording the energy terms added to each configuration.
+
+		Returns
+		-------
+		tuple
+			For the free energies and the enthalpies, the list of distinct terms (the arguments of add_dG() or add_dH()), and the number of times each configuration (rows) includes each term (columns).
+		"""
+
+		self._recording = ([],[])
+		try:
+			self._run_flow()
+		finally:
+			recorded,self._recording = self._recording,None
+
+		trace = []
+		for entries in recorded:
+			terms = OrderedDict()
+			for i,term in entries:
+				terms.setdefault(term,len(terms))
+			counts = numpy.zeros((self.nconfigs,len(terms)))
+			for i,term in entries:
+				counts[i,terms[term]] += 1
+			trace.append( (list(terms),counts) )
+		return tuple(trace)
+
+	def set_config_expressions(self):
+		"""Set the symbolic free energy expression of each configuration from the terms recorded by the DRAKON flow. See the Ising parent method."""
+
+		if self.trace:
+			if self._trace is None:
+				self._trace = self._record()
+			dG_terms,dG_counts = self._trace[0]
+		else:
+			dG_terms,dG_counts = self._record()[0]
+
+		symbols = [eval(self._compile(dG), globals(), self.parameter_symbols) for dG,dH,dCp in dG_terms]
+		for i in range(self.nconfigs):
+			self.config_expressions[i] = sum( int(n)*symbol for n,symbol in zip(dG_counts[i],symbols) if n )
+
+	def _get_dG(self, dG, dH=None, dCp=None):
+		"""Return the (temperature-corrected) free energy of a term added by add_dG(). See add_dG() for the argument list."""
+
+		dG = self._evaluate(dG)
+		if dH is None or dCp is None:
+			return dG
+		return dG_vant_Hoff( dG, self._evaluate(dH), self._evaluate(dCp), self._T, self._T0 )
+
+	def _get_dH(self, dH, dCp=None):
+		"""Return the (temperature-corrected) enthalpy of a term added by add_dH(). See add_dH() for the argument list."""
+
+		dH = self._evaluate(dH)
+		if dCp is None:
+			return dH
+		return dH_vant_Hoff( dH, self._evaluate(dCp), self._T, self._T0 )
+
+	def _compile(self, expression):
+		"""Parse an expression of model parameters, once.
+
+		Arguments
+		---------
+		expression : string
+			A model parameter name, or a Python expression of model parameter names.
+
+		Returns
+		-------
+		code object
+			The compiled expression.
+		"""
+
+		if expression not in self._expressions:
+			self._expressions[expression] = compile(expression, "<expression>", "eval")
+		return self._expressions[expression]
+
+	def _evaluate(self, expression):
+		"""Return the value (in J) of a model parameter or expression of model parameters at the current parameter values. The value of each expression is computed once per set_energies() call.
+
+		Arguments
+		---------
+		expression : string
+			A model parameter name, or a Python expression of model parameter names.
+
+		Returns
+		-------
+		float
+			The value of the expression.
+		"""
+
+		if expression not in self._values:
+			self._values[expression] = eval(self._compile(expression), globals(), self._values)
+		return self._values[expression]
 		
 	def add_dG(self, i, dG, dH=None, dCp=None):
 		"""Convenience function for DRAKON models to increment the gibbs free energy of a configuration.
 		This function also permits temperature-dependent van't Hoff correction, if dH and dCp are not None.
-		Alternatively, an expression consisting of existing model parameters may be provided for each argument, but this will result in (even slower) model evaluation as the expression will need to be eval()'d for every configuration. 
+		Alternatively, an expression consisting of existing model parameters may be provided for each argument. Each expression is compiled once, and evaluated once per set_energies() call.
 		
 		Arguments
 		---------
@@ -127,44 +264,15 @@ class DRAKONIsingModel(Ising):
 			The name of the heat capacity change parameter to use in the van't Hoff correction.
 		"""
 		
-		if dG in self.params:
-			self.config_expressions[i] += self.parameter_symbols[dG]
-			dG = self.get_param(dG,units="J")
-		else: # expression to evaluate
-			dG_v,dG_s = dG,dG # dG_values, dG_symbols
-			for p in self.params:
-				dG_v = dG_v.replace(p,"self.get_param('%s',units='J')"%p)
-				dG_s = dG_s.replace(p,"self.parameter_symbols['%s']"%p)
-			dG = eval(dG_v)
-			self.config_expressions[i] += eval(dG_s)
-
-		if dH in self.params:
-			dH = self.get_param(dH,units="J")
-		elif dH is None:
-			pass
+		if self._recording is None:
+			self.gibbs[i] += self._get_dG( dG, dH, dCp )
 		else:
-			for p in self.params:
-				dH = dH.replace(p,"self.get_param('%s',units='J')"%p)
-			dH = eval(dH)
-
-		if dCp in self.params:
-			dCp = self.get_param(dCp,units="J")
-		elif dCp is None:
-			pass
-		else:
-			for p in self.params:
-				dCp = dCp.replace(p,"self.get_param('%s',units='J')"%p)
-			dCp = eval(dCp)
-		
-		if dH==None or dCp==None:
-			self.gibbs[i] += dG
-		else:
-			self.gibbs[i] += dG_vant_Hoff( dG, dH, dCp, self._T, self._T0 )
+			self._recording[0].append( (i,(dG,dH,dCp)) )
 		
 	def add_dH(self, i, dH, dCp=None):
 		"""Convenience function for DRAKON models to increment the enthalpy of a configuration.
 		This function permits temperature-dependent van't Hoff correction, if dCp is not None.
-		Alternatively, an expression consisting of existing model parameters may be provided, but this may result in (even slower) model execution, as the expression will need to be eval()'d for every configuration. 
+		Alternatively, an expression consisting of existing model parameters may be provided. Each expression is compiled once, and evaluated once per set_energies() call.
 
 		Arguments
 		---------
@@ -176,24 +284,8 @@ class DRAKONIsingModel(Ising):
 			The name of the heat capacity change parameter to use in the van't Hoff correction.
 		"""
 		
-		if dH in self.params:
-			dH = self.get_param(dH,units="J")
-		else:
-			for p in self.params:
-				dH = dH.replace(p,"self.get_param('%s',units='J')"%p)
-			dH = eval(dH)
-
-		if dCp in self.params:
-			dCp = self.get_param(dCp,units="J")
-		elif dCp is None:
-			pass
-		else:
-			for p in self.params:
-				dCp = dCp.replace(p,"self.get_param('%s',units='J')"%p)
-			dCp = eval(dCp)
-		
-		if dCp==None:
-			self.enthalpies[i] += dH
+		if self._recording is None:
+			self.enthalpies[i] += self._get_dH( dH, dCp )
 		else:
-			self.enthalpies[i] += dH_vant_Hoff( dH, dCp, self._T, self._T0 )
+			self._recording[1].append( (i,(dH,dCp)) )
 		
@@ -3,9 +3,7 @@
 
 """
 
-import warnings
-import math
-import scipy.optimize
+import numpy
 
 from .itc_model	import ITCModel
 from .thermo	import *
@@ -30,24 +28,110 @@ class OneMode(ITCModel):
 	def Q(self,T0,T,concentrations):
 		"""Returns the total binding heat at each injection predicted by the model and its current parameter values. See parent model for information."""
 
-		n1,Ka,dH = (
-			self.params['n'],
-			1.0/Kd_from_dG( dG_vant_Hoff( self.params['dG'], self.params['dH'], self.params['dCp'], T, T0 ), T),
-			dH_vant_Hoff( self.params['dH'], self.params['dCp'], T, T0 )
+		M,L = self._get_totals(concentrations)
+		return one_mode_Q( self.params['n'], self.params['dG'], self.params['dH'], self.params['dCp'], T, T0, M, L ).tolist()
+
+	_Q = Q # the Q() that Q_batch() and Q_stack() stand in for
+
+	def Q_batch(self,T0,T,concentrations,param_sets):
+		"""Returns the total binding heat at each injection for several sets of model parameter values, evaluated together (or with Q() for each parameter set, if Q() has been replaced). See parent model for information."""
+
+		if type(self).Q is not OneMode._Q:
+			return ITCModel.Q_batch(self,T0,T,concentrations,param_sets)
+
+		param_sets = numpy.atleast_2d(param_sets)
+		n,dG,dH,dCp = ( param_sets[:,self.params.indices(('n','dG','dH','dCp'))] * self._get_scales()[self.params.indices(('n','dG','dH','dCp'))] ).T[:,:,None]
+
+		M,L = self._get_totals(concentrations)
+		ret = one_mode_Q( n, dG, dH, dCp, T, T0, M, L )
+
+		self.set_vector(param_sets[-1])
+		return ret.tolist()
+
+	def Q_stack(self,T0,T,concentrations):
+		"""Returns the total binding heat at each injection of several experiments, evaluated together.
+
+		Arguments
+		---------
+		T0 : float
+			The reference temperature to be used for the model.
+		T : list of floats
+			The temperature of each titration.
+		concentrations : list of lists of dicts
+			The concentration of components at each injection point, for each titration.
+
+		Returns
+		-------
+		list of lists of floats
+			The total heat in the system at each injection point of each titration.
+
+		Notes
+		-----
+			If Q() has been replaced (by a child class or otherwise), it is called for each titration instead.
+		"""
+
+		if type(self).Q is not OneMode._Q:
+			return [ self.Q(T0,t,c) for t,c in zip(T,concentrations) ]
+
+		sizes = [len(c) for c in concentrations]
+		M,L = self._get_totals([c for experiment in concentrations for c in experiment])
+		Q = one_mode_Q( self.params['n'], self.params['dG'], self.params['dH'], self.params['dCp'], numpy.repeat(T,sizes), T0, M, L )
+		return [q.tolist() for q in numpy.split(Q,numpy.cumsum(sizes)[:-1])]
+
+	def _get_totals(self,concentrations):
+		# the total macromolecule and ligand concentrations at each injection, as arrays
+		return (
+			numpy.fromiter((c['Macromolecule'] for c in concentrations),dtype='d',count=len(concentrations)),
+			numpy.fromiter((c['Ligand'] for c in concentrations),dtype='d',count=len(concentrations))
 		)
 
-		Q = [0.0]*len(concentrations)
-		for i,c in enumerate(concentrations):
-			Q[i] = ((n1*dH)/2.0)*(1.0 +(c['Ligand']/(n1*c['Macromolecule'])) +(1.0/(n1*Ka*c['Macromolecule'])) -math.sqrt( math.pow(1 +(c['Ligand']/(n1*c['Macromolecule'])) +(1.0/(n1*Ka*c['Macromolecule'])), 2.0) -((4.0*c['Ligand'])/(n1*c['Macromolecule']))))
-		return Q
+def one_mode_Q(n,dG,dH,dCp,T,T0,M,L):
+	"""Return the single site-type binding heat at each of the provided total concentrations.
+
+	Arguments
+	---------
+	n : float or array of floats
+		The number of binding sites per macromolecule.
+	dG : float or array of floats
+		The free energy change upon binding at the reference temperature, in Joules.
+	dH : float or array of floats
+		The enthalpy change upon binding at the reference temperature, in Joules.
+	dCp : float or array of floats
+		The heat capacity change upon binding, in Joules.
+	T : float or array of floats
+		The temperature of the titration.
+	T0 : float
+		The reference temperature.
+	M : array of floats
+		The total macromolecule concentration.
+	L : array of floats
+		The total ligand concentration.
+
+	Returns
+	-------
+	ndarray
+		The total binding heat per mol of macromolecule, broadcast over all the arguments.
+	"""
+	Ka	= 1.0/Kd_from_dG( dG_vant_Hoff( dG, dH, dCp, T, T0 ), T)
+	dH	= dH_vant_Hoff( dH, dCp, T, T0 )
+
+	a	= L/(n*M)
+	b	= 1.0 +a +(1.0/(n*Ka*M))
+	return ((n*dH)/2.0)*(b -numpy.sqrt( b*b -4.0*a ))
 
 class NModes(ITCModel):
-	"""A 4n-parameter phenomological model describing binding to n independent types of sites."""
+	"""A 4n-parameter phenomological model describing binding to n independent types of sites.
+
+	Attributes
+	----------
+	precision : float
+		The relative tolerance of the free ligand concentration at each injection.
+	"""
 
 	def __init__(self,modes=2, *args, **kwargs):
 		ITCModel.__init__(self, *args, **kwargs)
 		self.nmodes = modes
-		self.precision = 1E-9
+		self.precision = 1E-12
 
 		if self.lattice_name is None:
 			self.add_component('Macromolecule')
@@ -63,28 +147,134 @@ class NModes(ITCModel):
 	def Q(self,T0,T,concentrations):
 		"""Returns the total binding heat at each injection predicted by the model and its current parameter values. See parent model for information."""
 
-		n,p = len(concentrations),[None]*(self.nmodes*3)
-		for i in range(self.nmodes):
-			dG,dH,dCp	= 'dG'+str(i+1),'dH'+str(i+1),'dCp'+str(i+1)
-			p[i*3 +0]	= self.params['n'+str(i+1)]
-			p[i*3 +1]	= 1.0/Kd_from_dG( dG_vant_Hoff( self.params[dG], self.params[dH], self.params[dCp], T, T0 ), T)
-			p[i*3 +2]	= dH_vant_Hoff( self.params[dH], self.params[dCp], T, T0 )
-			
-			if min(self.precision,0.01/p[i*3 +1]) < self.precision:
-				warnings.warn( "Convergence precision is greater than 1%% of mode %i Kd (%0.1E). Setting precision to %0.0E."%(i+1,1.0/p[i*3 +1],10**int(-1*math.log10(p[i*3 +1]) -3)), stacklevel=8 )
-				self.precision = 10**int(-1*math.log10(p[i*3 +1]) -3)
-
-		def _get_free(Lfree,Ltot,Ptot):
-			Lbound = 0.0
-			for i in range(self.nmodes):
-				stoich,Ka,dH = p[i*3:i*3+3]
-				Lbound += stoich * Ptot * (Ka*Lfree)/(Ka*Lfree +1)
-			return Ltot -Lbound -Lfree
-
-		Q = [0.0]*n
-		for j,c in enumerate(concentrations):
-			Lfree = scipy.optimize.brentq( _get_free, 0.0, c['Ligand'], args=(c['Ligand'],c['Macromolecule']), xtol=self.precision, disp=True )
-			for i in range(self.nmodes):
-				stoich,Ka,dH = p[i*3:i*3+3]
-				Q[j] +=( stoich * dH * (Ka*Lfree)/(Ka*Lfree +1) )
-		return Q
+		return self._get_Q( T0, T, concentrations, self.params.values ).tolist()
+
+	_Q = Q # the Q() that Q_batch() stands in for
+
+	def Q_batch(self,T0,T,concentrations,param_sets):
+		"""Returns the total binding heat at each injection for several sets of model parameter values, evaluated together (or with Q() for each parameter set, if Q() has been replaced). See parent model for information."""
+
+		if type(self).Q is not NModes._Q:
+			return ITCModel.Q_batch(self,T0,T,concentrations,param_sets)
+
+		param_sets = numpy.atleast_2d(param_sets)
+		ret = self._get_Q( T0, T, concentrations, param_sets * self._get_scales() )
+
+		self.set_vector(param_sets[-1])
+		return ret.tolist()
+
+	def _get_Q(self,T0,T,concentrations,values):
+		# the binding heat at each injection (last axis) for the provided internal parameter values (leading axes)
+
+		# correct the parameters of all modes at once
+		modes = ["%i"%(i+1) for i in range(self.nmodes)]
+		stoich,dG,dH,dCp = [ values[...,None,self.params.indices([p+m for m in modes])] for p in ('n','dG','dH','dCp') ]
+		Ka	= 1.0/Kd_from_dG( dG_vant_Hoff( dG, dH, dCp, T, T0 ), T)
+		dH	= dH_vant_Hoff( dH, dCp, T, T0 )
+
+		M = numpy.array([c['Macromolecule'] for c in concentrations],dtype='d')
+		L = numpy.array([c['Ligand'] for c in concentrations],dtype='d')
+		Lfree = get_free_ligand( stoich, Ka, M, L, rtol=self.precision )[...,None]
+
+		return numpy.sum( stoich * dH * (Ka*Lfree)/(Ka*Lfree +1), axis=-1 )
+
+def get_free_ligand(n,Ka,M,L,rtol=1E-12,maxiter=100):
+	"""Return the free ligand concentration for binding to several types of independent sites.
+
+	Arguments
+	---------
+	n : array of floats
+		The number of binding sites of each type per macromolecule, along the last axis.
+	Ka : array of floats
+		The association constant of each type of site, along the last axis.
+	M : array of floats
+		The total macromolecule concentration.
+	L : array of floats
+		The total ligand concentration.
+	rtol : float
+		The relative tolerance of the returned free ligand concentrations.
+	maxiter : int
+		The maximum number of Newton iterations.
+
+	Returns
+	-------
+	ndarray
+		The free ligand concentration, broadcast over the leading axes of n and Ka and the axes of M and L.
+
+	Notes
+	-----
+		The free ligand fraction u = Lfree/L is the root in [0,1] of g(u) = 1 -u -sum( c*K*u/(1+K*u) ), where c = n*M/L and K = Ka*L.
+		For up to three types of sites, the root is first estimated from the eigenvalues of the companion matrix of the equivalent polynomial (of degree 2 to 4). The estimate (or u=0 otherwise) is then refined by Newton's method, which as g(u) is convex and decreasing converges monotonically, with bisection as a safeguard.
+	"""
+	shape = numpy.broadcast_shapes( numpy.shape(n)[:-1], numpy.shape(Ka)[:-1], numpy.shape(M), numpy.shape(L) )
+	nmodes = max(numpy.shape(n)[-1],numpy.shape(Ka)[-1])
+	M,L = numpy.broadcast_to(M,shape),numpy.broadcast_to(L,shape)
+
+	Lfree = numpy.zeros(shape)
+	mask = L > 0
+	c = numpy.broadcast_to(n,shape+(nmodes,))[mask] * (M[mask]/L[mask])[:,None]
+	K = numpy.broadcast_to(Ka,shape+(nmodes,))[mask] * L[mask][:,None]
+
+	if nmodes <= 3:
+		u = _get_free_fraction_roots(c,K)
+	else:
+		u = numpy.zeros(len(c))
+
+	Lfree[mask] = _get_free_fraction_newton(c,K,u,rtol,maxiter) * L[mask]
+	return Lfree
+
+def _get_free_fraction_residual(c,K,u):
+	# g(u) and its derivative
+	Ku = K*u[...,None]
+	return 1.0 -u -numpy.sum(c*Ku/(1.0+Ku),axis=-1), -1.0 -numpy.sum(c*K/(1.0+Ku)**2,axis=-1)
+
+def _get_free_fraction_roots(c,K):
+	# estimate u from the roots of (u-1)*prod(1+K*u) +u*sum(c*K*prod_(j!=i)(1+K_j*u)), with coefficients in ascending order
+	m,nmodes = K.shape
+	def _linear_product(modes):
+		ret = numpy.ones((m,1))
+		for i in modes:
+			ret = numpy.concatenate((ret,numpy.zeros((m,1))),axis=1) + numpy.concatenate((numpy.zeros((m,1)),ret*K[:,i,None]),axis=1)
+		return ret
+
+	full = _linear_product(range(nmodes))
+	poly = numpy.zeros((m,nmodes+2))
+	poly[:,1:] += full
+	poly[:,:-1] -= full
+	for i in range(nmodes):
+		poly[:,1:-1] += (c[:,i]*K[:,i])[:,None] * _linear_product([j for j in range(nmodes) if j != i])
+
+	# batched companion matrices of the monic polynomials
+	companion = numpy.zeros((m,nmodes+1,nmodes+1))
+	companion[:,numpy.arange(1,nmodes+1),numpy.arange(nmodes)] = 1.0
+	companion[:,:,-1] = -poly[:,:-1] / poly[:,-1:]
+
+	# the candidate root with the smallest residual
+	candidates = numpy.clip( numpy.linalg.eigvals(companion).real, 0.0, 1.0 )
+	residuals = numpy.abs( _get_free_fraction_residual(c[:,None,:],K[:,None,:],candidates)[0] )
+	return candidates[numpy.arange(m),numpy.argmin(residuals,axis=1)]
+
+def _get_free_fraction_newton(c,K,u,rtol,maxiter):
+	# refine u in [0,1] by safeguarded Newton iterations, only updating the unconverged fractions
+	u = numpy.array(u,dtype='d')
+	lo,hi = numpy.zeros(len(u)),numpy.ones(len(u))
+	active = numpy.arange(len(u))
+
+	for i in range(maxiter):
+		if len(active) == 0:
+			return u
+
+		g,dg = _get_free_fraction_residual(c[active],K[active],u[active])
+		lo[active] = numpy.where(g > 0, u[active], lo[active])
+		hi[active] = numpy.where(g > 0, hi[active], u[active])
+
+		step = u[active] -g/dg
+		step = numpy.where( (step < lo[active]) | (step > hi[active]), 0.5*(lo[active]+hi[active]), step )
+
+		converged = (g == 0) | (numpy.abs(step -u[active]) <= rtol*step)
+		u[active] = step
+		active = active[~converged]
+
+	if len(active) > 0:
+		raise Exception("Free ligand concentration did not converge within %i iterations."%(maxiter))
+	return u
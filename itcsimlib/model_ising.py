@@ -3,7 +3,11 @@
 
 """
 
+import os
 import sys
+import glob
+import ctypes
+import threading
 import numpy
 import scipy.optimize
 import sympy
@@ -12,10 +16,28 @@ import pyx
 from collections import OrderedDict
 
 from .itc_model	import ITCModel
+from .model_trap	import get_free_fraction
 from .thermo	import _R
 from .thermo	import *
 
 
+def _load_kernel():
+	# load the generic compiled Ising kernel (if it has been built), and declare its function signatures
+	match = glob.glob( os.path.join( os.path.dirname(__file__), 'model_ising_table*.so' ) )
+	if len(match) != 1:
+		raise ImportError("Could not find the compiled Ising kernel \"model_ising_table.so\".")
+
+	lib = ctypes.CDLL(match[0])
+	lib.setup.argtypes = [ctypes.c_int, ctypes.c_int]
+	lib.setup.restype = ctypes.c_void_p
+	lib.set_precision.argtypes = [ctypes.c_void_p, ctypes.c_double]
+	lib.set_precision.restype = ctypes.c_int
+	lib.calc_batch.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p]
+	lib.calc_batch.restype = ctypes.c_int
+	lib.close.argtypes = [ctypes.c_void_p]
+	lib.close.restype = ctypes.c_int
+	return lib
+
 class Ising(ITCModel):
 	"""An model based on ligand binding to an Ising lattice.
 	
@@ -38,10 +60,26 @@ class Ising(ITCModel):
 	parameter_symbols : dict of sympy symbols
 		Convenience container for the sympy symbols corresponding to the model parameter names, ultimately used to construct the symbolic configuration expressions.
 	config_expressions : list of sympy expressions
-		The symbolic expression of the configuration's free energy.
+		The symbolic expression of the configuration's free energy, built on first use (see set_config_expressions()).
+	site_rules : dict of tuples
+		The number of times each term of get_site_energies() is counted for a site, keyed by the occupancy (0 or 1) of the (previous, same, next) sites. Contexts that are not listed contribute nothing.
+	site_parameters : tuple of strings
+		The name of the free energy parameter of each term of the site rules, used to build config_expressions.
+	native : boolean
+		Whether the model is evaluated by the generic compiled kernel (see Notes).
+
+	Notes
+	-----
+		Models that describe their energies with site_rules and get_site_energies() (such as FullAdditive, HalfAdditive and NonAdditive) are evaluated by a generic compiled kernel if it has been built (see setup.py). The kernel solves for the free ligand to within the precision attribute (and a relative precision of 1E-12).
+		The rules only stand in for the set_energies() of the class that defines them, so a subclass that overrides set_energies() or set_probabilities() is evaluated in Python.
+		As in Python, Q() and Q_batch() leave the gibbs and enthalpies attributes at the (last) parameter values, and the weights at the last concentration point.
 	"""
-		
-	def __init__(self,nsites=3,circular=True,*args,**kwargs):
+
+	site_rules = None
+	site_parameters = None
+	_kernel = None # the compiled kernel, once loaded by this process
+
+	def __init__(self,nsites=3,circular=True,*args,native=None,**kwargs):
 		"""The constructor for the base Ising binding model.
 		
 		Arguments
@@ -50,6 +88,8 @@ class Ising(ITCModel):
 			The number of potential binding sites in the lattice.
 		circular : boolean
 			Is the lattice circular?
+		native : boolean
+			Evaluate the model with the compiled kernel (True), or in Python (False). If None, the kernel is used if it has been built and the model provides site rules.
 		"""
 		ITCModel.__init__(self,*args,**kwargs)
 		
@@ -64,7 +104,8 @@ class Ising(ITCModel):
 		self.precision	= 1E-12 # the precision in ligand concentration required for convergence during set_probabilities()
 		
 		self.parameter_symbols = {} # model parameters used during partition function generation
-		self.config_expressions = [ 0 for i in range(self.nconfigs) ] # expressions of configuration free energies using the parameter symbols
+		self._config_expressions = None # expressions of configuration free energies using the parameter symbols, see set_config_expressions()
+		self._config_counts = None # the number of times each term of the site rules is counted for each configuration, see _get_config_counts()
 		
 		if self.lattice_name is None:
 			self.lattice_name = "Lattice"
@@ -78,6 +119,167 @@ class Ising(ITCModel):
 
 		self.add_component(self.ligand_name, description='A lattice-binding ligand')
 
+		self._handles = {}
+		rules = self._has_site_rules() and type(self).set_probabilities is Ising.set_probabilities
+		if native is None:
+			native = rules and len(glob.glob( os.path.join( os.path.dirname(__file__), 'model_ising_table*.so' ) )) == 1
+		if native and not rules:
+			raise Exception("The model does not provide site rules for the compiled kernel.")
+		self.native = native
+		if self.native and Ising._kernel is None:
+			Ising._kernel = _load_kernel()
+
+	def __getstate__(self):
+		"""Return the state of the model for pickling, without the workspaces of the compiled kernel."""
+		state = self.__dict__.copy()
+		state['_handles'] = {}
+		return state
+
+	def _has_site_rules(self):
+		# the site rules only stand in for the set_energies() of the class that defines them
+		owner = [cls for cls in type(self).__mro__ if 'site_rules' in cls.__dict__][0]
+		return owner.site_rules is not None and owner.__dict__.get('set_energies') is type(self).set_energies
+
+	def _get_site_table(self):
+		# the site rules as a table of the counts of each term (columns), for each site context (rows, indexed as 4*previous +2*site +next)
+		table = numpy.zeros((8,len(next(iter(self.site_rules.values())))))
+		for (previous,site,next_site),counts in self.site_rules.items():
+			table[(4*previous) +(2*site) +next_site] = counts
+		return table
+
+	def _get_config_counts(self):
+		# the number of times each term of the site rules is counted for each configuration (rows), from the context of each of its sites
+		if self._config_counts is None:
+			configs = numpy.array(self.configs)
+			previous,next_site = numpy.roll(configs,1,axis=1),numpy.roll(configs,-1,axis=1)
+			if not self.circular:
+				previous[:,0],next_site[:,-1] = 0,0
+			self._config_counts = numpy.sum( self._get_site_table()[(4*previous) +(2*configs) +next_site], axis=1 )
+		return self._config_counts
+
+	def _get_handle(self):
+		# each thread evaluates the model in its own workspace of the compiled kernel
+		thread = threading.get_ident()
+		if thread not in self._handles:
+			handle = Ising._kernel.setup(self.nsites,int(self.circular))
+			if not handle:
+				raise Exception("The compiled kernel could not allocate a model workspace.")
+			self._handles[thread] = handle
+		return self._handles[thread]
+
+	def stop(self):
+		"""Frees the workspaces allocated by the compiled kernel."""
+		for handle in self._handles.values():
+			Ising._kernel.close(handle)
+		self._handles.clear() # in place, as it may be shared with an MSModel wrapper
+
+	def get_site_energies(self,T0,T,params=None):
+		"""Return the temperature-corrected free energies and enthalpies of the terms counted by the site rules. Implemented by child classes that provide site_rules.
+
+		Arguments
+		---------
+		T0 : float
+			The reference temperature.
+		T : float
+			The experimental temperature (in Kelvin)
+		params : dict of floats or arrays
+			The (internal) model parameter values to use, keyed by name. If omitted, the current parameter values are used.
+
+		Returns
+		-------
+		tuple of two tuples of floats or arrays
+			The free energies and enthalpies of each term, in the order of the counts in site_rules.
+		"""
+		raise NotImplementedError
+
+	def _calc(self,T0,T,concentrations,params=None):
+		# evaluate the model with the compiled kernel, returning the heats of each parameter set (rows) at each point (columns)
+		gibbs,enthalpies = self.get_site_energies(T0,T,params)
+		terms = numpy.atleast_2d( numpy.stack(numpy.broadcast_arrays(*(gibbs+enthalpies)),axis=-1) )
+		nsets,nterms = len(terms),len(gibbs)
+		table = self._get_site_table()
+
+		# the kernel's parameters are the number of terms, the table of counts, and the free energies and enthalpies of the terms
+		params = numpy.ascontiguousarray( numpy.hstack((numpy.full((nsets,1),nterms),numpy.tile(table.ravel(),(nsets,1)),terms)), numpy.dtype('d') )
+		offsets = numpy.array([0,len(concentrations)],numpy.intc)
+		temps = numpy.array([T],numpy.dtype('d'))
+		P = numpy.array([c[self.lattice_name] for c in concentrations],numpy.dtype('d'))
+		L = numpy.array([c[self.ligand_name] for c in concentrations],numpy.dtype('d'))
+		Q = numpy.zeros((nsets,len(concentrations)),numpy.dtype('d'))
+
+		handle = self._get_handle()
+		Ising._kernel.set_precision( handle, self.precision )
+		status = Ising._kernel.calc_batch( handle, 1, offsets.ctypes.data, temps.ctypes.data, P.ctypes.data, L.ctypes.data, nsets, params.shape[1], params.ctypes.data, Q.ctypes.data )
+		if status != 0:
+			raise Exception("The compiled kernel returned a non-zero error code: %i"%(status))
+
+		return Q
+
+	def _set_state(self,T0,T,concentrations):
+		# set the gibbs, enthalpies and weights attributes after a native evaluation, as set_energies() and set_probabilities() (at the last point) would
+		gibbs,enthalpies = self.get_site_energies(T0,T)
+		counts = self._get_config_counts()
+		self.gibbs = numpy.dot(counts,numpy.array(gibbs,dtype=float)).tolist()
+		self.enthalpies = numpy.dot(counts,numpy.array(enthalpies,dtype=float)).tolist()
+		if len(concentrations) == 0:
+			return
+
+		totalP,totalL = concentrations[-1][self.lattice_name],concentrations[-1][self.ligand_name]
+		bound = numpy.array(self.bound)
+		if totalL <= 0:
+			self.weights = (bound == 0).astype(float).tolist()
+			return
+
+		# the Boltzmann factor sums of each stoichiometry (as logarithms) give the binding polynomial in the free ligand fraction
+		logw = -numpy.array(self.gibbs) / (_R * T)
+		wmax = numpy.full(self.nsites+1,-numpy.inf)
+		numpy.maximum.at(wmax,bound,logw)
+		stoich = numpy.arange(self.nsites+1)
+		logZ = numpy.log(numpy.bincount(bound,weights=numpy.exp(logw -wmax[bound]),minlength=self.nsites+1)) +wmax +(stoich*numpy.log(totalL))
+		x = get_free_fraction(numpy.exp(logZ -numpy.max(logZ)),totalP/totalL)
+
+		logw += bound * numpy.log(x*totalL)
+		weights = numpy.exp(logw -numpy.max(logw))
+		self.weights = (weights / numpy.sum(weights)).tolist()
+
+	@property
+	def config_expressions(self):
+		if self._config_expressions is None:
+			self._config_expressions = [ 0 for i in range(self.nconfigs) ]
+			self.set_config_expressions()
+		return self._config_expressions
+
+	@config_expressions.setter
+	def config_expressions(self, expressions):
+		self._config_expressions = expressions
+
+	def set_config_expressions(self):
+		"""Set the symbolic free energy expression of each configuration. This is called once, when config_expressions is first used.
+
+		Arguments
+		---------
+		None
+
+		Returns
+		-------
+		None
+
+		Notes
+		-----
+			Models with site rules build the expressions from the rules and their site_parameters. For other models, set_energies() is run once (preserving the configuration energies), as such models are expected to set config_expressions there.
+		"""
+
+		if not self._has_site_rules():
+			gibbs,enthalpies = list(self.gibbs),list(self.enthalpies)
+			self.set_energies(273.15,273.15)
+			self.gibbs,self.enthalpies = gibbs,enthalpies
+			return
+
+		counts = self._get_config_counts()
+		symbols = [self.parameter_symbols[name] for name in self.site_parameters]
+		for i in range(self.nconfigs):
+			self.config_expressions[i] = sum( int(n)*symbol for n,symbol in zip(counts[i],symbols) if n )
+
 	def add_parameter(self, name, type, **kwargs):
 		"""Wrapper for the typical ITC model add_parameter, with the added tweak that a sympy symbol is created for eventually generating the model's partition function."""
 		ITCModel.add_parameter(self, name, type, **kwargs)
@@ -168,7 +370,11 @@ class Ising(ITCModel):
 		list of floats
 			The total enthalpy of the system at each injection point.
 		"""
-		
+		if self.native:
+			Q = self._calc(T0,T,concentrations)[0].tolist()
+			self._set_state(T0,T,concentrations)
+			return Q
+
 		# set the free energies (and enthalpic energies if necessary) of each configuration
 		self.set_energies(T0,T)
 
@@ -182,6 +388,68 @@ class Ising(ITCModel):
 			Q[i] = sum( [self.weights[j] * self.enthalpies[j] for j in range(self.nconfigs)] )
 
 		return Q
+
+	_Q = Q # the Q() that Q_batch() stands in for
+
+	def Q_batch(self,T0,T,concentrations,param_sets):
+		"""Return the enthalpy of the system at each of the specified component concentrations, for several sets of parameter values.
+
+		Arguments
+		---------
+		T0 : float
+			The reference temperature of the simulation.
+		T : float
+			The temperature of the experiment to simulate.
+		concentrations : list of dicts
+			The concentrations of each component at each titration point.
+		param_sets : 2D array of floats
+			The parameter vectors (in the current model units, see get_vector()) to evaluate, one per row.
+
+		Returns
+		-------
+		list of lists of floats
+			The total enthalpy of the system at each injection point, for each of the parameter sets.
+
+		Notes
+		-----
+			The configuration probabilities depend only on the configuration free energies, so they are determined once for all parameter sets that share them (e.g. those differing only in enthalpies at the reference temperature).
+			If Q() has been replaced (by a child class or otherwise), it is called for each parameter set instead.
+			The model is left with the values of the last parameter set.
+		"""
+		if type(self).Q is not Ising._Q:
+			return ITCModel.Q_batch(self,T0,T,concentrations,param_sets)
+
+		if self.native:
+			param_sets = numpy.atleast_2d(param_sets)
+			values = param_sets * self._get_scales()
+			ret = self._calc(T0,T,concentrations,dict( (name,values[:,i]) for i,name in enumerate(self.get_param_names()) ))
+			self.set_vector(param_sets[-1])
+			self._set_state(T0,T,concentrations)
+			return ret.tolist()
+
+		# group the parameter sets by their configuration free energies
+		groups,enthalpies = OrderedDict(),[]
+		for j,vector in enumerate(param_sets):
+			self.set_vector(vector)
+			self.set_energies(T0,T)
+			groups.setdefault( tuple(self.gibbs), [] ).append(j)
+			enthalpies.append( list(self.enthalpies) )
+
+		ret = [None]*len(param_sets)
+		weights = numpy.zeros((len(concentrations),self.nconfigs))
+		for gibbs,members in groups.items():
+			self.gibbs = list(gibbs)
+			for i,c in enumerate(concentrations):
+				self.set_probabilities(c[self.lattice_name],c[self.ligand_name],T)
+				weights[i] = self.weights
+
+			for j in members:
+				ret[j] = list( numpy.dot(weights,enthalpies[j]) )
+
+		# leave the model energies consistent with the last parameter set
+		self.set_energies(T0,T)
+
+		return ret
 			
 	def get_partition_function(self, substitute_Ks=True, full_simplify=True):
 		"""Return the partition function of the binding model as a sympy expression.
@@ -199,8 +467,6 @@ class Ising(ITCModel):
 			The symbolic partition function for the model.
 		"""
 
-		self.set_energies(273.15,273.15) # ensure that this is run at least once to populate config_terms
-
 		L,R,T = sympy.symbols("L R T") # ligand, gas constant, temp
 				
 		config_expressions = [ None for i in range(self.nconfigs) ] # convert all configuration free energies to effective K(a)s
@@ -347,6 +613,10 @@ class Ising(ITCModel):
 class FullAdditive(Ising):
 	"""An Ising-type model, in which ligands bind to either a linear or circular lattice. Coupling can occur to both unoccupied and occupied lattice points."""
 
+	# intrinsic, coupling to an unoccupied site, coupling to an occupied site (coupling to the previous site is only counted if it is unoccupied)
+	site_rules = {(0,1,0):(1,2,0), (0,1,1):(1,1,1), (1,1,0):(1,1,0), (1,1,1):(1,0,1)}
+	site_parameters = ('dG0','dGa','dGb')
+
 	def __init__(self,nsites=3,circular=1,*args,**kwargs):
 		Ising.__init__(self,nsites,circular,*args,**kwargs)
 		
@@ -372,24 +642,20 @@ class FullAdditive(Ising):
 		
 		for i in range(self.nconfigs):
 			self.gibbs[i],self.enthalpies[i] = 0.0,0.0
-			self.config_expressions[i] = 0
 			
 			for j in range(self.nsites):
 
 				if self.get_site_occupancy(i,j): # is site occupied?
 					self.gibbs[i]+=dG0
 					self.enthalpies[i]+=dH0
-					self.config_expressions[i] += self.parameter_symbols['dG0']
 					
 					if self.get_site_occupancy(i,j+1): # is the next neighboring site occupied?
 						self.gibbs[i]+=dGb
 						self.enthalpies[i]+=dGb
-						self.config_expressions[i] += self.parameter_symbols['dGb']
 
 					else:
 						self.gibbs[i]+=dGa
 						self.enthalpies[i]+=dGa
-						self.config_expressions[i] += self.parameter_symbols['dGa']
 					
 					if self.get_site_occupancy(i,j-1): # is previous neighboring site occupied?
 						pass # Note: this avoids double counting, and thus is implemented as in Saroff & Kiefer
@@ -397,12 +663,25 @@ class FullAdditive(Ising):
 					else:
 						self.gibbs[i]+=dGa
 						self.enthalpies[i]+=dGa
-						self.config_expressions[i] += self.parameter_symbols['dGa']
 		return
 
+	def get_site_energies(self,T0,T,params=None):
+		"""Returns the temperature-corrected energies of the site rules. See parent model for information."""
+		p = self.params if params is None else params
+		dGa = dG_vant_Hoff( p['dGa'], p['dHa'], p['dCpa'], T, T0 )
+		dGb = dG_vant_Hoff( p['dGb'], p['dHb'], p['dCpb'], T, T0 )
+		return (
+			(dG_vant_Hoff( p['dG0'], p['dH0'], p['dCp0'], T, T0 ), dGa, dGb),
+			(dH_vant_Hoff( p['dH0'], p['dCp0'], T, T0 ), dGa, dGb) # as in set_energies(), the coupling free energies are added to the enthalpies
+			)
+
 class HalfAdditive(Ising):
 	"""An Ising-type model, in which ligands bind to either a linear or circular lattice. Coupling only occurs between occupied lattice points."""
 
+	# intrinsic, coupling to an occupied next site
+	site_rules = {(0,1,0):(1,0), (0,1,1):(1,1), (1,1,0):(1,0), (1,1,1):(1,1)}
+	site_parameters = ('dG0','dGb')
+
 	def __init__(self,nsites=3,circular=1,*args,**kwargs):
 		Ising.__init__(self,nsites,circular,*args,**kwargs)
 		
@@ -423,24 +702,34 @@ class HalfAdditive(Ising):
 		
 		for i in range(self.nconfigs):
 			self.gibbs[i],self.enthalpies[i] = 0.0,0.0
-			self.config_expressions[i] = 0
 
 			for j in range(self.nsites):
 
 				if self.get_site_occupancy(i,j): # is site occupied?
 					self.gibbs[i]+=dG0
 					self.enthalpies[i]+=dH0
-					self.config_expressions[i] += self.parameter_symbols['dG0']
 					
 					if self.get_site_occupancy(i,j+1): # is the next neighboring site occupied?
 						self.gibbs[i]+=dGb
 						self.enthalpies[i]+=dGb
-						self.config_expressions[i] += self.parameter_symbols['dGb']
 		return
 
+	def get_site_energies(self,T0,T,params=None):
+		"""Returns the temperature-corrected energies of the site rules. See parent model for information."""
+		p = self.params if params is None else params
+		dGb = dG_vant_Hoff( p['dGb'], p['dHb'], p['dCpb'], T, T0 )
+		return (
+			(dG_vant_Hoff( p['dG0'], p['dH0'], p['dCp0'], T, T0 ), dGb),
+			(dH_vant_Hoff( p['dH0'], p['dCp0'], T, T0 ), dGb) # as in set_energies(), the coupling free energy is added to the enthalpies
+			)
+
 class NonAdditive(Ising):
 	"""An Ising-type model, in which ligands bind to either a linear or circular lattice. Binding energy depends upon whether zero, one, or both neighboring sites are occupied."""
 
+	# binding with zero, one, or two occupied neighboring sites
+	site_rules = {(0,1,0):(1,0,0), (0,1,1):(0,1,0), (1,1,0):(0,1,0), (1,1,1):(0,0,1)}
+	site_parameters = ('dGX','dGY','dGZ')
+
 	def __init__(self,nsites=3,circular=1,*args,**kwargs):
 		Ising.__init__(self,nsites,circular,*args,**kwargs)
 		
@@ -466,7 +755,6 @@ class NonAdditive(Ising):
 		
 		for i in range(self.nconfigs):
 			self.gibbs[i],self.enthalpies[i] = 0.0,0.0
-			self.config_expressions[i] = 0
 			
 			for j in range(self.nsites):
 				if self.get_site_occupancy(i,j): # is site occupied?
@@ -475,21 +763,25 @@ class NonAdditive(Ising):
 						if self.get_site_occupancy(i,j-1): # is previous neighboring site occupied?
 							self.gibbs[i]+= dGZ
 							self.enthalpies[i]+= dHZ
-							self.config_expressions[i] += self.parameter_symbols['dGZ']
 							
 						else:
 							self.gibbs[i]+= dGY
 							self.enthalpies[i]+= dHY
-							self.config_expressions[i] += self.parameter_symbols['dGY']
 							
 					elif self.get_site_occupancy(i,j-1):
 						self.gibbs[i]+= dGY
 						self.enthalpies[i]+= dHY
-						self.config_expressions[i] += self.parameter_symbols['dGY']
 						
 					else:
 						self.gibbs[i]+= dGX
 						self.enthalpies[i]+= dHX
-						self.config_expressions[i] += self.parameter_symbols['dGX']
 						
 		return
+
+	def get_site_energies(self,T0,T,params=None):
+		"""Returns the temperature-corrected energies of the site rules. See parent model for information."""
+		p = self.params if params is None else params
+		return (
+			(dG_vant_Hoff( p['dGX'], p['dHX'], p['dCpX'], T, T0 ), dG_vant_Hoff( p['dGY'], p['dHY'], p['dCpY'], T, T0 ), dG_vant_Hoff( p['dGZ'], p['dHZ'], p['dCpZ'], T, T0 )),
+			(dH_vant_Hoff( p['dHX'], p['dCpX'], T, T0 ), dH_vant_Hoff( p['dHY'], p['dCpY'], T, T0 ), dH_vant_Hoff( p['dHZ'], p['dCpZ'], T, T0 ))
+			)
@@ -1,18 +1,115 @@
 """Binding models for the undecameric TRAP + tryptophan system, demonstrating the use of models written in C via DLLs.
 
-Using compiled DLLs typically provides an order-of-magnitude increase or better in execution speed over native Python models.
+Using compiled DLLs typically provides an order-of-magnitude increase or better in execution speed over native Python models. If the shared libraries have not been compiled, the models fall back to a NumPy implementation of the same energy rules.
 
 """
 
 import os
 import glob
 import ctypes
+import threading
 import numpy
 
+from collections import OrderedDict
+
 from .itc_model	import ITCModel
+from .thermo	import _R
 from .thermo	import *
 
 
+# the number of times each library parameter (free energy or enthalpy) is counted for an occupied site, by the occupancy of its two neighbouring sites (none, either one, or both), as in src/model_trap/energies_*.c
+_RULES = {
+	'sk':	((1,2,0),(1,1,1),(1,1,1),(1,0,2)),			# intrinsic, coupling to an unoccupied site, coupling to an occupied site
+	'ik':	((1,0,0),(0,1,0),(0,1,0),(0,0,1)),			# no, one, or two occupied neighbours
+	'nn':	((1,1,0,0),(1,0,1,0),(1,0,1,0),(1,0,0,1)),	# intrinsic, 010, 011 or 110, and 111
+}
+_CLASSES = {} # configuration classes, by rules and number of sites
+
+def get_configuration_classes(rules,nsites):
+	"""Returns the distinct classes of configurations of a circular lattice under a set of energy rules.
+
+	Arguments
+	---------
+	rules : string
+		The energy rules of the shared library ('sk', 'ik', or 'nn').
+	nsites : int
+		The number of sites in the lattice.
+
+	Returns
+	-------
+	bound : array of ints
+		The number of occupied sites of the configurations in each class.
+	incidence : 2D array of floats
+		The number of times each free energy (or enthalpy) parameter is counted in the configurations of each class, one row per class.
+	counts : array of ints
+		The number of configurations in each class.
+
+	Notes
+	-----
+		Configurations with the same stoichiometry and incidence have the same free energy and enthalpy, so the partition function only needs to be summed over classes, of which there are far fewer than the 2^nsites configurations.
+	"""
+	if (rules,nsites) not in _CLASSES:
+		configs = (numpy.arange(2**nsites)[:,None] >> numpy.arange(nsites)) & 1
+		context = (2*numpy.roll(configs,1,axis=1)) +numpy.roll(configs,-1,axis=1)
+		incidence = numpy.einsum( 'ij,ijk->ik', configs, numpy.array(_RULES[rules])[context] )
+
+		rows,counts = numpy.unique( numpy.column_stack((configs.sum(axis=1),incidence)), axis=0, return_counts=True )
+		_CLASSES[(rules,nsites)] = (rows[:,0],rows[:,1:].astype(numpy.dtype('d')),counts)
+	return _CLASSES[(rules,nsites)]
+
+def get_free_fraction(coeffs,ratio,rtol=1E-12,maxiter=1000):
+	"""Returns the fraction of free ligand at which the bound and free ligand balance the total ligand, for the binding polynomial of a lattice at each point.
+
+	Arguments
+	---------
+	coeffs : array of floats
+		The coefficients of the binding polynomial in the free fraction x = Lfree/Ltot (i.e. the partition function of each stoichiometry times Ltot to the power of the stoichiometry), along the last axis.
+	ratio : array of floats
+		The ratio of total lattice to total ligand concentration at each point.
+	rtol : float
+		The relative tolerance in the free fraction.
+	maxiter : int
+		The maximum number of iterations.
+
+	Returns
+	-------
+	array of floats
+		The free fraction of ligand at each point.
+
+	Raises
+	------
+	Exception
+		If the free fraction does not converge at every point.
+
+	Notes
+	-----
+		Solves 1 -x -ratio*N(x)/D(x) = 0 with Newton's method, safeguarded by bisection, at all points at once, where D is the binding polynomial and N/D is the mean stoichiometry (as setFree() in src/model_trap/itc_model.c).
+	"""
+	stoich = numpy.arange(coeffs.shape[-1])
+	ratio = numpy.broadcast_to(ratio,coeffs.shape[:-1])
+	lo,hi,x = numpy.zeros(ratio.shape),numpy.ones(ratio.shape),numpy.full(ratio.shape,0.5)
+	active = numpy.ones(ratio.shape,dtype=bool)
+
+	for i in range(maxiter):
+		terms = coeffs * (x[...,None] ** stoich)
+		D = numpy.sum(terms,axis=-1)
+		nbar = numpy.dot(terms,stoich) / D
+		f = 1.0 -x -(ratio*nbar)
+		slope = -x -(ratio*numpy.sum(terms*((stoich -nbar[...,None])**2),axis=-1)/D) # in log(x), from the variance of the stoichiometry
+
+		lo,hi = numpy.where(f > 0,x,lo),numpy.where(f > 0,hi,x)
+		step = x*numpy.exp(numpy.clip(-f/slope,-50.0,50.0))
+		converged = (f == 0) | (numpy.abs(step -x) <= rtol*step) # a converged Newton step may fall on the end of the bracket
+		step = numpy.where(converged | ((step > lo) & (step < hi)),step,numpy.where(lo > 0,numpy.sqrt(lo*hi),0.5*hi)) # or bisection in log(x) once bracketed
+		converged |= ((hi -lo) <= rtol*step)
+		x = numpy.where(active & (f != 0),step,x)
+		active &= ~converged
+		if not numpy.any(active):
+			return x
+
+	raise Exception("The free ligand concentration did not converge.")
+
+
 class TRAP_DLL_Model(ITCModel):
 	"""A model that uses a shared object library to calculate evolved heats for the TRAP + Tryptophan system.
 
@@ -20,20 +117,49 @@ class TRAP_DLL_Model(ITCModel):
 	----------
 	libpath : string
 		A globbable path to the dll, relative to the directory this module is present in. 
+	rules : string
+		The energy rules of the dll ('sk', 'ik', or 'nn', see src/model_trap/energies_*.c), used by the NumPy implementation.
+	native : boolean
+		Whether the model is evaluated by the shared library (True), or by the NumPy implementation of its energy rules (False).
+	buffers : integer
+		The maximum number of experiments (or stacks of experiments) whose concentration and heat buffers are kept by each thread.
+
+	Notes
+	-----
+		Each shared library is only loaded once per process. The library allocates a separate workspace (handle) for each thread that evaluates the model, and the global interpreter lock is released during library calls, so that several threads may evaluate TRAP models concurrently.
+
+		The NumPy implementation sums the partition function of each stoichiometry over classes of equivalent configurations (see get_configuration_classes()), and solves for the free ligand at all injections at once, so is within a small factor of the speed of the shared library.
+
+		The concentrations of each experiment are packed into contiguous arrays, and the buffers allocated for them (for the parameters and heats) are kept and passed to the library directly on subsequent calls. The buffers are identified by the key of each experiment's concentrations (see ConcentrationList), so that copies of an experiment (e.g. unpickled by simulator workers) share them, and concentrations that are changed (and so given a new key) are packed again.
 	"""
 
 	libpath = None
+	rules = None
+	buffers = 32
+	_libraries = {} # shared libraries loaded by this process, by path
+
+	def __init__(self,native=None):
+		"""The constructor for the TRAP models.
 
-	def __init__(self):
+		Arguments
+		---------
+		native : boolean
+			Use the compiled shared library (True), or the NumPy implementation of its energy rules (False). If None, the shared library is used if it has been compiled.
+		"""
 		ITCModel.__init__(self)
 		
 		self.nsites,self.circular = 11,1
 
 		match = glob.glob( os.path.join( os.path.dirname(__file__), self.libpath ) )
-		if len(match) == 0 or len(match) > 1:
-			raise ImportError("Could not import shared library path at \"%s\"."%self._path)
-		self._path = match[0]
+		if native is None:
+			native = (len(match) == 1)
+		if native and (len(match) == 0 or len(match) > 1):
+			raise ImportError("Could not import shared library path at \"%s\"."%self.libpath)
+		self.native = native
+		self._path = match[0] if native else None
 		self._lib = None
+		self._handles = {}
+		self._buffers = {}
 
 		# Dry run to attempt to load the library.
 		self.start()
@@ -42,23 +168,173 @@ class TRAP_DLL_Model(ITCModel):
 		self.add_component('TRAP',description='An %i-site circular lattice of tryptophan binding sites'%(self.nsites))
 		self.add_component('Trp',description='A molecule of tryptophan')
 
+	def __getstate__(self):
+		"""Return the state of the model for pickling, without the loaded shared library or its workspaces (which are recreated by start())."""
+		state = self.__dict__.copy()
+		state['_lib'] = None
+		state['_handles'] = {}
+		state['_buffers'] = {}
+		return state
+
 	def start(self):
-		"""Loads the specified shared library.
+		"""Loads the specified shared library (if not already loaded), and allocates a workspace for the calling thread.
 
 		Returns
 		-------
 		errno : integer
-			The return code from the DLL, 0 if no error.
+			0 if no error.
 		"""
-		self._lib = ctypes.cdll.LoadLibrary(self._path)
-		return self._lib.setup(ctypes.c_int(self.nsites),ctypes.c_int(self.circular))
+		if self.native:
+			self._get_handle()
+		return 0
 		
 	def stop(self):
-		"""Closes the shared library."""
-		return self._lib.close()
+		"""Frees the workspaces allocated by the shared library."""
+		handles,self._handles = self._handles,{}
+		for handle in handles.values():
+			self._lib.close(handle)
+		return 0
+
+	def clear_buffers(self):
+		"""Discards the concentration and heat buffers of all experiments."""
+		self._buffers = {}
+
+	def _get_library(self):
+		# load each shared library once, and declare its function signatures
+		if self._path not in TRAP_DLL_Model._libraries:
+			lib = ctypes.CDLL(self._path)
+			lib.setup.argtypes = [ctypes.c_int, ctypes.c_int]
+			lib.setup.restype = ctypes.c_void_p
+			lib.calc.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_double, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+			lib.calc.restype = ctypes.c_int
+			lib.calc_batch.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p]
+			lib.calc_batch.restype = ctypes.c_int
+			lib.close.argtypes = [ctypes.c_void_p]
+			lib.close.restype = ctypes.c_int
+			TRAP_DLL_Model._libraries[self._path] = lib
+		return TRAP_DLL_Model._libraries[self._path]
+
+	def _get_handle(self):
+		# each thread evaluates the model in its own library workspace
+		if self._lib is None:
+			self._lib = self._get_library()
+
+		thread = threading.get_ident()
+		if thread not in self._handles:
+			handle = self._lib.setup(self.nsites,self.circular)
+			if not handle:
+				raise Exception("DLL could not allocate a model workspace.")
+			self._handles[thread] = handle
+		return self._handles[thread]
+
+	def _get_buffers(self,concentrations):
+		# the packed, contiguous buffers for a list of experiments, kept by each thread in least-recently used order
+		buffers = self._buffers.setdefault(threading.get_ident(),OrderedDict())
+
+		# the buffers are identified by the keys of the experiments' concentrations, which are the same for copies of an experiment
+		key = tuple(getattr(experiment,'key',None) for experiment in concentrations)
+		if key in buffers:
+			buffers.move_to_end(key)
+			return buffers[key]
+
+		# patch for compatibility with general model nomenclature
+		P = numpy.array([c.get('TRAP',c.get('Macromolecule')) for experiment in concentrations for c in experiment],numpy.dtype('d'))
+		L = numpy.array([c.get('Trp',c.get('Ligand')) for experiment in concentrations for c in experiment],numpy.dtype('d'))
+		offsets = numpy.cumsum([0]+[len(experiment) for experiment in concentrations]).astype(numpy.intc)
+		index = numpy.repeat(numpy.arange(len(concentrations)),numpy.diff(offsets)) # the experiment of each point
+
+		ret = {'offsets':offsets,'index':index,'P':P,'L':L,'Q':numpy.zeros((1,len(P)),numpy.dtype('d')),'params':None}
+		if None in key: # concentrations that don't belong to an experiment are packed on every call
+			return ret
+
+		buffers[key] = ret
+		while len(buffers) > self.buffers:
+			buffers.popitem(last=False)
+		return ret
+
+	def get_energies(self,T0,T,params=None):
+		"""Return the temperature-corrected free energies and enthalpies passed to the shared library. Implemented by child classes.
+
+		Arguments
+		---------
+		T0 : float
+			The reference temperature.
+		T : float
+			The experimental temperature (in Kelvin)
+		params : dict of floats or arrays
+			The (internal) model parameter values to use, keyed by name. If omitted, the current parameter values are used.
+
+		Returns
+		-------
+		tuple of floats or arrays
+			The free energies and enthalpies, in the order expected by the shared library.
+		"""
+		raise NotImplementedError
+
+	def Q(self,T0,T,concentrations):
+		"""Returns the total binding heat at each injection predicted by the model and its current parameter values. See parent model for information."""
+		return self.calc(T,concentrations,self.get_energies(T0,T))
+
+	_Q = Q # the Q() that Q_batch() and Q_stack() stand in for
+
+	def Q_batch(self,T0,T,concentrations,param_sets):
+		"""Returns the total binding heat at each injection for several sets of model parameter values, in a single library call (or with Q() for each parameter set, if Q() has been replaced). See parent model for information."""
+		if type(self).Q is not TRAP_DLL_Model._Q:
+			return ITCModel.Q_batch(self,T0,T,concentrations,param_sets)
+
+		param_sets = numpy.atleast_2d(param_sets)
+		ret = self.Q_stack(T0,[T],[concentrations],param_sets)[0]
+
+		self.set_vector(param_sets[-1])
+		return ret
+
+	def Q_stack(self,T0,T,concentrations,param_sets=None):
+		"""Returns the total binding heat at each injection of several experiments, in a single library call.
+
+		Arguments
+		---------
+		T0 : float
+			The reference temperature to be used for the model.
+		T : list of floats
+			The temperature of each titration.
+		concentrations : list of lists of dicts
+			The concentration of components at each injection point, for each titration.
+		param_sets : 2D array of floats
+			The parameter vectors (in the current model units, see get_vector()) to evaluate, one per row. If omitted, the current parameter values are used.
+
+		Returns
+		-------
+		list of lists
+			The total heat in the system at each injection point of each titration, or if parameter sets are provided, for each titration (outer list) and parameter set (inner list).
+
+		Notes
+		-----
+			If Q() has been replaced (by a child class or otherwise), it is called for each titration and parameter set instead.
+		"""
+		if type(self).Q is not TRAP_DLL_Model._Q:
+			if param_sets is None:
+				return [ self.Q(T0,t,c) for t,c in zip(T,concentrations) ]
+			vector = self.get_vector()
+			ret = [ ITCModel.Q_batch(self,T0,t,c,numpy.atleast_2d(param_sets)) for t,c in zip(T,concentrations) ]
+			self.set_vector(vector)
+			return ret
+
+		if param_sets is None:
+			values = self.params.values[None,:]
+		else:
+			values = numpy.atleast_2d(param_sets) * self._get_scales()
+		params = dict( (name,values[:,i,None]) for i,name in enumerate(self.get_param_names()) )
+
+		# the corrected energies at the temperature of each titration, for each parameter set
+		energies = numpy.stack( numpy.broadcast_arrays(*self.get_energies(T0,numpy.array(T,dtype='d'),params)), axis=-1 )
+
+		ret = self.calc_batch(T,concentrations,energies)
+		if param_sets is None:
+			return [Q[0].tolist() for Q in ret]
+		return [Q.tolist() for Q in ret]
 
 	def calc(self,T,concentrations,params):
-		"""Converts the arguments to their appropriate ctypes, passes to the DLL, and returns the calculated enthalpies.
+		"""Passes the buffered concentrations of the experiment (see buffers) and the parameters to the DLL, and returns the calculated enthalpies.
 
 		Arguments
 		---------
@@ -83,26 +359,93 @@ class TRAP_DLL_Model(ITCModel):
 		-----
 			Named components are "TRAP" (lattice) and "Trp" (ligand).
 		"""
-		n = len(concentrations)
-		Q = numpy.zeros(n,numpy.dtype('d'))
-		
-		# patch for compatibility with general model nomenclature
-		if 'TRAP' not in concentrations[0]:
-			concentrations = [{'TRAP':concentrations[i]['Macromolecule'],'Trp':concentrations[i]['Ligand']} for i in range(n)]
-				
-		status = self._lib.calc(
-			ctypes.c_int( n ),
-			ctypes.c_double( T ),
-			numpy.array([c['TRAP'] for c in concentrations],numpy.dtype('d')).ctypes,
-			numpy.array([c['Trp']  for c in concentrations],numpy.dtype('d')).ctypes,
-			Q.ctypes,
-			numpy.array(params,numpy.dtype('d')).ctypes
-		)
+		buffers = self._get_buffers([concentrations])
+		if not self.native:
+			return self._calc_numpy( numpy.array([T],numpy.dtype('d')), buffers['index'], buffers['P'], buffers['L'], numpy.array(params,numpy.dtype('d'))[None,None,:] )[0]
+
+		handle = self._get_handle()
+		if buffers['params'] is None or len(buffers['params']) != len(params):
+			buffers['params'] = numpy.zeros(len(params),numpy.dtype('d'))
+		buffers['params'][:] = params
+
+		status = self._lib.calc( handle, len(buffers['P']), T, buffers['P'].ctypes.data, buffers['L'].ctypes.data, buffers['Q'].ctypes.data, buffers['params'].ctypes.data )
 		
 		if status != 0:
 			raise Exception("DLL returned a non-zero error code: %i"%(status))
 
-		return Q
+		return buffers['Q'][0].copy()
+
+	def calc_batch(self,T,concentrations,params):
+		"""Passes the buffered concentrations of several experiments (see buffers) and parameter sets to the DLL in a single call, and returns the calculated enthalpies.
+
+		Arguments
+		---------
+		T : list of floats
+			The experimental temperature (in Kelvin) of each experiment.
+		concentrations : list of lists of dicts
+			Concentrations of components at each injection point, for each experiment.
+		params : 3D array of floats
+			Model parameter values for each parameter set (first axis) and experiment (second axis).
+
+		Returns
+		-------
+		list of 2D arrays
+			The integrated enthalpies of each experiment, with one row per parameter set.
+
+		Raises
+		------
+		Exception
+			If DLL returns a non-zero error code.
+
+		Notes
+		-----
+			If the library was compiled with OpenMP, the parameter sets are evaluated in parallel.
+		"""
+		buffers = self._get_buffers(concentrations)
+		temps = numpy.array(T,numpy.dtype('d'))
+		params = numpy.ascontiguousarray(params,numpy.dtype('d'))
+		nsets,nexp,nparams = params.shape
+		if not self.native:
+			return numpy.split(self._calc_numpy(temps,buffers['index'],buffers['P'],buffers['L'],params),buffers['offsets'][1:-1],axis=1)
+
+		handle = self._get_handle()
+		if len(buffers['Q']) != nsets:
+			buffers['Q'] = numpy.zeros((nsets,len(buffers['P'])),numpy.dtype('d'))
+
+		status = self._lib.calc_batch( handle, nexp, buffers['offsets'].ctypes.data, temps.ctypes.data, buffers['P'].ctypes.data, buffers['L'].ctypes.data, nsets, nparams, params.ctypes.data, buffers['Q'].ctypes.data )
+
+		if status != 0:
+			raise Exception("DLL returned a non-zero error code: %i"%(status))
+
+		return numpy.split(buffers['Q'].copy(),buffers['offsets'][1:-1],axis=1)
+
+	def _calc_numpy(self,T,index,P,L,params):
+		# the NumPy implementation of the library's calc_batch(), returning the heats of each parameter set (rows) at each point (columns)
+		bound,incidence,counts = get_configuration_classes(self.rules,self.nsites)
+		stoich = numpy.arange(self.nsites+1)
+		nhalf = params.shape[-1]//2
+
+		# the free energy and enthalpy of each class of configurations, for each parameter set and experiment
+		weights = numpy.log(counts) -(numpy.dot(params[...,:nhalf],incidence.T)/(_R*T[:,None]))
+		enthalpies = numpy.dot(params[...,nhalf:],incidence.T)
+
+		# the partition function (as logarithms to avoid overflow) and mean enthalpy of each stoichiometry
+		weights = numpy.where(bound[:,None] == stoich,weights[...,None],-numpy.inf)
+		wmax = numpy.max(weights,axis=-2)
+		weights = numpy.exp(weights -wmax[...,None,:])
+		Z = numpy.sum(weights,axis=-2)
+		logZ = numpy.log(Z) +wmax
+		H = numpy.einsum('...ck,...c->...k',weights,enthalpies) / Z
+
+		# the coefficients of the binding polynomial at each point, scaled so that the largest is 1
+		ligand = L > 0
+		coeffs = logZ[:,index,:] +(stoich*numpy.log(numpy.where(ligand,L,1.0))[:,None])
+		coeffs = numpy.where(ligand[:,None] | (stoich == 0),coeffs,-numpy.inf)
+		coeffs = numpy.exp(coeffs -numpy.max(coeffs,axis=-1,keepdims=True))
+
+		x = get_free_fraction(coeffs,numpy.where(ligand,P,0.0)/numpy.where(ligand,L,1.0))
+		probs = coeffs * (x[...,None] ** stoich)
+		return numpy.sum(H[:,index,:]*probs,axis=-1) / numpy.sum(probs,axis=-1)
 
 class SK(TRAP_DLL_Model):
 	"""
@@ -114,9 +457,10 @@ class SK(TRAP_DLL_Model):
 	"""
 
 	libpath = 'model_trap_sk*.so'
+	rules = 'sk'
 
-	def __init__(self):
-		TRAP_DLL_Model.__init__(self)
+	def __init__(self,native=None):
+		TRAP_DLL_Model.__init__(self,native)
 
 		self.add_parameter( 'dG0',	'dG',	description='Intrinsic free energy change upon binding' )
 		self.add_parameter( 'dGa',	'dG',	description='Free energy of coupling to an unoccupied site' )
@@ -128,17 +472,17 @@ class SK(TRAP_DLL_Model):
 		self.add_parameter( 'dCpa',	'dCp',	description='Change in heat capacity of coupling to an unoccupied site' )
 		self.add_parameter( 'dCpb',	'dCp',	description='Change in heat capacity of coupling to an occupied site' )
 		
-	def Q(self,T0,T,concentrations):
-		"""Returns the total binding heat at each injection predicted by the model and its current parameter values. See parent model for information."""
-		p = (
-			dG_vant_Hoff( self.params['dG0'], self.params['dH0'], self.params['dCp0'], T, T0 ),
-			dG_vant_Hoff( self.params['dGa'], self.params['dHa'], self.params['dCpa'], T, T0 ),
-			dG_vant_Hoff( self.params['dGb'], self.params['dHb'], self.params['dCpb'], T, T0 ),
-			dH_vant_Hoff( self.params['dH0'], self.params['dCp0'], T, T0 ),
-			dH_vant_Hoff( self.params['dHa'], self.params['dCpa'], T, T0 ),
-			dH_vant_Hoff( self.params['dHb'], self.params['dCpb'], T, T0 )
+	def get_energies(self,T0,T,params=None):
+		"""Returns the temperature-corrected free energies and enthalpies passed to the shared library. See parent model for information."""
+		p = self.params if params is None else params
+		return (
+			dG_vant_Hoff( p['dG0'], p['dH0'], p['dCp0'], T, T0 ),
+			dG_vant_Hoff( p['dGa'], p['dHa'], p['dCpa'], T, T0 ),
+			dG_vant_Hoff( p['dGb'], p['dHb'], p['dCpb'], T, T0 ),
+			dH_vant_Hoff( p['dH0'], p['dCp0'], T, T0 ),
+			dH_vant_Hoff( p['dHa'], p['dCpa'], T, T0 ),
+			dH_vant_Hoff( p['dHb'], p['dCpb'], T, T0 )
 			)
-		return self.calc(T,concentrations,p)
 
 class IK(TRAP_DLL_Model):
 	"""
@@ -146,9 +490,10 @@ class IK(TRAP_DLL_Model):
 	"""
 
 	libpath = 'model_trap_ik*.so'
+	rules = 'ik'
 
-	def __init__(self):
-		TRAP_DLL_Model.__init__(self)
+	def __init__(self,native=None):
+		TRAP_DLL_Model.__init__(self,native)
 
 		self.add_parameter( 'dGX',	'dG',	description='Free energy change upon binding to a site flanked by two unoccupied' )
 		self.add_parameter( 'dGY',	'dG',	description='Free energy change upon binding to a site flanked by one occupied' )
@@ -160,17 +505,17 @@ class IK(TRAP_DLL_Model):
 		self.add_parameter( 'dCpY',	'dCp',	description='Change in heat capacity of coupling to a site flanked by one occupied' )
 		self.add_parameter( 'dCpZ',	'dCp',	description='Change in heat capacity of coupling to a site flanked by two occupied' )
 		
-	def Q(self,T0,T,concentrations):
-		"""Returns the total binding heat at each injection predicted by the model and its current parameter values. See parent model for information."""
-		p = (
-			dG_vant_Hoff( self.params['dGX'], self.params['dHX'], self.params['dCpX'], T, T0 ),
-			dG_vant_Hoff( self.params['dGY'], self.params['dHY'], self.params['dCpY'], T, T0 ),
-			dG_vant_Hoff( self.params['dGZ'], self.params['dHZ'], self.params['dCpZ'], T, T0 ),
-			dH_vant_Hoff( self.params['dHX'], self.params['dCpX'], T, T0 ),
-			dH_vant_Hoff( self.params['dHY'], self.params['dCpY'], T, T0 ),
-			dH_vant_Hoff( self.params['dHZ'], self.params['dCpZ'], T, T0 )
+	def get_energies(self,T0,T,params=None):
+		"""Returns the temperature-corrected free energies and enthalpies passed to the shared library. See parent model for information."""
+		p = self.params if params is None else params
+		return (
+			dG_vant_Hoff( p['dGX'], p['dHX'], p['dCpX'], T, T0 ),
+			dG_vant_Hoff( p['dGY'], p['dHY'], p['dCpY'], T, T0 ),
+			dG_vant_Hoff( p['dGZ'], p['dHZ'], p['dCpZ'], T, T0 ),
+			dH_vant_Hoff( p['dHX'], p['dCpX'], T, T0 ),
+			dH_vant_Hoff( p['dHY'], p['dCpY'], T, T0 ),
+			dH_vant_Hoff( p['dHZ'], p['dCpZ'], T, T0 )
 			)
-		return self.calc(T,concentrations,p)
 	
 class IKi(TRAP_DLL_Model):
 	"""
@@ -178,9 +523,10 @@ class IKi(TRAP_DLL_Model):
 	"""
 
 	libpath = 'model_trap_ik*.so'
+	rules = 'ik'
 
-	def __init__(self):
-		TRAP_DLL_Model.__init__(self)
+	def __init__(self,native=None):
+		TRAP_DLL_Model.__init__(self,native)
 
 		self.add_parameter( 'dG0',	'dG',	description='Free energy change upon binding to a site flanked by two unoccupied' )
 		self.add_parameter( 'dGoe',	'dG',	description='Additional free energy change upon binding to a site flanked by one occupied' )
@@ -192,17 +538,17 @@ class IKi(TRAP_DLL_Model):
 		self.add_parameter( 'dCpoe','dCp',	description='Additional change in heat capacity of coupling to a site flanked by one occupied' )
 		self.add_parameter( 'dCpoo','dCp',	description='Additional change in heat capacity of coupling to a site flanked by two occupied' )
 
-	def Q(self,T0,T,concentrations):
-		"""Returns the total binding heat at each injection predicted by the model and its current parameter values. See parent model for information."""
-		p = (
-			dG_vant_Hoff( self.params['dG0'], self.params['dH0'], self.params['dCp0'], T, T0 ),
-			dG_vant_Hoff( self.params['dG0']+self.params['dGoe'], self.params['dH0']+self.params['dHoe'], self.params['dCp0']+self.params['dCpoe'], T, T0 ),
-			dG_vant_Hoff( self.params['dG0']+self.params['dGoo'], self.params['dH0']+self.params['dHoo'], self.params['dCp0']+self.params['dCpoo'], T, T0 ),
-			dH_vant_Hoff( self.params['dH0'], self.params['dCp0'], T, T0 ),
-			dH_vant_Hoff( self.params['dH0']+self.params['dHoe'], self.params['dCp0']+self.params['dCpoe'], T, T0 ),
-			dH_vant_Hoff( self.params['dH0']+self.params['dHoo'], self.params['dCp0']+self.params['dCpoo'], T, T0 )
+	def get_energies(self,T0,T,params=None):
+		"""Returns the temperature-corrected free energies and enthalpies passed to the shared library. See parent model for information."""
+		p = self.params if params is None else params
+		return (
+			dG_vant_Hoff( p['dG0'], p['dH0'], p['dCp0'], T, T0 ),
+			dG_vant_Hoff( p['dG0']+p['dGoe'], p['dH0']+p['dHoe'], p['dCp0']+p['dCpoe'], T, T0 ),
+			dG_vant_Hoff( p['dG0']+p['dGoo'], p['dH0']+p['dHoo'], p['dCp0']+p['dCpoo'], T, T0 ),
+			dH_vant_Hoff( p['dH0'], p['dCp0'], T, T0 ),
+			dH_vant_Hoff( p['dH0']+p['dHoe'], p['dCp0']+p['dCpoe'], T, T0 ),
+			dH_vant_Hoff( p['dH0']+p['dHoo'], p['dCp0']+p['dCpoo'], T, T0 )
 			)
-		return self.calc(T,concentrations,p)
 		
 class SKa(TRAP_DLL_Model):
 	"""
@@ -210,9 +556,10 @@ class SKa(TRAP_DLL_Model):
 	"""
 
 	libpath = 'model_trap_ik*.so'
+	rules = 'ik'
 
-	def __init__(self):
-		TRAP_DLL_Model.__init__(self)
+	def __init__(self,native=None):
+		TRAP_DLL_Model.__init__(self,native)
 
 		self.add_parameter( 'dG0',	'dG',	description='Intrinsic free energy change upon binding' )
 		self.add_parameter( 'dGb',	'dG',	description='Free energy of coupling to an occupied site' )
@@ -221,14 +568,14 @@ class SKa(TRAP_DLL_Model):
 		self.add_parameter( 'dCp0',	'dCp',	description='Intrinsic change in heat capacity change upon binding' )
 		self.add_parameter( 'dCpb',	'dCp',	description='Change in heat capacity of coupling to an occupied site' )
 
-	def Q(self,T0,T,concentrations):
-		"""Returns the total binding heat at each injection predicted by the model and its current parameter values. See parent model for information."""
-		p = (
-			dG_vant_Hoff( self.params['dG0'], self.params['dH0'], self.params['dCp0'], T, T0 ),
-			dG_vant_Hoff( self.params['dG0']+(1*self.params['dGb']), self.params['dH0']+(1*self.params['dHb']), self.params['dCp0']+(1*self.params['dCpb']), T, T0 ),
-			dG_vant_Hoff( self.params['dG0']+(2*self.params['dGb']), self.params['dH0']+(2*self.params['dHb']), self.params['dCp0']+(2*self.params['dCpb']), T, T0 ),
-			dH_vant_Hoff( self.params['dH0'], self.params['dCp0'], T, T0 ),
-			dH_vant_Hoff( self.params['dH0']+(1*self.params['dHb']), self.params['dCp0']+(1*self.params['dCpb']), T, T0 ),
-			dH_vant_Hoff( self.params['dH0']+(2*self.params['dHb']), self.params['dCp0']+(2*self.params['dCpb']), T, T0 ),
+	def get_energies(self,T0,T,params=None):
+		"""Returns the temperature-corrected free energies and enthalpies passed to the shared library. See parent model for information."""
+		p = self.params if params is None else params
+		return (
+			dG_vant_Hoff( p['dG0'], p['dH0'], p['dCp0'], T, T0 ),
+			dG_vant_Hoff( p['dG0']+(1*p['dGb']), p['dH0']+(1*p['dHb']), p['dCp0']+(1*p['dCpb']), T, T0 ),
+			dG_vant_Hoff( p['dG0']+(2*p['dGb']), p['dH0']+(2*p['dHb']), p['dCp0']+(2*p['dCpb']), T, T0 ),
+			dH_vant_Hoff( p['dH0'], p['dCp0'], T, T0 ),
+			dH_vant_Hoff( p['dH0']+(1*p['dHb']), p['dCp0']+(1*p['dCpb']), T, T0 ),
+			dH_vant_Hoff( p['dH0']+(2*p['dHb']), p['dCp0']+(2*p['dCpb']), T, T0 ),
 			)
-		return self.calc(T,concentrations,p)
@@ -1,13 +1,15 @@
 """Basic thermodynamic transform/conversion functions.
 
-
+The conversion and temperature correction functions accept either single values or NumPy arrays, which are broadcast against each other (e.g. an array of parameters against an array of temperatures).
 """
 
 import math
+import numpy
 
 
 _R = 8.3144621 # J/(K*mol)
 _UNITS = ('J','kJ','cal','kcal')
+_UNIT_FACTORS = {'J':1.0, 'kJ':1000.0, 'cal':1.0/0.239005736, 'kcal':1000.0/0.239005736} # Joules per unit
 
 def convert_to_J(units,value):
 	"""Convert a value in the specified units to Joules.
@@ -16,24 +18,19 @@ def convert_to_J(units,value):
 	---------
 	units : string
 		The units that the value parameter is in.
-	value : float
+	value : float or array of floats
 		The value to convert to Joules.
 	
 	Returns
 	-------
-	float
+	float or array of floats
 		The value in Joules.
 	"""
 	assert units in _UNITS
 
 	if units == 'J':
 		return value
-	elif units == 'kJ':
-		return value*1000.0
-	elif units == 'cal':
-		return J_from_cal(value)
-	elif units == 'kcal':
-		return J_from_cal(value)*1000.0
+	return numpy.multiply( value, _UNIT_FACTORS[units] )
 
 def convert_from_J(units,value):
 	"""Convert a value in Joules to the desired units.
@@ -42,24 +39,19 @@ def convert_from_J(units,value):
 	---------
 	units : string
 		The units that the desired value is to be returned in.
-	value : float
+	value : float or array of floats
 		The value (in Joules) to convert.
 	
 	Returns
 	-------
-	float
+	float or array of floats
 		The value in the specified units.
 	"""
 	assert units in _UNITS
 	
 	if units == 'J':
 		return value
-	elif units == 'kJ':
-		return value/1000.0
-	elif units == 'cal':
-		return cal_from_J(value)
-	elif units == 'kcal':
-		return cal_from_J(value)/1000.0	
+	return numpy.divide( value, _UNIT_FACTORS[units] )
 
 def dG_from_Kd( Kd, T ):
 	"""Convert a diassociation constant into a free energy change (in Joules) at a specified temperature.
@@ -76,7 +68,7 @@ def dG_from_Kd( Kd, T ):
 	float
 		The free energy change associated with the binding event at temperature T.
 	"""
-	return _R*T*math.log(Kd)
+	return _R*T*numpy.log(Kd)
 
 def Kd_from_dG( dG, T ):
 	"""Convert a free energy change (in Joules) at a specified temperature to a diassociation constant.
@@ -93,7 +85,7 @@ def Kd_from_dG( dG, T ):
 	float
 		The disassociation constant associated with the free energy change at temperature T.
 	"""
-	return math.exp( dG/(_R*T) )
+	return numpy.exp( dG/(_R*T) )
 
 def dS_from_dGdH( dG, dH, T ):
 	"""Return the change in entropy for a process at some temperature from a given free energy and enthalpy change.
@@ -245,8 +237,8 @@ def dK_Gibbs_Helmholtz( T, T0, K0, dH0, dCp ):
 		Assumes a constant (temperature-independent) change in heat capacity (i.e. linear dH w.r.t. T)
 	"""
 
-	return math.exp(
-		math.log(K0) + ( ((dH0-(T0*dCp)) / _R)*((1.0/T0)-(1.0/T)) ) + ((dCp/_R)*math.log(T/T0))
+	return numpy.exp(
+		numpy.log(K0) + ( ((dH0-(T0*dCp)) / _R)*((1.0/T0)-(1.0/T)) ) + ((dCp/_R)*numpy.log(T/T0))
 		)
 
 def dH_vant_Hoff( dH0, dCp, T, T0 ):
@@ -303,7 +295,7 @@ def dG_vant_Hoff( dG0, dH0, dCp, T, T0 ):
 		Assumes a constant (temperature-independent) change in heat capacity (i.e. linear dH w.r.t. T)
 	"""
 	dS0 = (dH0 - dG0) / T0
-	return dH0 - (T*dS0) + (dCp*( (T-T0) - (T*math.log(T/T0)) ))
+	return dH0 - (T*dS0) + (dCp*( (T-T0) - (T*numpy.log(T/T0)) ))
 
 def dG_vant_Hoff_dH( dG0, dH, dCp, T, T0 ):
 	"""
@@ -348,5 +340,5 @@ def dG_vant_Hoff_dH( dG0, dH, dCp, T, T0 ):
 		dG = dH(T) - dCp*(T-T0) - (T/T0)*[ dH(T) - dCp*(T-T0) - dG(T0) ] + dCp[ (T-T0) - T*ln(T/T0) ]
 	"""
 
-	return dH - dCp*(T-T0) - (T/T0)*( dH - dCp*(T-T0) - dG0 ) + dCp*( (T-T0) - T*math.log(T/T0) )
+	return dH - dCp*(T-T0) - (T/T0)*( dH - dCp*(T-T0) - dG0 ) + dCp*( (T-T0) - T*numpy.log(T/T0) )
 
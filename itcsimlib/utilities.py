@@ -134,6 +134,7 @@ def read_nitpic_exp( file, exp_args={}, recalc_concs=False ):
 		for i in range(experiment.npoints):
 			experiment.Concentrations[i]['M'] = nitpic['Mt'][i]
 			experiment.Concentrations[i]['X'] = nitpic['Xt'][i]
+		experiment.Concentrations.update_key()
 
 	experiment.initialized = True
 
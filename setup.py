@@ -30,7 +30,7 @@ if LooseVersion(pyx.__version__) < LooseVersion("0.13"):
 import itcsimlib
 
 model_sources = ["src/model_trap/itc_model.c","src/model_trap/itc_sim.c","src/model_trap/itc_calc.c"]
-model_libraries = ['m','gsl','gslcblas']
+model_libraries = ['m']
 model_sk = Extension("itcsimlib.model_trap_sk",
 	libraries = model_libraries, extra_compile_args=['-std=c99'],
 	sources=["src/model_trap/energies_sk.c"]+model_sources,
@@ -43,17 +43,28 @@ model_nn = Extension("itcsimlib.model_trap_nn",
 	libraries = model_libraries, extra_compile_args=['-std=c99'],
 	sources=["src/model_trap/energies_nn.c"]+model_sources,
 	)		
+model_table = Extension("itcsimlib.model_ising_table",
+	libraries = model_libraries, extra_compile_args=['-std=c99'],
+	sources=["src/model_trap/energies_table.c"]+model_sources,
+	)
 
 class check_c_build(build.build):
-	user_options=build.build.user_options + [("build-c-models",None,"Compile TRAP+Tryptophan models written in C")]
+	user_options=build.build.user_options + [
+		("build-c-models",None,"Compile TRAP+Tryptophan and Ising models written in C"),
+		("with-openmp",None,"Evaluate parameter sets in parallel in the C models using OpenMP")]
 
 	def initialize_options(self, *args, **kwargs):
 		self.build_c_models = None
+		self.with_openmp = None
 		build.build.initialize_options(self, *args, **kwargs)
 
 	def run(self, *args, **kwargs):
 		if self.build_c_models :
-			self.distribution.ext_modules = [model_sk,model_ik,model_nn]
+			self.distribution.ext_modules = [model_sk,model_ik,model_nn,model_table]
+			if self.with_openmp:
+				for model in self.distribution.ext_modules:
+					model.extra_compile_args.append('-fopenmp')
+					model.extra_link_args.append('-fopenmp')
 		build.build.run(self, *args, **kwargs)
 
 class run_tests(Command):
@@ -30,7 +30,7 @@ void assignEnergies(struct mWorkspace *w, struct sWorkspace *sim, double *params
 	*/
 
 	/* assign energies for each configuration */
-	for(int i=0; i<pow(2, w->size); i++)
+	for(int i=0; i<w->nconfigs; i++)
 	{
 		w->energies[i]=0;
 		sim->enthalpies[i]=0;
@@ -38,15 +38,15 @@ void assignEnergies(struct mWorkspace *w, struct sWorkspace *sim, double *params
 		/* start w/ presence of ligand dG */
 		for(int j=0; j<w->size; j++)
 		{
-			if( w->configs[i][j] > 0 )
+			if( SITE(w,i,j) > 0 )
 			{
 
-				if( w->configs[i][ permute(j+1,w->size) ] > 0 && w->configs[i][ permute(j-1,w->size) ] > 0 )
+				if( SITE(w,i,permute(j+1,w->size)) > 0 && SITE(w,i,permute(j-1,w->size)) > 0 )
 				{
 					w->energies[i]		+= params[2];
 					sim->enthalpies[i]	+= params[5];
 				}
-				else if( w->configs[i][ permute(j+1,w->size) ] > 0 || w->configs[i][ permute(j-1,w->size) ] > 0 )
+				else if( SITE(w,i,permute(j+1,w->size)) > 0 || SITE(w,i,permute(j-1,w->size)) > 0 )
 				{
 					w->energies[i]		+= params[1];
 					sim->enthalpies[i]	+= params[4];
@@ -39,28 +39,28 @@ void assignEnergies( struct mWorkspace *w, struct sWorkspace *sim, double *param
 	*/
 
 	/* assign energies for each configuration */
-	for(int i=0; i<pow(2, w->size); i++)
+	for(int i=0; i<w->nconfigs; i++)
 	{
 		w->energies[i]=0;
 		sim->enthalpies[i]=0;
 
 		for(int j=0; j<w->size; j++)
 		{
-			if( w->configs[i][j] > 0 )
+			if( SITE(w,i,j) > 0 )
 			{
 				w->energies[i]			+= params[0]; /*  1  */
 				sim->enthalpies[i]		+= params[4];
 
-				if( (w->configs[i][ permute(j-1,w->size) ] == 0) && (w->configs[i][ permute(j+1,w->size) ] == 0) ){
+				if( (SITE(w,i,permute(j-1,w->size)) == 0) && (SITE(w,i,permute(j+1,w->size)) == 0) ){
 					w->energies[i]		+= params[1]; /* 010 */
 					sim->enthalpies[i]	+= params[5];
-				}else if( (w->configs[i][ permute(j-1,w->size) ] == 1) && (w->configs[i][ permute(j+1,w->size) ] == 0) ){
+				}else if( (SITE(w,i,permute(j-1,w->size)) == 1) && (SITE(w,i,permute(j+1,w->size)) == 0) ){
 					w->energies[i]		+= params[2]; /* 110 */
 					sim->enthalpies[i]	+= params[6];
-				}else if( (w->configs[i][ permute(j-1,w->size) ] == 0) && (w->configs[i][ permute(j+1,w->size) ] == 1) ){
+				}else if( (SITE(w,i,permute(j-1,w->size)) == 0) && (SITE(w,i,permute(j+1,w->size)) == 1) ){
 					w->energies[i]		+= params[2]; /* 011 */
 					sim->enthalpies[i]	+= params[6];
-				}else if( (w->configs[i][ permute(j-1,w->size) ] == 1) && (w->configs[i][ permute(j+1,w->size) ] == 1) ){
+				}else if( (SITE(w,i,permute(j-1,w->size)) == 1) && (SITE(w,i,permute(j+1,w->size)) == 1) ){
 					w->energies[i]		+= params[3]; /* 111 */
 					sim->enthalpies[i]	+= params[7];
 				}
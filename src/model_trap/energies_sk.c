@@ -31,19 +31,19 @@ void assignEnergies(struct mWorkspace *w, struct sWorkspace *sim, double *params
 	*/
 
 	/* assign energies for each configuration */
-	for(int i=0; i<pow(2, w->size); i++)
+	for(int i=0; i<w->nconfigs; i++)
 	{
 		w->energies[i]=0;
 		sim->enthalpies[i]=0;
 
 		for(int j=0; j<w->size; j++)
 		{
-			if( w->configs[i][j] > 0 )
+			if( SITE(w,i,j) > 0 )
 			{
 				w->energies[i]			+= params[0];
 				sim->enthalpies[i]		+= params[3];
 
-				if( w->configs[i][ permute(j+1,w->size) ] > 0 ){
+				if( SITE(w,i,permute(j+1,w->size)) > 0 ){
 					w->energies[i]		+= params[2]; /* coupling to an occupied site */
 					sim->enthalpies[i]	+= params[5];
 				}else{
@@ -51,7 +51,7 @@ void assignEnergies(struct mWorkspace *w, struct sWorkspace *sim, double *params
 					sim->enthalpies[i]	+= params[4];
 				}
 
-				if( w->configs[i][ permute(j-1,w->size) ] > 0 ) {
+				if( SITE(w,i,permute(j-1,w->size)) > 0 ) {
 					w->energies[i]		+= params[2]; /* coupling to an occupied site */
 					sim->enthalpies[i]	+= params[5];
 				}else{
@@ -0,0 +1,64 @@
+/*
+	configuration energies/enthalpies from a table of the contribution of each site, by the occupancy of the site and its two neighbours
+	(see Ising.site_rules in itcsimlib/model_ising.py)
+*/
+
+#include "energies.h"
+#include "itc_model.h"
+#include "itc_sim.h"
+#include <math.h>
+
+int neighbor( struct mWorkspace *w, int i, int j );
+int neighbor( struct mWorkspace *w, int i, int j )
+{
+	/* sites beyond the ends of a linear lattice are unoccupied */
+	if( j < 0 )
+		return w->cyclic ? SITE(w,i,j + w->size) : 0;
+	else if( j >= w->size )
+		return w->cyclic ? SITE(w,i,j % w->size) : 0;
+	else
+		return SITE(w,i,j);
+}
+
+void assignEnergies(struct mWorkspace *w, struct sWorkspace *sim, double *params)
+{
+
+	/*
+	param[0]					number of energy terms (n)
+	param[1 ... 8n]				number of times each term is counted for a site, with one row of n for each (previous,site,next) occupancy, in the order 4*previous +2*site +next
+	param[8n+1 ... 9n]			free energy of each term
+	param[9n+1 ... 10n]			enthalpy of each term
+	*/
+
+	int		n = (int)params[0];
+	double	*table = params +1, *dG = params +1 +(8*n), *dH = params +1 +(9*n);
+	double	siteG[8], siteH[8];
+
+	/* the free energy and enthalpy of a site in each context */
+	for(int c=0; c<8; c++)
+	{
+		siteG[c]=0;
+		siteH[c]=0;
+		for(int k=0; k<n; k++)
+		{
+			siteG[c] += table[(c*n) +k] * dG[k];
+			siteH[c] += table[(c*n) +k] * dH[k];
+		}
+	}
+
+	/* assign energies for each configuration */
+	for(int i=0; i<w->nconfigs; i++)
+	{
+		w->energies[i]=0;
+		sim->enthalpies[i]=0;
+
+		for(int j=0; j<w->size; j++)
+		{
+			int c = (4 * neighbor(w,i,j-1)) + (2 * SITE(w,i,j)) + neighbor(w,i,j+1);
+			w->energies[i]		+= siteG[c];
+			sim->enthalpies[i]	+= siteH[c];
+		}
+	}
+
+	return;
+}
@@ -1,28 +1,52 @@
+#include <stdlib.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 #include "itc_model.h"
 #include "itc_sim.h"
 #include "energies.h"
 
-struct mWorkspace model;
-struct sWorkspace sim;
+/* the model and simulation workspaces of one model instance, passed to every call as an opaque handle */
+struct cWorkspace
+{
+	struct mWorkspace model;
+	struct sWorkspace sim;
+};
+
+int close( void *handle );
 
-int setup(int size, int cyclic )
+void* setup( int size, int cyclic )
 {
-	model.size		= size;
-	model.cyclic	= cyclic;
+	struct cWorkspace *w = (struct cWorkspace *)calloc( 1, sizeof(struct cWorkspace) );
+	if( w == NULL )
+		return NULL;
 
-	if( setupModelWorkspace(&model) > 0 )
-		return 0;
-	if( setupSimWorkspace(&sim,model) > 0 )
-		return 0;
+	w->model.size	= size;
+	w->model.cyclic	= cyclic;
+
+	if( setupModelWorkspace(&w->model) > 0 || setupSimWorkspace(&w->sim,&w->model) > 0 )
+	{
+		close( w );
+		return NULL;
+	}
 
+	return w;
+}
+
+int set_precision( void *handle, double precision )
+{
+	/* the absolute tolerance in the free ligand concentration (0 by default, for the relative tolerance alone) */
+	((struct cWorkspace *)handle)->model.precision = precision;
 	return 0;
 }
 
-int calc( int n, double temp, double* P, double* L, double* Q, double *params )
+int calc( void *handle, int n, double temp, double* P, double* L, double* Q, double *params )
 {
+	struct cWorkspace *w = (struct cWorkspace *)handle;
 	int status = 0;
 
 	/*
+		handle	: Workspace returned by setup()
 		n		: Number of points (size of P,L, and Q arrays)
 		temp	: Experimental temperature
 		P		: Array of (total) protein concentrations
@@ -31,28 +55,86 @@ int calc( int n, double temp, double* P, double* L, double* Q, double *params )
 		params	: Array of model-specific parameters
 	*/
 
-	model.temp = temp;
-	assignEnergies(&model, &sim, params);
+	w->model.temp = temp;
+	assignEnergies(&w->model, &w->sim, params);
+
+	/* the Boltzmann factors only depend on the temperature and energies, so are summed once for all points */
+	setBoltzmann( &w->model );
+	setStoichEnthalpies( &w->sim );
 
 	for(int i=0; i<n; i++)
 	{
-		model.Ptot = P[i];
-		model.Ltot = L[i];
+		w->model.Ptot = P[i];
+		w->model.Ltot = L[i];
 
-		status = setFree( &model );
+		status = setFree( &w->model );
 		if( status != 0 )
 			return status;
 
-		Q[i] = getQ( sim, model );
+		Q[i] = getQ( &w->sim );
 	}
 
     return status;
 }
 
-int close(void)
+int calc_batch( void *handle, int nexp, int *offsets, double *temps, double *P, double *L, int nsets, int nparams, double *params, double *Q )
 {
-	freeSimWorkspace(sim,model);
-	freeModelWorkspace(model);
+	int npoints = offsets[nexp];
+	int status = 0;
+
+	/*
+		handle	: Workspace returned by setup()
+		nexp	: Number of experiments
+		offsets	: Array of the index of the first point of each experiment in P, L and Q, followed by the total number of points (size nexp+1)
+		temps	: Array of experimental temperatures (size nexp)
+		P		: Packed array of (total) protein concentrations of all experiments
+		L		: Packed array of (total) ligand concentrations of all experiments
+		nsets	: Number of parameter sets
+		nparams	: Number of model-specific parameters
+		params	: Array of model-specific parameters for each parameter set and experiment (size nsets*nexp*nparams)
+		Q		: Array to hold (total) enthalpic heats for each parameter set at all points (size nsets*offsets[nexp])
+
+		If compiled with OpenMP, parameter sets are distributed across threads, each with its own workspace.
+	*/
+
+	#pragma omp parallel reduction(|:status)
+	{
+		void *w = handle;
+#ifdef _OPENMP
+		if( omp_get_thread_num() > 0 )
+			w = setup( ((struct cWorkspace *)handle)->model.size, ((struct cWorkspace *)handle)->model.cyclic );
+#endif
+		if( w == NULL )
+			status |= 1;
+		else
+			set_precision( w, ((struct cWorkspace *)handle)->model.precision );
+
+		#pragma omp for schedule(dynamic)
+		for(int s=0; s<nsets; s++)
+		{
+			for(int e=0; e<nexp && status == 0; e++)
+			{
+				int i = offsets[e];
+				status |= calc( w, offsets[e+1]-i, temps[e], &P[i], &L[i], &Q[(s*npoints)+i], &params[((s*nexp)+e)*nparams] );
+			}
+		}
+
+		if( w != handle )
+			close( w );
+	}
+
+	return status;
+}
+
+int close( void *handle )
+{
+	struct cWorkspace *w = (struct cWorkspace *)handle;
+	if( w == NULL )
+		return 0;
+
+	freeSimWorkspace( &w->sim );
+	freeModelWorkspace( &w->model );
+	free( w );
 
 	return 0;
 }
\ No newline at end of file
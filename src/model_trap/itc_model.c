@@ -1,162 +1,200 @@
 #include "itc_model.h"
+#include <stdio.h>
+#include <stdlib.h>
 #include <math.h>
-#include <gsl/gsl_errno.h>
-#include <gsl/gsl_math.h>
-#include <gsl/gsl_roots.h>
 
 #define GAS_CONSTANT	8.3144621
 #define FREE_TOLERANCE	1E-12
 #define FREE_ITERATION	1000
+#define FREE_MAXITER	11 /* error code if the free ligand does not converge (as GSL_EMAXITER) */
 
 int setupModelWorkspace( struct mWorkspace *w )
 {
-	w->energies = (double *)malloc(pow(2, w->size) * sizeof(double) );
+	w->nconfigs = 1 << w->size;
+
+	w->energies = (double *)malloc( w->nconfigs * sizeof(double) );
 	if( w->energies == NULL )
 		return 1;
-	w->probs = (double *)malloc(pow(2, w->size) * sizeof(double) );
-	if( w->probs == NULL )
-		return 1;
-	w->bound = (int *)malloc(pow(2, w->size) * sizeof(int) );
+	w->bound = (int *)malloc( w->nconfigs * sizeof(int) );
 	if( w->bound == NULL )
 		return 1;
 
-	w->configs = (int **)malloc(pow(2, w->size) * sizeof(int*) );
-	if( w->configs == NULL )
+	/* the Boltzmann factor sums, coefficients of the binding polynomial, and populations of each stoichiometry */
+	w->logZ = (double *)malloc( (w->size +1) * sizeof(double) );
+	if( w->logZ == NULL )
+		return 1;
+	w->coeffs = (double *)malloc( (w->size +1) * sizeof(double) );
+	if( w->coeffs == NULL )
+		return 1;
+	w->probs = (double *)malloc( (w->size +1) * sizeof(double) );
+	if( w->probs == NULL )
 		return 1;
 
-	for(int i=0; i<pow(2, w->size); i++){
-		w->configs[i] = (int *)malloc( w->size * sizeof(int) );
-		if( w->configs[i] == NULL )
-			return 1;
-	}
-
-	int counter;
-	for(int i=0; i<pow(2, w->size); i++)
+	/* the binary representation of the number describes the config, so the number of occupied sites is its bit count */
+	for(int i=0; i<w->nconfigs; i++)
 	{
 		w->energies[i]=0;
 		w->bound[i]=0;
-
-		/* use the binary representation of the number to describe the config */
-		counter=i;
-		for (int j = w->size -1; j >= 0; --j){
-			w->configs[i][j] = (counter & 1);
-			counter >>= 1;
-		}
-
-		/* determine the number of occupied sites in each configuration */
 		for(int j=0; j<w->size; j++)
-			if( w->configs[i][j] > 0 )
-				w->bound[i]++;
+			w->bound[i] += SITE(w,i,j);
 	}
 
-	/* initialize the root finder */
-	gsl_set_error_handler_off();
-	w->fsolver_s = gsl_root_fsolver_alloc( gsl_root_fsolver_brent );
-	w->fsolver_F.function = &getFree;
+	return 0;
+}
+
+int freeModelWorkspace( struct mWorkspace *w )
+{
+	free( w->energies );
+	free( w->bound );
+	free( w->logZ );
+	free( w->coeffs );
+	free( w->probs );
 
 	return 0;
 }
 
-int freeModelWorkspace( struct mWorkspace w )
+void setBoltzmann( struct mWorkspace *w )
 {
-	for(int i=0; i<w.size; i++){
-		free( w.configs[i] );
+	/* sum the Boltzmann factors of the configurations of each stoichiometry once per temperature and set of energies, as logarithms to avoid overflow */
+	double	RT = GAS_CONSTANT * w->temp;
+	double	max[w->size +1];
+
+	for(int k=0; k<=w->size; k++){
+		max[k] = -INFINITY;
+		w->logZ[k] = 0;
 	}
-	free( w.configs );
-	free( w.energies );
-	free( w.probs );
-	free( w.bound );
+	for(int i=0; i<w->nconfigs; i++)
+		if( -w->energies[i]/RT > max[w->bound[i]] )
+			max[w->bound[i]] = -w->energies[i]/RT;
 
-	gsl_root_fsolver_free( w.fsolver_s );
+	for(int i=0; i<w->nconfigs; i++)
+		w->logZ[w->bound[i]] += exp( (-w->energies[i]/RT) - max[w->bound[i]] );
 
-	return 0;
+	for(int k=0; k<=w->size; k++)
+		w->logZ[k] = log(w->logZ[k]) + max[k];
+
+	return;
 }
 
 void setProbabilities( struct mWorkspace *w )
 {
+	/* population of each stoichiometry at the current free ligand concentration */
+	double	x = w->Lfree / w->Ltot;
 	double	sum = 0;
-	for(int i=0; i<pow(2,w->size); i++)
+	double	xk = 1;
+
+	for(int k=0; k<=w->size; k++)
 	{
-		w->probs[i] = exp( (-1 * w->energies[i]) / ( GAS_CONSTANT * w->temp ) ) * pow(w->Lfree,w->bound[i]);
-		sum += w->probs[i];
+		w->probs[k] = w->coeffs[k] * xk;
+		sum += w->probs[k];
+		xk *= x;
 	}
 
-	for(int i=0; i<pow(2,w->size); i++)
-		w->probs[i] /= sum;
+	for(int k=0; k<=w->size; k++)
+		w->probs[k] /= sum;
 
 	return;
 }
 
-double getOccupation( struct mWorkspace w, int bound )
+double getOccupation( struct mWorkspace *w, int bound )
 {
-	double	ret=0;
-	for(int i=0; i<pow(2,w.size); i++)
-		if(w.bound[i]==bound)
-			ret += w.probs[i];
-
-	return ret;
+	return w->probs[bound];
 }
 
-double getFree( double Lfree, void *params )
+double getFree( double x, void *params, double *slope )
 {
 	struct mWorkspace *w = (struct mWorkspace *)params;
 
-	w->Lfree = Lfree;
-	setProbabilities( w ); /* get the bound fraction of each protein state */
+	/* evaluate the binding polynomial D and its first moment N = x*dD/dx by Horner's rule */
+	double D=0, N=0;
+	for(int k=w->size; k>=0; k--)
+	{
+		D = (D * x) + w->coeffs[k];
+		N = (N * x) + (k * w->coeffs[k]);
+	}
 
-	double bound = 0; /* concentration of sites in bound state */
-	for(int i=0; i<pow(2,w->size); i++)
-		bound += w->probs[i] * w->Ptot * w->bound[i];
+	/* the residual of the ligand mass balance (scaled by the total ligand), and its derivative from the variance of the bound stoichiometry */
+	double r = w->Ptot / w->Ltot;
+	if( slope != NULL )
+	{
+		double V=0;
+		for(int k=w->size; k>=0; k--)
+			V = (V * x) + ((k - (N / D)) * (k - (N / D)) * w->coeffs[k]);
+		*slope = -1 - ( r * V / (D * x) );
+	}
 
-	return w->Ltot - (bound + w->Lfree);
+	return 1 - x - (r * N / D);
 }
 
 int setFree( struct mWorkspace *w )
 {
-	int status;
-	int iter = 0;
-
-	w->fsolver_F.params = w;
-	status = gsl_root_fsolver_set( w->fsolver_s, &w->fsolver_F, 0, w->Ltot );
-
-	if(status != GSL_SUCCESS)
-		return status;
-
-	double r,a,b;
-	do
+	/* solve for the free ligand fraction x = Lfree/Ltot on the binding polynomial, with coefficients scaled so that the largest is 1 */
+	if( w->Ltot <= 0 )
 	{
-		iter++;
-		status = gsl_root_fsolver_iterate( w->fsolver_s );
-
-		if( status != GSL_SUCCESS )
-			return status;
-
-		r = gsl_root_fsolver_root( w->fsolver_s );
-		a = gsl_root_fsolver_x_lower( w->fsolver_s );
-		b = gsl_root_fsolver_x_upper( w->fsolver_s );
+		w->Lfree = 0;
+		for(int k=0; k<=w->size; k++)
+			w->probs[k] = (k == 0);
+		return 0;
+	}
 
-		status = gsl_root_test_interval( a, b, FREE_TOLERANCE, 0.0 );
-	}while( status == GSL_CONTINUE && iter < FREE_ITERATION );
+	double	logL = log( w->Ltot ), max = -INFINITY;
+	for(int k=0; k<=w->size; k++)
+		if( w->logZ[k] + (k * logL) > max )
+			max = w->logZ[k] + (k * logL);
+	for(int k=0; k<=w->size; k++)
+		w->coeffs[k] = exp( w->logZ[k] + (k * logL) - max );
+
+	/* Newton's method, safeguarded by bisection of the bracketing interval */
+	double	lo = 0, hi = 1, x = 0.5, f, slope, step;
+	double	tolerance = w->precision / w->Ltot;
+	for(int iter=0; iter<FREE_ITERATION; iter++)
+	{
+		f = getFree( x, w, &slope );
+		if( f == 0 )
+			break;
+		if( f > 0 )
+			lo = x;
+		else
+			hi = x;
+
+		/* a converged Newton step may fall on the end of the bracket, so is tested before the bracket */
+		step = x - (f / slope);
+		if( fabs(step - x) <= (FREE_TOLERANCE * step) + tolerance )
+		{
+			x = step;
+			break;
+		}
+		if( !(step > lo && step < hi) )
+			step = 0.5 * (lo + hi);
 
-//	printf("CODE: %i\n",status);
-//	printf("ITER: %i\n",iter);
+		if( (hi - lo) <= (FREE_TOLERANCE * step) + tolerance )
+		{
+			x = step;
+			break;
+		}
+		x = step;
+		if( iter == FREE_ITERATION -1 )
+			return FREE_MAXITER;
+	}
 
-	return status;
+	w->Lfree = x * w->Ltot;
+	setProbabilities( w );
+	return 0;
 }
 
-double getNbar( struct mWorkspace w )
+double getNbar( struct mWorkspace *w )
 {
-	double bound=0; /* concentration of sites in bound state */
-	for(int i=0; i<pow(2,w.size); i++)
-		bound += w.probs[i] * w.Ptot * w.bound[i];
+	double bound=0; /* fraction of sites in bound state */
+	for(int k=0; k<=w->size; k++)
+		bound += w->probs[k] * k;
 
-	return bound/(w.Ptot*w.size);
+	return bound/w->size;
 }
 
-void printConfig( struct mWorkspace w, int index )
+void printConfig( struct mWorkspace *w, int index )
 {
-	for(int i=0; i<w.size; i++)
-		printf("%i",w.configs[index][i]);
+	for(int i=0; i<w->size; i++)
+		printf("%i",SITE(w,index,i));
 	printf("\n");
 	return;
 }
\ No newline at end of file
@@ -1,39 +1,43 @@
 #ifndef ITC_MODEL_H
 #define ITC_MODEL_H
 
-#include <gsl/gsl_roots.h>
+/* occupancy (0 or 1) of site j in configuration i, using the binary representation of i */
+#define SITE(w,i,j)	( ((i) >> ((w)->size -1 -(j))) & 1 )
 
 struct mWorkspace
 {
 	int		size;
+	int		nconfigs;
 	double	temp;
 	double	Ptot;
 	double	Ltot;
 	double	Pfree;
 	double	Lfree;
+	double	precision; /* absolute tolerance in the free ligand concentration, in addition to the relative FREE_TOLERANCE */
 	int		cyclic;
-	int**	configs;
 	int*	bound;
 	double* energies;
+	double*	logZ;
+	double*	coeffs;
 	double*	probs;
-	gsl_root_fsolver*		fsolver_s;
-	gsl_function			fsolver_F;
 };
 
 int setupModelWorkspace( struct mWorkspace *w );
 
-int freeModelWorkspace( struct mWorkspace w );
+int freeModelWorkspace( struct mWorkspace *w );
+
+void setBoltzmann( struct mWorkspace *w );
 
 void setProbabilities( struct mWorkspace *w );
 
-double getOccupation( struct mWorkspace w, int bound );
+double getOccupation( struct mWorkspace *w, int bound );
 
-double getFree( double Lfree, void *params );
+double getFree( double x, void *params, double *slope );
 
 int setFree( struct mWorkspace *w );
 
-double getNbar( struct mWorkspace w );
+double getNbar( struct mWorkspace *w );
 
-void printConfig( struct mWorkspace w, int index );
+void printConfig( struct mWorkspace *w, int index );
 
 #endif
\ No newline at end of file
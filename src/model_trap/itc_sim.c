@@ -1,30 +1,52 @@
 #include "itc_sim.h"
+#include <stdlib.h>
 #include <math.h>
 
-int setupSimWorkspace( struct sWorkspace *sim, struct mWorkspace model )
+#define GAS_CONSTANT	8.3144621
+
+int setupSimWorkspace( struct sWorkspace *sim, struct mWorkspace *model )
 {
-	sim->model = &model;
-	sim->enthalpies = (double *)malloc(pow(2, model.size) * sizeof(double) );
+	sim->model = model;
+	sim->enthalpies = (double *)malloc( model->nconfigs * sizeof(double) );
 	if( sim->enthalpies == NULL )
 		return 1;
+	sim->stoichEnthalpies = (double *)malloc( (model->size +1) * sizeof(double) );
+	if( sim->stoichEnthalpies == NULL )
+		return 1;
 
-	for(int i=0; i<pow(2, model.size); i++)
+	for(int i=0; i<model->nconfigs; i++)
 		sim->enthalpies[i]=0;
 
 	return 0;
 }
 
-int freeSimWorkspace( struct sWorkspace sim, struct mWorkspace model )
+int freeSimWorkspace( struct sWorkspace *sim )
 {
-	free( sim.enthalpies );
+	free( sim->enthalpies );
+	free( sim->stoichEnthalpies );
 	return 0;
 }
 
-double getQ( struct sWorkspace sim, struct mWorkspace model )
+void setStoichEnthalpies( struct sWorkspace *sim )
+{
+	/* the Boltzmann-weighted average enthalpy of the configurations of each stoichiometry, see setBoltzmann() */
+	struct mWorkspace *w = sim->model;
+	double	RT = GAS_CONSTANT * w->temp;
+
+	for(int k=0; k<=w->size; k++)
+		sim->stoichEnthalpies[k] = 0;
+
+	for(int i=0; i<w->nconfigs; i++)
+		sim->stoichEnthalpies[w->bound[i]] += sim->enthalpies[i] * exp( (-w->energies[i]/RT) - w->logZ[w->bound[i]] );
+
+	return;
+}
+
+double getQ( struct sWorkspace *sim )
 {
 	double Q=0;
-	for(int i=0; i<pow(2,model.size); i++)
-		Q += sim.enthalpies[i] * model.probs[i];
+	for(int k=0; k<=sim->model->size; k++)
+		Q += sim->stoichEnthalpies[k] * sim->model->probs[k];
 
 	return Q;
 }
\ No newline at end of file
@@ -7,12 +7,15 @@ struct sWorkspace
 {
 	struct	mWorkspace *model;
 	double*	enthalpies;
+	double*	stoichEnthalpies;
 };
 
-int setupSimWorkspace( struct sWorkspace *sim, struct mWorkspace model );
+int setupSimWorkspace( struct sWorkspace *sim, struct mWorkspace *model );
 
-int freeSimWorkspace( struct sWorkspace sim, struct mWorkspace model );
+int freeSimWorkspace( struct sWorkspace *sim );
 
-double getQ( struct sWorkspace sim, struct mWorkspace model );
+void setStoichEnthalpies( struct sWorkspace *sim );
 
-#endif
+double getQ( struct sWorkspace *sim );
+
+#endif
\ No newline at end of file
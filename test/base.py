@@ -7,6 +7,7 @@ import sys
 import shutil
 import tempfile
 import uuid
+import numpy
 
 try:
 	from itcsimlib import *
@@ -74,6 +75,30 @@ class TestITCExperiment(TestITCBase):
 		Q = [0.0]*E.injections
 		self.assertEqual( round(E.get_chisq(Q),1), 691.5 )
 
+	def test_experiment_residuals(self):
+		from itcsimlib.itc_experiment import ITCExperiment
+		E = read_itcsimlib_exp(get_test_data('base_1.txt'))
+		Q = [0.0]*E.npoints
+		self.assertEqual( round(numpy.sum(E.get_residuals(Q)**2) / E.npoints,1), 691.5 )
+
+class TestITCModel(TestITCBase):
+	def test_param_vector(self):
+		from itcsimlib.model_independent import OneMode
+
+		model = OneMode(units="kcal")
+		model.set_params(n=1.805,dG=-10.94,dH=-11.75,dCp=0.0)
+		self.assertEqual( list(model.get_param_names()), ['n','dG','dH','dCp'] )
+		self.assertTrue( numpy.allclose(model.get_vector(), [1.805,-10.94,-11.75,0.0]) )
+		self.assertAlmostEqual( model.get_vector(units="J")[1], model.params['dG'] )
+
+		model.set_vector([2.0,-12.0], indices=model.params.indices(['n','dH']))
+		self.assertEqual( model.get_param('n'), 2.0 )
+		self.assertAlmostEqual( model.get_param('dH'), -12.0 )
+		self.assertAlmostEqual( model.get_param('dG'), -10.94 )
+
+		model.set_vector(numpy.array([1.0,-41840.0,0.0,0.0]), units="J")
+		self.assertAlmostEqual( model.get_params()['dG'], -10.0, places=3 )
+
 class TestITCSIM(TestITCBase):
 	def setUp(self):
 		TestITCBase.setUp(self)
@@ -132,8 +157,66 @@ class TestSIMThreading(TestITCSIM):
 
 		self.assertTrue( multi.run() > 1 )
 
+		batch = multi.run_batch([{'n':1.805},{'n':2}])
+		self.assertEqual( round(batch[1],5), round(multi.run(),5) )
+		self.assertTrue( numpy.allclose(multi.run_batch(numpy.array([[1.805,-11,-12,0.0],[2,-11,-12,0.0]])), batch) )
+
 		multi.done()
 
+	def test_local_params(self):
+		from itcsimlib.model_independent import OneMode
+
+		for title in ('A','B'):
+			self.sim.add_experiment_synthetic(
+				T=298.15,
+				V0=1416.6,
+				injections=[5.0]*50,
+				Cell={"Macromolecule":1E-6},
+				Syringe={"Ligand":30E-6},
+				title=title)
+		A,B = self.sim.experiments
+
+		model = OneMode()
+		self.sim.set_model( model )
+		self.sim.set_model_params(n=1.805,dG=-10.94,dH=-11.75,dCp=0.0)
+		self.assertEqual( self.sim.add_local_param('n','B',value=1.5), 'n@B' )
+		self.sim.add_local_param('Q_dil',B)
+
+		dependencies = self.sim.get_dependencies()
+		self.assertEqual( dependencies['n'], ['A'] )
+		self.assertEqual( dependencies['n@B'], ['B'] )
+		self.assertEqual( dependencies['Q_dil@B'], ['B'] )
+		self.assertEqual( dependencies['dG'], ['A','B'] )
+
+		# count the model evaluations
+		calls = []
+		def Q_batch(*args):
+			calls.append(args)
+			return OneMode.Q_batch(model,*args)
+		model.Q_batch = Q_batch
+
+		self.sim.run()
+		self.assertEqual( len(calls), 2 )
+		dQ_B = B.dQ_fit[:]
+
+		# only the experiment with the changed local parameter is re-evaluated
+		self.sim.set_model_param('n@B',1.6)
+		self.sim.run()
+		self.assertEqual( len(calls), 3 )
+		self.sim.set_model_param('Q_dil@B',-0.1)
+		self.sim.run()
+		self.assertEqual( len(calls), 3 )
+		self.assertNotAlmostEqual( B.dQ_fit[0], dQ_B[0] )
+		self.sim.set_model_params(dG=-11.0)
+		self.sim.run()
+		self.assertEqual( len(calls), 5 )
+
+		# the local parameter is used in place of the global one
+		self.sim.set_model_params(n=1.6,dG=-10.94,**{'Q_dil@B':0.0})
+		self.sim.run()
+		self.assertTrue( numpy.allclose(A.dQ_fit, B.dQ_fit) )
+		self.assertTrue( numpy.allclose(self.sim.run_batch([{'n':1.5},{'n':1.6}]), [1.0,1.0]) )
+
 class TestITCFit(TestITCSIM):
 	def setUp(self):
 		TestITCSIM.setUp(self)
@@ -160,10 +243,90 @@ class TestITCFit(TestITCSIM):
 		fit = ITCFit( self.sim, method='bfgs', method_args={"maxiter":1} )
 		self.assertEqual( round(fit.optimize(params=['n','dG','dH'])[1],3), 2.695 )
 
+	def test_fit_optimize_transform(self):
+		fit = ITCFit( self.sim, method='simplex', method_args={"maxiter":1}, transform=True )
+		fit.add_bounds('dG',-12.0,-10.0)
+		self.assertEqual( round(fit.optimize(params=['n','dG','dH'])[1],3), 2.695 )
+
+	def test_fit_optimize_transform_boundary(self):
+		fit = ITCFit( self.sim, method='simplex', method_args={"maxiter":5}, transform=True )
+		fit.add_bounds('dG',-10.9522,-10.0) # the starting value lies on the low bound
+		params,chisq = fit.optimize(params=['n','dG','dH'])
+		self.assertTrue( numpy.isfinite(chisq) )
+		self.assertTrue( -10.9522 <= params['dG'] <= -10.0 )
+
+	def test_fit_transform_roundtrip(self):
+		from itcsimlib.itc_fit import ParameterTransform
+		transform = ParameterTransform( [1.8,-10.9,-12.4,2.0], [(0,None),(-12,-10),(None,None),(None,None)], ['n','dG','dH','k'] )
+		self.assertEqual( transform.kinds, ['low','logit','linear','log'] )
+		self.assertTrue( numpy.allclose(transform.to_internal([1.8,-10.9,-12.4,2.0]), 1.0) )
+		u = numpy.array([-3.0,0.5,2.0,-1.0])
+		self.assertTrue( numpy.allclose(transform.to_internal(transform.to_external(u)), u) )
+		self.assertTrue( -12 < transform.to_external([1.0,50.0,1.0,1.0])[1] <= -10 )
+
+		# starting values on a boundary map to finite values
+		transform = ParameterTransform( [0.0,-10.0,-12.4,2.0], [(0,None),(-12,-10),(None,None),(None,None)], ['n','dG','dH','k'] )
+		self.assertTrue( numpy.all(numpy.isfinite(transform.to_internal([0.0,-10.0,-12.4,2.0]))) )
+		self.assertTrue( numpy.all(numpy.isfinite(transform.to_internal([0.0,-12.0,-12.4,2.0]))) )
+
+	def test_fit_optimize_differential_evolution(self):
+		fit = ITCFit( self.sim, method='differential_evolution', method_args={"popsize":5,"maxiter":2,"polish":False,"seed":1} )
+		fit.add_bounds('n',1.7,1.9)
+		fit.add_bounds('dG',-11.5,-10.5)
+		fit.add_bounds('dH',-13.0,-12.0)
+		self.assertEqual( round(fit.optimize(params=['n','dG','dH'])[1],3), 2.695 )
+		self.assertEqual( len(fit.telemetry), 2 )
+
+	def test_fit_optimize_differential_evolution_failure(self):
+		fit = ITCFit( self.sim, method='differential_evolution', method_args={"popsize":5,"maxiter":2,"polish":False,"seed":1} )
+		fit.add_bounds('n',1.7,1.9)
+		fit.add_bounds('dG',-11.5,-10.5)
+		fit.add_bounds('dH',-13.0,-12.0)
+		self.sim.run_batch = lambda *args,**kwargs: None # a simulator that fails
+		self.assertRaisesRegex( Exception, 'Simulator failure', fit.optimize, params=['n','dG','dH'] )
+
+	def test_fit_multistart(self):
+		fit = ITCFit( self.sim, method='simplex', method_args={"maxiter":20} )
+		minima = fit.multistart(params=['n','dG','dH'], n_starts=4, bounds={'n':(1.7,1.9),'dG':(-11.5,-10.5),'dH':(-13.0,-12.0)}, seed=1)
+		self.assertEqual( sum([m[2] for m in minima]), 4 )
+		self.assertEqual( sorted([m[1] for m in minima]), [m[1] for m in minima] )
+
+	def test_fit_multistart_failure(self):
+		import threading
+		fit = ITCFit( self.sim, method='simplex', method_args={"maxiter":20} )
+		threads = threading.active_count()
+		self.sim.run_batch = lambda *args,**kwargs: None # a simulator that fails
+		self.assertRaises( Exception, fit.multistart, params=['n','dG','dH'], n_starts=4, bounds={'n':(1.7,1.9),'dG':(-11.5,-10.5),'dH':(-13.0,-12.0)}, seed=1 )
+		self.assertEqual( threading.active_count(), threads ) # no optimizer is left waiting
+
 	def test_fit_estimate_bootstrap_(self):
 		fit = ITCFit( self.sim, method='simplex', method_args={"maxiter":1} )
 		self.assertIsNotNone( fit.estimate(params=['n','dG','dH'], method='bootstrap', bootstraps=5) )
 
+	def test_fit_estimate_mcmc(self):
+		fit = ITCFit( self.sim )
+		estimates = fit.estimate(params=['n','dG','dH'], method='mcmc', walkers=8, steps=10, chainfile=self.getFilePath(True), seed=1)
+		self.assertEqual( list(estimates.keys()), ['n','dG','dH'] )
+		self.assertEqual( numpy.load(self.getFilePath()).shape, (10,8,4) )
+		self.assertTrue( 0.0 < fit.diagnostics['acceptance'] <= 1.0 )
+
+	def test_fit_estimate_mcmc_likelihood(self):
+		self.sim.experiments[1].skip = list(range(10)) # experiments with different numbers of fitted points
+		fit = ITCFit( self.sim )
+		fit.estimate(params=['n','dG','dH'], method='mcmc', walkers=8, steps=2, burn=0, chainfile=self.getFilePath(True), seed=1)
+		chain = numpy.load(self.getFilePath())[0]
+		for walker in chain:
+			params = dict(zip(['n','dG','dH'],walker[:3]))
+			chisq = sum([ self.sim.run_batch([params],experiments=[E])[0] * (E.npoints - len(E.skip)) for E in self.sim.experiments ])
+			self.assertAlmostEqual( walker[3], -0.5*chisq )
+
+	def test_fit_estimate_covariance(self):
+		fit = ITCFit( self.sim )
+		estimates = fit.estimate(params=['n','dG','dH'], method='covariance')
+		self.assertEqual( round(estimates['n'][0],5), 1.80546 )
+		self.assertEqual( fit.correlation.shape, (3,3) )
+		self.assertAlmostEqual( fit.correlation[1][1], 1.0 )
+
 	def test_fit_estimate_sigma_bisect(self):
 		fit = ITCFit( self.sim, method='simplex', method_args={"maxiter":1} )
 		self.assertIsNotNone( fit.estimate(params=['n','dG','dH'], method='sigma', rootfinder='bisect', stdevs=2) )
@@ -193,6 +356,78 @@ class TestITCGrid(TestITCSIM):
 		grid.define_axis(param='dG',points=(-11.5,-10.94,-10.5))
 		grid.define_axis(param='dH',points=(-12.25,-11.75,-11.50))
 		self.assertIsNotNone( grid.optimize(params="n") )
+
+	def test_parallel_grid(self):
+		grid = ITCGrid( self.fit, processes=2 )
+		grid.add_axis(param='dG',start=-12,stop=-10,steps=3)
+		grid.add_axis(param='dH',start=-13,stop=-11,steps=2)
+		results = grid.optimize(params=['n'])
+		self.assertTrue( results['done'].all() )
+
+		grid = ITCGrid( self.fit )
+		grid.add_axis(param='dG',start=-12,stop=-10,steps=3)
+		grid.add_axis(param='dH',start=-13,stop=-11,steps=2)
+		self.assertTrue( numpy.allclose(grid.optimize(params=['n'])['chisq'], results['chisq']) )
+
+	def test_resume_grid(self):
+		grid = ITCGrid( self.fit, end=4, checkpoint=self.getFilePath(True) )
+		grid.add_axis(param='dG',start=-12,stop=-10,steps=3)
+		grid.add_axis(param='dH',start=-13,stop=-11,steps=2)
+		self.assertEqual( grid.optimize(params=['n'])['done'].sum(), 4 )
+
+		points = []
+		grid = ITCGrid( self.fit, checkpoint=self.getFilePath(), callback=lambda point,params,chisq: points.append(point) )
+		grid.add_axis(param='dG',start=-12,stop=-10,steps=3)
+		grid.add_axis(param='dH',start=-13,stop=-11,steps=2)
+		self.assertTrue( grid.optimize(params=['n'])['done'].all() )
+		self.assertEqual( len(points), 2 )
+
+	def test_resultfile_grid(self):
+		grid = ITCGrid( self.fit, end=4, resultfile=self.getFilePath(True)+".npy" )
+		grid.add_axis(param='dG',start=-12,stop=-10,steps=3)
+		grid.add_axis(param='dH',start=-13,stop=-11,steps=2)
+		results = grid.optimize(params=['n'])
+		self.assertEqual( results.shape, (3,2,5) )
+		self.assertEqual( numpy.isnan(results[...,-1]).sum(), 2 )
+
+		grid = ITCGrid( self.fit, resultfile=self.getFilePath()+".npy" )
+		grid.add_axis(param='dG',start=-12,stop=-10,steps=3)
+		grid.add_axis(param='dH',start=-13,stop=-11,steps=2)
+		grid.optimize(params=['n'])
+		results = numpy.load( self.getFilePath()+".npy" )
+		self.assertFalse( numpy.isnan(results).any() )
+		self.assertTrue( numpy.allclose(results[2,1,1:3], [-10,-11]) )
+
+	def test_evaluate_grid(self):
+		grid = ITCGrid( self.fit )
+		grid.add_axis(param='dG',start=-12,stop=-10,steps=3)
+		grid.add_axis(param='dH',start=-13,stop=-11,steps=2)
+		results = grid.evaluate(slab=4)
+		self.assertTrue( results['done'].all() )
+		self.sim.set_model_params(dG=-11,dH=-11)
+		self.assertAlmostEqual( results['chisq'][4], self.sim.run(writeback=False) )
+
+	def test_serpentine_grid(self):
+		grid = ITCGrid( self.fit, traversal='serpentine' )
+		grid.add_axis(param='dG',start=-12,stop=-10,steps=3)
+		grid.add_axis(param='dH',start=-13,stop=-11,steps=3)
+		self.assertEqual( grid._get_order(), [0,1,2,5,4,3,6,7,8] )
+		results = grid.optimize(params=['n'])
+		self.assertTrue( results['done'].all() )
+		self.assertEqual( results['seed'][0], -1 )
+		for i in range(1,9): # each point is seeded from an adjacent one
+			self.assertEqual( numpy.abs(numpy.array(grid._get_coords(i))-grid._get_coords(results['seed'][i])).sum(), 1 )
+
+	def test_refine_grid(self):
+		grid = ITCGrid( self.fit )
+		grid.add_axis(param='dG',start=-12,stop=-10,steps=3)
+		grid.add_axis(param='dH',start=-13,stop=-11,steps=3)
+		results = grid.refine(params=['n'], threshold=1.0, budget=20, depth=2)
+		self.assertEqual( len(results), 20 )
+		self.assertTrue( results['done'].all() )
+		self.assertTrue( numpy.allclose(results['point'][:9], [grid._get_point(i) for i in range(9)]) )
+		self.assertTrue( results['chisq'][9:].min() <= results['chisq'][:9].min() )
+		self.assertTrue( (results['evaluations'] > 0).all() )
 	
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
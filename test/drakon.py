@@ -3,6 +3,7 @@
 import unittest
 import os
 import sys
+import numpy
 
 try:
 	from itcsimlib import *
@@ -43,6 +44,25 @@ class DRAKONModel(DRAKONIsingModel):
                 if self.occupied(i,j+1) == True:
                     self.add_dG(i, "dG_oe", dH="dH_oe", dCp="dCp_oe" )
                     self.add_dH(i, "dH_oe", dCp="dCp_oe" )
+
+class DRAKONExpressionModel(DRAKONModel):
+    def site(self, i, j):
+        if self.occupied(i,j) == True:
+            self.add_dG(i, "dG_0 + 0.5*dG_oe" )
+            self.add_dH(i, "dH_0 + 0.5*dH_oe" )
+
+class DRAKONThresholdModel(DRAKONIsingModel): # the flow branches on a parameter value, as in examples/drakon/groel.py
+    def setup(self):
+        self.initialize(nsites=6,circular=True)
+        self.add_parameter("dG_bind",type="dG")
+        self.add_parameter("dG_couple",type="dG")
+        self.add_parameter("dH_bind",type="dH")
+        self.add_parameter("saturation",type="n")
+    def configuration(self, i):
+        self.add_dG(i, "dG_bind*%i"%(self.count_occupied(i)) )
+        self.add_dH(i, "dH_bind*%i"%(self.count_occupied(i)) )
+        if self.count_occupied(i) >= self.saturation:
+            self.add_dG(i, "dG_couple" )
 	
 class TestDRAKONModel(TestModel):
 	def test_drakon_model(self):
@@ -58,6 +78,67 @@ class TestDRAKONModel(TestModel):
 			dH_0 = -12, dH_oe = -2, dH_oo = -2.5,
 			dCp_0= 0.0, dCp_oe=0.0, dCp_oo=0.0)
 		self.assertTrue( self.sim.run() > 1.0 )
+
+	def test_drakon_expressions(self):
+		import pickle
+		model = DRAKONExpressionModel()
+		model.set_param("dG_0",-10)
+		model.set_param("dG_oe",-1)
+		model.set_param("dH_0",-12)
+		model.set_param("dH_oe",-2)
+
+		for i in (1,2): # parameter changes are picked up by the compiled expressions
+			model.set_energies(298.15,298.15)
+			self.assertEqual( len(model._expressions), 2 )
+			for j in range(model.nconfigs):
+				self.assertAlmostEqual( model.gibbs[j], model.bound[j]*(model.get_param("dG_0",units="J") +0.5*model.get_param("dG_oe",units="J")) )
+				self.assertAlmostEqual( model.enthalpies[j], model.bound[j]*(model.get_param("dH_0",units="J") +0.5*model.get_param("dH_oe",units="J")) )
+				self.assertEqual( model.config_expressions[j], model.bound[j]*(model.parameter_symbols["dG_0"] +0.5*model.parameter_symbols["dG_oe"]) )
+			model.set_param("dG_oe",-2)
+
+		copy = pickle.loads(pickle.dumps(model))
+		copy.set_energies(298.15,298.15)
+		self.assertEqual( list(copy.gibbs), list(model.gibbs) )
+
+	def test_drakon_parameter_flow(self):
+		model = DRAKONThresholdModel()
+		self.assertFalse( model.trace ) # the flow is run on every call unless tracing is requested
+		model.set_param("dG_bind",-10)
+		model.set_param("dG_couple",-2)
+		model.set_param("dH_bind",-12)
+		model.set_param("saturation",6)
+		model.set_energies(298.15,298.15)
+		before = list(model.gibbs)
+
+		model.set_param("saturation",3) # changes which configurations are coupled
+		model.set_energies(298.15,298.15)
+		for j in range(model.nconfigs):
+			coupled = model.get_param("dG_couple",units="J") if model.bound[j] >= 3 else 0.0
+			self.assertAlmostEqual( model.gibbs[j], (model.bound[j]*model.get_param("dG_bind",units="J")) +coupled )
+		self.assertNotEqual( model.gibbs, before )
+
+	def test_drakon_trace(self):
+		self.reset_simulation()
+		results = []
+		for trace in (False,True):
+			model = DRAKONModel()
+			model.trace = trace
+			self.sim.set_model( model )
+			self.sim.set_model_params(
+				dG_0 = -10, dG_oe = -1, dG_oo = -1.5,
+				dH_0 = -12, dH_oe = -2, dH_oo = -2.5,
+				dCp_0= -1, dCp_oe=-0.5, dCp_oo=-0.75)
+			heats = [model.Q(self.sim.T0,E.T,E.Concentrations) for E in self.sim.experiments]
+			model.set_param("dG_oo",-2.0) # parameter changes are picked up when the trace is replayed
+			model.set_energies(self.sim.T0,308.15)
+			results.append( (heats,list(model.gibbs),list(model.enthalpies),list(model.config_expressions)) )
+		self.assertTrue( model._trace is not None )
+
+		(heats,gibbs,enthalpies,expressions),(traced_heats,traced_gibbs,traced_enthalpies,traced_expressions) = results
+		self.assertTrue( numpy.allclose(heats, traced_heats, rtol=1E-12, atol=0) )
+		self.assertTrue( numpy.allclose(gibbs, traced_gibbs, rtol=1E-12, atol=0) )
+		self.assertTrue( numpy.allclose(enthalpies, traced_enthalpies, rtol=1E-12, atol=0) )
+		self.assertEqual( expressions, traced_expressions )
 		
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
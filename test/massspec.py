@@ -72,6 +72,19 @@ class TestExpMSModel(TestMSModelBase):
 		self.sim.set_model_params(dGX=-27000,dGY=-25000,dGZ=-30000)
 		self.assertEqual(round(self.sim.run(),1), 135.5)
 
+	def test_populations(self):
+		concentrations = [{'Lattice':1E-6,'Ligand':1E-6*i} for i in range(20)]
+		populations = self.model.Q(298.15,298.15,concentrations)
+
+		# the weights of each configuration, one point at a time
+		self.model.model.precision = 1E-24
+		for i,c in enumerate(concentrations):
+			self.model.model.set_probabilities(c['Lattice'],c['Ligand'],298.15)
+			expected = np.zeros(self.model.model.nsites+1)
+			for j in range(self.model.model.nconfigs):
+				expected[self.model.model.bound[j]] += self.model.model.weights[j]
+			self.assertTrue( np.allclose(populations[i], expected, rtol=0, atol=1E-12) )
+
 class MSExperimentSynthetic(TestMSModelBase):
 	def test_synthetic_experiment(self):
 		from itcsimlib.mass_spec import MSExperimentSynthetic
@@ -3,6 +3,8 @@
 import unittest
 import os
 import sys
+import glob
+import numpy
 
 try:
 	from itcsimlib import *
@@ -43,7 +45,46 @@ class TestIndependentModels(TestModel):
 		self.sim.run() # first run populates the experimental data of a synthetic experiment
 		self.sim.set_model_params(n = 1.805, dG=-10.94, dH=-11.75)
 		self.assertTrue( self.sim.run() > 1.0 )
-	
+
+	def test_onemode_vectorized(self):
+		import math
+		self.reset_simulation(cell="Macromolecule")
+		model = OneMode()
+		self.sim.set_model( model )
+		self.sim.set_model_params(n = 1.805, dG=-10.94, dH=-11.75, dCp=-0.3)
+
+		# the single-site quadratic, one injection at a time
+		Ka = 1.0/Kd_from_dG( dG_vant_Hoff( model.params['dG'], model.params['dH'], model.params['dCp'], 308.15, 298.15 ), 308.15)
+		dH,n = dH_vant_Hoff( model.params['dH'], model.params['dCp'], 308.15, 298.15 ),model.params['n']
+		E = self.sim.experiments[1]
+		Q = [ ((n*dH)/2.0)*(1.0 +(c['Ligand']/(n*c['Macromolecule'])) +(1.0/(n*Ka*c['Macromolecule'])) -math.sqrt( math.pow(1 +(c['Ligand']/(n*c['Macromolecule'])) +(1.0/(n*Ka*c['Macromolecule'])), 2.0) -((4.0*c['Ligand'])/(n*c['Macromolecule'])))) for c in E.Concentrations ]
+		self.assertTrue( numpy.allclose(model.Q(298.15,E.T,E.Concentrations), Q, rtol=1E-12, atol=0) )
+
+		stacked = model.Q_stack(298.15,[F.T for F in self.sim.experiments],[F.Concentrations for F in self.sim.experiments])
+		self.assertTrue( numpy.allclose(stacked[1], Q, rtol=1E-12, atol=0) )
+		self.assertTrue( numpy.allclose(stacked[0], model.Q(298.15,298.15,self.sim.experiments[0].Concentrations), rtol=1E-12, atol=0) )
+
+		param_sets = numpy.array([[1.805,-10.94,-11.75,-0.3],[1.5,-10.0,-12.0,0.0]])
+		batch = model.Q_batch(298.15,E.T,E.Concentrations,param_sets)
+		self.assertTrue( numpy.allclose(batch[1], model.Q(298.15,E.T,E.Concentrations), rtol=1E-12, atol=0) )
+		self.assertTrue( numpy.allclose(batch[0], Q, rtol=1E-12, atol=0) )
+
+	def test_onemode_overridden_Q(self):
+		class Counter(OneMode):
+			calls = 0
+			def Q(self,T0,T,concentrations):
+				Counter.calls += 1
+				return OneMode.Q(self,T0,T,concentrations)
+
+		self.reset_simulation(cell="Macromolecule")
+		model = Counter()
+		self.sim.set_model( model )
+		self.sim.set_model_params(n = 1.805, dG=-10.94, dH=-11.75)
+		self.sim.run()
+		self.assertEqual( Counter.calls, len(self.sim.experiments) )
+		model.Q_stack(298.15,[E.T for E in self.sim.experiments],[E.Concentrations for E in self.sim.experiments])
+		self.assertEqual( Counter.calls, 2*len(self.sim.experiments) )
+
 	def test_twomode_model(self):
 		self.reset_simulation(cell="Macromolecule")
 		model = NModes(modes=2)
@@ -60,6 +101,49 @@ class TestIndependentModels(TestModel):
 			dH1=-11.75, dH2=-11.75)
 		self.assertTrue( self.sim.run() > 1.0 )
 	
+	def test_nmodes_solvers(self):
+		import scipy.optimize
+		self.reset_simulation(cell="Macromolecule")
+		E = self.sim.experiments[1]
+
+		for modes in (2,4): # polynomial roots and Newton solvers
+			model = NModes(modes=modes)
+			self.sim.set_model( model )
+			for i in range(modes):
+				self.sim.set_model_param( "n%i"%(i+1), 0.5+(0.3*i) )
+				self.sim.set_model_param( "dG%i"%(i+1), (-6,-16,-10,-13)[i] )
+				self.sim.set_model_param( "dH%i"%(i+1), -5-(3*i) )
+
+			# brentq, one injection at a time
+			n = numpy.array([model.params["n%i"%(i+1)] for i in range(modes)])
+			Ka = 1.0/Kd_from_dG( dG_vant_Hoff( numpy.array([model.params["dG%i"%(i+1)] for i in range(modes)]), numpy.array([model.params["dH%i"%(i+1)] for i in range(modes)]), 0.0, E.T, 298.15 ), E.T )
+			dH = numpy.array([model.params["dH%i"%(i+1)] for i in range(modes)])
+			Q = []
+			for c in E.Concentrations:
+				Lfree = scipy.optimize.brentq( lambda L: c['Ligand'] -numpy.sum(n*c['Macromolecule']*Ka*L/(Ka*L +1)) -L, 0.0, c['Ligand'], xtol=1E-30, rtol=1E-15 )
+				Q.append( numpy.sum(n*dH*Ka*Lfree/(Ka*Lfree +1)) )
+
+			self.assertTrue( numpy.allclose(model.Q(298.15,E.T,E.Concentrations), Q, rtol=1E-10, atol=0) )
+
+			param_sets = numpy.array([model.get_vector(), model.get_vector()*1.01])
+			batch = model.Q_batch(298.15,E.T,E.Concentrations,param_sets)
+			self.assertTrue( numpy.allclose(batch[0], Q, rtol=1E-10, atol=0) )
+			self.assertTrue( numpy.allclose(batch[1], model.Q(298.15,E.T,E.Concentrations), rtol=1E-12, atol=0) )
+			self.assertEqual( model.precision, 1E-12 )
+
+	def test_nmodes_overridden_Q(self):
+		class Counter(NModes):
+			calls = 0
+			def Q(self,T0,T,concentrations):
+				Counter.calls += 1
+				return NModes.Q(self,T0,T,concentrations)
+
+		self.reset_simulation(cell="Macromolecule")
+		self.sim.set_model( Counter(modes=2) )
+		self.sim.set_model_params(n1=0.805, n2=1.000, dG1=-10.94, dG2=-9.94, dH1=-11.75, dH2=-10.75)
+		self.sim.run()
+		self.assertEqual( Counter.calls, len(self.sim.experiments) )
+
 class TestIsingModels(TestModel):
 	def test_halfadditive_model(self):
 		self.reset_simulation()
@@ -102,6 +186,111 @@ class TestIsingModels(TestModel):
 			dHX = -8, dHY =-10, dHZ = -12,
 			dCpX= -0, dCpY=-1, dCpZ = -2)
 		self.assertTrue( self.sim.run() > 1.0 )
+
+	def test_ising_batch(self):
+		self.reset_simulation()
+		self.sim.set_model( NonAdditive(nsites=5,circular=1) )
+		self.sim.set_model_params(
+			dGX = -9,  dGY =-10, dGZ = -11,
+			dHX = -10, dHY =-12, dHZ = -14,
+			dCpX= -1, dCpY =-2, dCpZ = -3)
+		self.sim.run()
+		param_sets = [dict(dGX=-9,dHX=dHX,dHY=dHY) for dHX in (-10,-9) for dHY in (-12,-11)] + [dict(dGX=-8,dHX=-10,dHY=-12)]
+		chisq = []
+		for params in param_sets:
+			self.sim.set_model_params(**params)
+			chisq.append( self.sim.run(writeback=False) )
+		self.assertTrue( numpy.allclose(self.sim.run_batch(param_sets), chisq) )
+
+	def test_ising_overridden_Q(self):
+		class Counter(NonAdditive):
+			calls = 0
+			def Q(self,T0,T,concentrations):
+				Counter.calls += 1
+				return NonAdditive.Q(self,T0,T,concentrations)
+
+		self.reset_simulation()
+		self.sim.set_model( Counter(nsites=5,circular=1) )
+		self.sim.set_model_params(dGX=-9,dGY=-10,dGZ=-11,dHX=-10,dHY=-12,dHZ=-14)
+		self.sim.run()
+		self.assertEqual( Counter.calls, len(self.sim.experiments) )
+
+		# as when Q() is replaced on the class itself (see examples/populations.py)
+		original = Ising.Q
+		try:
+			Ising.Q = lambda self,T0,T,concentrations: [0.0]*len(concentrations)
+			model = NonAdditive(nsites=5,circular=1)
+			self.assertEqual( model.Q_batch(self.sim.T0,298.15,self.sim.experiments[0].Concentrations,[model.get_vector()]), [[0.0]*len(self.sim.experiments[0].Concentrations)] )
+		finally:
+			Ising.Q = original
+
+	def test_ising_native(self):
+		built = len(glob.glob( os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"itcsimlib","model_ising_table*.so") )) == 1
+		self.assertEqual( NonAdditive(nsites=6).native, built ) # the compiled kernel is used if it has been built
+		if not built:
+			return
+		self.reset_simulation()
+		E = self.sim.experiments[1]
+		models = (
+			(FullAdditive,	dict(dG0=-10,dGa=1,dGb=-1,dH0=-12,dHa=2,dHb=-2,dCp0=-1,dCpa=0.5,dCpb=-0.5)),
+			(HalfAdditive,	dict(dG0=-10,dGb=-1,dH0=-12,dHb=-2,dCp0=-1,dCpb=-0.5)),
+			(NonAdditive,	dict(dGX=-9,dGY=-10,dGZ=-11,dHX=-10,dHY=-12,dHZ=-14,dCpX=-1,dCpY=-2,dCpZ=-3)))
+
+		for cls,params in models:
+			for circular in (1,0):
+				results = []
+				for native in (False,True):
+					model = cls(nsites=6,circular=circular,native=native)
+					model.precision = 1E-22 # converge both to the limit of the relative precision
+					self.sim.set_model( model )
+					self.sim.set_model_params(**params)
+					param_sets = numpy.array([model.get_vector(),model.get_vector()*1.05])
+					results.append( [model.Q(self.sim.T0,E.T,E.Concentrations),list(model.gibbs),list(model.enthalpies),list(model.weights)] )
+					results[-1] += [model.Q_batch(self.sim.T0,E.T,E.Concentrations,param_sets),list(model.gibbs),list(model.enthalpies),list(model.weights)]
+					model.stop()
+				for python,compiled in zip(*results): # the heats, and the energies and weights they leave
+					self.assertTrue( numpy.allclose(python, compiled, rtol=1E-10, atol=1E-10*numpy.max(numpy.abs(python))) ) # energies may cancel to zero
+
+		# the kernel converges to the precision of the model
+		model = NonAdditive(nsites=6)
+		self.sim.set_model( model )
+		self.sim.set_model_params(**models[2][1])
+		heats = []
+		for precision in (1E-22,1E-12,1E-6):
+			model.precision = precision
+			heats.append( model.Q(self.sim.T0,E.T,E.Concentrations) )
+		model.stop()
+		self.assertTrue( numpy.allclose(heats[0], heats[1], rtol=1E-4, atol=0) )
+		self.assertFalse( numpy.allclose(heats[0], heats[2], rtol=1E-10, atol=0) )
+
+		# models that override how the energies are assigned are evaluated in Python
+		class Modified(HalfAdditive):
+			def set_energies(self,T0,T):
+				HalfAdditive.set_energies(self,T0,T)
+		self.assertFalse( Modified(nsites=6).native )
+		self.assertRaises( Exception, Modified, nsites=6, native=True )
+
+	def test_ising_expressions(self):
+		class Legacy(HalfAdditive): # builds its symbolic expressions in set_energies()
+			def set_energies(self,T0,T):
+				for i in range(self.nconfigs):
+					self.gibbs[i],self.enthalpies[i] = 0.0,0.0
+					self.config_expressions[i] = 0
+					for j in range(self.nsites):
+						if self.get_site_occupancy(i,j):
+							self.config_expressions[i] += self.parameter_symbols['dG0']
+							if self.get_site_occupancy(i,j+1):
+								self.config_expressions[i] += self.parameter_symbols['dGb']
+
+		self.reset_simulation()
+		E = self.sim.experiments[0]
+		for circular in (1,0):
+			model = HalfAdditive(nsites=5,circular=circular,native=False)
+			self.sim.set_model( model )
+			self.sim.set_model_params(dG0=-10,dGb=-1,dH0=-12,dHb=-2)
+			model.Q(self.sim.T0,E.T,E.Concentrations)
+			self.assertTrue( model._config_expressions is None ) # not built during evaluation
+			self.assertEqual( model.config_expressions, Legacy(nsites=5,circular=circular).config_expressions )
 		
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
@@ -3,6 +3,7 @@
 import unittest
 import os
 import sys
+import numpy
 
 try:
 	from itcsimlib import *
@@ -22,8 +23,6 @@ def compiled_model_exists(modellib):
 
 class TestTRAPModels(TestModel):
 	def test_SK_model(self):
-		if not compiled_model_exists("model_trap_sk.so"):
-			return
 		self.reset_simulation(cell="TRAP",syringe="Trp")
 		self.sim.set_model( SK() )
 		self.sim.set_model_params(
@@ -38,8 +37,6 @@ class TestTRAPModels(TestModel):
 		self.assertTrue( self.sim.run() > 1.0 )
 	
 	def test_SKa_model(self):
-		if not compiled_model_exists("model_trap_ik.so"):
-			return
 		self.reset_simulation(cell="TRAP",syringe="Trp")
 		self.sim.set_model( SKa() )
 		self.sim.set_model_params(
@@ -54,8 +51,6 @@ class TestTRAPModels(TestModel):
 		self.assertTrue( self.sim.run() > 1.0 )
 	
 	def test_IK_model(self):
-		if not compiled_model_exists("model_trap_ik.so"):
-			return
 		self.reset_simulation(cell="TRAP",syringe="Trp")
 		self.sim.set_model( IK() )
 		self.sim.set_model_params(
@@ -70,8 +65,6 @@ class TestTRAPModels(TestModel):
 		self.assertTrue( self.sim.run() > 1.0 )
 		
 	def test_IKi_model(self):
-		if not compiled_model_exists("model_trap_sk.so"):
-			return
 		self.reset_simulation(cell="TRAP",syringe="Trp")
 		self.sim.set_model( IKi() )
 		self.sim.set_model_params(
@@ -85,5 +78,168 @@ class TestTRAPModels(TestModel):
 			dCp0= 0.0, dCpoe=0.0,dCpoo=0.0)
 		self.assertTrue( self.sim.run() > 1.0 )
 
+	def test_SK_enumeration(self):
+		import scipy.optimize
+		self.reset_simulation(cell="TRAP",syringe="Trp")
+		E = self.sim.experiments[1]
+
+		for native in (False,True):
+			if native and not compiled_model_exists("model_trap_sk.so"):
+				continue
+			model = SK(native=native)
+			self.sim.set_model( model )
+			self.sim.set_model_params(
+				dG0 = -10, dGa = 1, dGb = -1,
+				dH0 = -12, dHa = 2, dHb = -2,
+				dCp0= -1, dCpa =0.5,dCpb=-0.5)
+
+			# the energies and enthalpies of every configuration of the 11-site ring
+			p = model.get_energies(self.sim.T0,E.T)
+			configs = (numpy.arange(2**11)[:,None] >> numpy.arange(11)) & 1
+			left,right = numpy.roll(configs,1,axis=1),numpy.roll(configs,-1,axis=1)
+			G = numpy.sum(configs*(p[0] +numpy.where(left,p[2],p[1]) +numpy.where(right,p[2],p[1])),axis=1)
+			H = numpy.sum(configs*(p[3] +numpy.where(left,p[5],p[4]) +numpy.where(right,p[5],p[4])),axis=1)
+			bound = numpy.sum(configs,axis=1)
+
+			def weights(logL):
+				w = (-G/(8.3144621*E.T)) +(bound*logL)
+				return numpy.exp(w -numpy.max(w))
+
+			Q = []
+			for c in E.Concentrations:
+				logL = scipy.optimize.brentq( lambda logL: c['Trp'] -numpy.exp(logL) -c['TRAP']*numpy.sum(bound*weights(logL))/numpy.sum(weights(logL)), -500.0, numpy.log(c['Trp']), xtol=1E-15, rtol=1E-15 )
+				Q.append( numpy.sum(H*weights(logL))/numpy.sum(weights(logL)) )
+
+			self.assertTrue( numpy.allclose(model.Q(self.sim.T0,E.T,E.Concentrations), Q, rtol=1E-9, atol=0) )
+
+	def test_numpy_parity(self):
+		self.reset_simulation(cell="TRAP",syringe="Trp")
+		models = (
+			(SK,	dict(dG0=-10,dGa=1,dGb=-1,dH0=-12,dHa=2,dHb=-2,dCp0=-1,dCpa=0.5,dCpb=-0.5)),
+			(IK,	dict(dGX=-9,dGY=-10,dGZ=-11,dHX=-10,dHY=-12,dHZ=-14,dCpX=-1,dCpY=-2,dCpZ=-3)),
+			(IKi,	dict(dG0=-10,dGoe=1,dGoo=-1,dH0=-12,dHoe=2,dHoo=-2,dCp0=-1,dCpoe=0.5,dCpoo=-0.5)),
+			(SKa,	dict(dG0=-10,dGb=-1,dH0=-12,dHb=-2,dCp0=-1,dCpb=-0.5)))
+
+		for cls,params in models:
+			if not compiled_model_exists(os.path.basename(cls.libpath).replace('*','')):
+				continue
+			heats = []
+			for native in (True,False):
+				model = cls(native=native)
+				self.assertEqual( model.native, native )
+				self.sim.set_model( model )
+				self.sim.set_model_params(**params)
+				model.start()
+				param_sets = numpy.array([model.get_vector(),model.get_vector()*1.05])
+				heats.append( [model.Q(self.sim.T0,E.T,E.Concentrations) for E in self.sim.experiments] + [model.Q_batch(self.sim.T0,E.T,E.Concentrations,param_sets) for E in self.sim.experiments] )
+				model.stop()
+			for a,b in zip(*heats):
+				self.assertTrue( numpy.allclose(a, b, rtol=1E-9, atol=0) )
+
+	def test_concurrent_threads(self):
+		if not compiled_model_exists("model_trap_sk.so"):
+			return
+		from concurrent.futures import ThreadPoolExecutor
+		self.reset_simulation(cell="TRAP",syringe="Trp")
+		model = SK()
+		self.sim.set_model( model )
+		self.sim.set_model_params(
+			dG0 = -10, dGa = 1, dGb = -1,
+			dH0 = -12, dHa = 2, dHb = -2,
+			dCp0= -1, dCpa =0.5,dCpb=-0.5)
+
+		model.start()
+		serial = [ model.Q(self.sim.T0,E.T,E.Concentrations) for E in self.sim.experiments ]
+		with ThreadPoolExecutor(max_workers=4) as pool:
+			concurrent = list(pool.map( lambda E: model.Q(self.sim.T0,E.T,E.Concentrations), self.sim.experiments*4 ))
+		self.assertTrue( len(model._handles) > 1 ) # one library workspace per thread
+		model.stop()
+
+		for i,Q in enumerate(concurrent):
+			self.assertTrue( numpy.array_equal(Q, serial[i % len(serial)]) )
+
+	def test_batch(self):
+		self.reset_simulation(cell="TRAP",syringe="Trp")
+		model = SKa()
+		self.sim.set_model( model )
+		self.sim.set_model_params(
+			dG0 = -10, dGb = -1,
+			dH0 = -12, dHb = -2,
+			dCp0= -1, dCpb =-0.5)
+
+		model.start()
+		E = self.sim.experiments[1]
+		param_sets = numpy.array([model.get_vector(),model.get_vector()*1.05,model.get_vector()*0.95])
+		batch = model.Q_batch(self.sim.T0,E.T,E.Concentrations,param_sets)
+		for i,vector in enumerate(param_sets):
+			model.set_vector(vector)
+			self.assertTrue( numpy.allclose(batch[i], model.Q(self.sim.T0,E.T,E.Concentrations), rtol=1E-12) )
+
+		stacked = model.Q_stack(self.sim.T0,[F.T for F in self.sim.experiments],[F.Concentrations for F in self.sim.experiments])
+		for i,F in enumerate(self.sim.experiments):
+			self.assertTrue( numpy.allclose(stacked[i], model.Q(self.sim.T0,F.T,F.Concentrations), rtol=1E-12) )
+		model.stop()
+
+	def test_overridden_Q(self):
+		class Counter(SKa):
+			calls = 0
+			def Q(self,T0,T,concentrations):
+				Counter.calls += 1
+				return SKa.Q(self,T0,T,concentrations)
+
+		self.reset_simulation(cell="TRAP",syringe="Trp")
+		model = Counter()
+		self.sim.set_model( model )
+		self.sim.set_model_params(dG0=-10, dGb=-1, dH0=-12, dHb=-2)
+		self.sim.run()
+		self.assertEqual( Counter.calls, len(self.sim.experiments) )
+
+		vector = model.get_vector()
+		model.Q_stack(self.sim.T0,[E.T for E in self.sim.experiments],[E.Concentrations for E in self.sim.experiments],numpy.array([vector,vector*1.05]))
+		self.assertEqual( Counter.calls, 3*len(self.sim.experiments) )
+		self.assertTrue( numpy.array_equal(model.get_vector(), vector) )
+
+	def test_buffers(self):
+		self.reset_simulation(cell="TRAP",syringe="Trp")
+		model = SK()
+		self.sim.set_model( model )
+		self.sim.set_model_params(
+			dG0 = -10, dGa = 1, dGb = -1,
+			dH0 = -12, dHa = 2, dHb = -2,
+			dCp0= -1, dCpa =0.5,dCpb=-0.5)
+
+		model.start()
+		E,F = self.sim.experiments
+		first = model.Q(self.sim.T0,E.T,E.Concentrations)
+		model.Q(self.sim.T0,F.T,F.Concentrations)
+		self.assertTrue( numpy.array_equal(model.Q(self.sim.T0,E.T,E.Concentrations), first) )
+		self.assertEqual( sum(len(buffers) for buffers in model._buffers.values()), 2 ) # one buffer per experiment, reused
+
+		# returned heats are not overwritten by later calls
+		model.set_vector( model.get_vector()*1.05 )
+		model.Q(self.sim.T0,E.T,E.Concentrations)
+		model.set_vector( model.get_vector()/1.05 )
+		self.assertTrue( numpy.array_equal(model.Q(self.sim.T0,E.T,E.Concentrations), first) )
+
+		# copies of an experiment (as unpickled by simulator workers) share its buffers
+		import pickle
+		model.Q(self.sim.T0,E.T,pickle.loads(pickle.dumps(E.Concentrations)))
+		self.assertEqual( sum(len(buffers) for buffers in model._buffers.values()), 2 )
+
+		# changed concentrations are packed again
+		for c in E.Concentrations:
+			c['TRAP'] *= 2.0
+		E.Concentrations.update_key()
+		self.assertFalse( numpy.allclose(model.Q(self.sim.T0,E.T,E.Concentrations), first) )
+		self.assertEqual( sum(len(buffers) for buffers in model._buffers.values()), 3 )
+
+		# concentrations that don't belong to an experiment aren't kept
+		self.assertTrue( numpy.array_equal(model.Q(self.sim.T0,E.T,list(E.Concentrations)), model.Q(self.sim.T0,E.T,E.Concentrations)) )
+		self.assertEqual( sum(len(buffers) for buffers in model._buffers.values()), 3 )
+
+		model.clear_buffers()
+		self.assertEqual( len(model._buffers), 0 )
+		model.stop()
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
@@ -2,6 +2,7 @@ import unittest
 import os
 import sys
 import pickle
+import numpy
 
 try:
 	from itcsimlib import *
@@ -11,6 +12,7 @@ except ImportError:
 
 from base import TestITCBase,get_test_data
 from itcsimlib.utilities import *
+from itcsimlib.thermo import *
 
 class TestITCUtilities(TestITCBase):
 	def test_rw_params_to_file(self):
@@ -29,5 +31,21 @@ class TestITCConvertors(TestITCBase):
 		E = read_nitpic_exp(get_test_data("utilities_2.nitpkl"))
 		self.assertEqual( round(sum(E.dQ_exp),1), -831.3 )
 
+class TestThermo(unittest.TestCase):
+	def test_unit_conversion(self):
+		self.assertAlmostEqual( convert_to_J('kcal',1.0), 4184.0, places=2 )
+		self.assertAlmostEqual( convert_from_J('kcal',convert_to_J('kcal',-10.94)), -10.94 )
+		self.assertTrue( numpy.allclose(convert_from_J('cal',convert_to_J('cal',[1.0,-2.0,3.0])), [1.0,-2.0,3.0]) )
+
+	def test_broadcast(self):
+		T = numpy.array([288.15,298.15,308.15])[:,None]
+		dG,dH,dCp = numpy.array([-40000.0,-45000.0]),numpy.array([-50000.0,-20000.0]),numpy.array([-500.0,0.0])
+		dG_T = dG_vant_Hoff( dG, dH, dCp, T, 298.15 )
+		self.assertEqual( dG_T.shape, (3,2) )
+		self.assertAlmostEqual( dG_T[0][1], dG_vant_Hoff(-45000.0,-20000.0,0.0,288.15,298.15) )
+		self.assertTrue( numpy.allclose(dG_T[1], dG) )
+		self.assertTrue( numpy.allclose(dH_vant_Hoff(dH,dCp,T,298.15)[2], dH+dCp*10.0) )
+		self.assertTrue( numpy.allclose(Kd_from_dG(dG_from_Kd(numpy.array([1E-6,1E-9]),T),T), [1E-6,1E-9]) )
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file